@@ -51,13 +51,13 @@ export function GameProvider({ children }) {
 
     try {
       setIsNarratorSpeaking(true);
-      await storyApi.playNarration(text);
+      await storyApi.playNarration(text, universe?.session_id);
     } catch (error) {
       console.error("Error playing narration:", error);
     } finally {
       setIsNarratorSpeaking(false);
     }
-  }, []);
+  }, [universe?.session_id]);
 
   // Effect pour arrêter la narration quand le composant est démonté
   useEffect(() => {
@@ -160,7 +160,7 @@ export const LAYOUTS = {
         acceptText: false,
       }, // Tall portrait left
       {
-        ...PANEL_SIZES.POTRAIT,
+        ...PANEL_SIZES.SQUARE,
         gridColumn: "2 / span 2",
         gridRow: "2 / span 2",
         acceptText: true,
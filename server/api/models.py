@@ -42,15 +42,21 @@ class ChatMessage(BaseModel):
     message: str
     choice_id: Optional[int] = None
     custom_text: Optional[str] = None  # Pour le choix personnalisé
+    stream: bool = False  # Renvoie les tokens du segment au fil de l'eau (NDJSON)
 
 class ImageGenerationRequest(BaseModel):
     prompt: str
     width: int = Field(description="Width of the image to generate")
     height: int = Field(description="Height of the image to generate")
+    panel_index: Optional[int] = Field(default=None, description="Index of the panel in the current turn, the first panel is rendered first")
+    prefetch: bool = Field(default=False, description="Whether this is speculative work that should yield to the current turn")
+    progressive: bool = Field(default=False, description="Stream a quick low-quality preview before the full-quality image")
+    size: Optional[str] = Field(default=None, description="Responsive variant to return (thumb, mobile, full), encoded in the best format the Accept header allows")
 
 class TextToSpeechRequest(BaseModel):
     text: str
     voice_id: str = "nPczCjzI2devNBz1zQrb"  # Default voice ID (Rachel)
+    stream: bool = False  # Renvoie le MP3 en streaming au lieu de base64
 
 class UniverseResponse(BaseModel):
     status: str
@@ -78,6 +84,7 @@ class StoryResponse(BaseModel):
         min_items=GameConfig.MIN_PANELS,
         max_items=GameConfig.MAX_PANELS
     )
+    degradation_level: int = Field(description="Image quality degradation level applied because of load (0 = full quality)", default=0)
 
     @validator('choices')
     def validate_choices(cls, v):
@@ -1,13 +1,42 @@
 from fastapi import APIRouter, HTTPException, Header
-from typing import Optional
-import traceback
+from fastapi.responses import StreamingResponse
+from typing import AsyncIterator, Awaitable, Callable, Optional
+import asyncio
+import json
 
 from core.session_manager import SessionManager
 from core.constants import GameConfig
 from api.models import ChatMessage, StoryResponse, Choice
+from services.token_usage import get_token_usage, session_scope
+from services.log import get_logger
+
+log = get_logger("chat")
 
 router = APIRouter()
 
+async def _stream_turn(play_turn: Callable[..., Awaitable[StoryResponse]]) -> AsyncIterator[str]:
+    """Une ligne JSON par token du segment, puis le tour complet (ou l'erreur)."""
+    tokens: asyncio.Queue = asyncio.Queue()
+    turn = asyncio.ensure_future(play_turn(on_token=tokens.put))
+    try:
+        while not turn.done() or not tokens.empty():
+            next_token = asyncio.ensure_future(tokens.get())
+            await asyncio.wait({next_token, turn}, return_when=asyncio.FIRST_COMPLETED)
+            if not next_token.done():
+                next_token.cancel()
+                continue
+            yield json.dumps({"type": "token", "text": next_token.result()}) + "\n"
+
+        try:
+            yield json.dumps({"type": "story", "story": turn.result().dict()}) + "\n"
+        except Exception as e:
+            log.exception("Error in chat stream", error=str(e))
+            yield json.dumps({"type": "error", "error": str(e)}) + "\n"
+    finally:
+        # Client parti : le tour est abandonné
+        if not turn.done():
+            turn.cancel()
+
 def get_chat_router(session_manager: SessionManager, story_generator):
     @router.post("/chat", response_model=StoryResponse)
     async def chat_endpoint(
@@ -18,11 +47,10 @@ def get_chat_router(session_manager: SessionManager, story_generator):
             if not x_session_id:
                 raise HTTPException(status_code=400, detail="Session ID is required")
 
-            print(f"Processing chat message for session {x_session_id}:", chat_message)
+            log.debug("Processing chat message", session_id=x_session_id, text=chat_message.message, choice_id=chat_message.choice_id)
             
             # Get game state for this session
             game_state = session_manager.get_session(x_session_id)
-            print(f"Retrieved game state for session {x_session_id}: {'found' if game_state else 'not found'}")
             
             if game_state is None:
                 raise HTTPException(
@@ -32,18 +60,20 @@ def get_chat_router(session_manager: SessionManager, story_generator):
                 
             # Vérifier que l'univers est configuré
             has_universe = game_state.has_universe()
-            print(f"Universe configured for session {x_session_id}: {has_universe}")
-            print(f"Universe details: style={game_state.universe_style}, genre={game_state.universe_genre}, epoch={game_state.universe_epoch}")
             
             if not has_universe:
                 raise HTTPException(
                     status_code=400,
                     detail="Universe not configured for this session. Generate a universe first."
                 )
+
+            # Quota de tokens de la session dépassé (SESSION_QUOTA_MODE=reject)
+            if get_token_usage().should_reject(x_session_id):
+                raise HTTPException(status_code=429, detail="Token quota exceeded for this session")
             
             # Handle restart
             if chat_message.message.lower() == "restart":
-                print(f"Handling restart for session {x_session_id}")
+                log.info("Restarting story", session_id=x_session_id)
                 # On garde le même univers mais on réinitialise l'histoire
                 game_state.reset()
                 game_state.set_universe(
@@ -67,7 +97,7 @@ def get_chat_router(session_manager: SessionManager, story_generator):
                         raw_choices=["Continue...", "Continue..."],
                         time=game_state.current_time,
                         location=game_state.current_location,
-                        image_prompts=["Character making a custom choice"],  # Prompt fictif pour validation
+                        image_prompts=[GameConfig.CUSTOM_CHOICE_PROMPT],  # Prompt fictif pour validation
                         is_first_step=False,
                         is_death=False,
                         is_victory=False,
@@ -86,25 +116,39 @@ def get_chat_router(session_manager: SessionManager, story_generator):
                     else:
                         previous_choice = "none"
 
-            # Generate story segment
-            response = await story_generator.generate_story_segment(
-                session_id=x_session_id,
-                game_state=game_state,
-                previous_choice=previous_choice
-            )
+            async def play_turn(on_token=None) -> StoryResponse:
+                # Generate story segment, en comptant les tokens pour la session
+                with session_scope(x_session_id):
+                    response = await story_generator.generate_story_segment(
+                        session_id=x_session_id,
+                        game_state=game_state,
+                        previous_choice=previous_choice,
+                        on_token=on_token
+                    )
 
-            # Pour la première étape, on ne garde qu'un seul prompt d'image
-            if game_state.story_beat == 0 and len(response.image_prompts) > 1:
-                response.image_prompts = [response.image_prompts[0]]
-            
-            # Increment story beat
-            game_state.story_beat += 1
-                
-            return response
+                # Pour la première étape, on ne garde qu'un seul prompt d'image
+                if game_state.story_beat == 0 and len(response.image_prompts) > 1:
+                    response.image_prompts = [response.image_prompts[0]]
 
+                # Increment story beat
+                game_state.story_beat += 1
+                return response
+
+            if chat_message.stream:
+                return StreamingResponse(_stream_turn(play_turn), media_type="application/x-ndjson")
+            return await play_turn()
+
+        except HTTPException:
+            raise
         except Exception as e:
-            print(f"Error in chat_endpoint: {str(e)}")
-            print("Traceback:", traceback.format_exc())
+            log.exception("Error in chat_endpoint", session_id=x_session_id, error=str(e))
             raise HTTPException(status_code=500, detail=str(e))
+
+    @router.get("/usage")
+    async def get_session_usage(x_session_id: Optional[str] = Header(None)):
+        """Tokens et coût estimé consommés par la session, avec son quota."""
+        if not x_session_id:
+            raise HTTPException(status_code=400, detail="Session ID is required")
+        return get_token_usage().get_session_usage(x_session_id)
     
     return router 
\ No newline at end of file
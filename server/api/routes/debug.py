@@ -0,0 +1,85 @@
+import asyncio
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import JSONResponse, PlainTextResponse
+
+from core.session_manager import SessionManager
+from core.story_generator import StoryGenerator
+from services.elevenlabs_client import ElevenLabsClient
+from services.flux_client import FluxClient
+from services.inflight import get_inflight
+from services.loop_monitor import LoopMonitor
+from services.profiler import MODES, Profile, Profiler
+
+FORMATS = ("collapsed", "speedscope")
+
+
+def _render_profile(profile: Profile, format: str):
+    if format == "speedscope":
+        return JSONResponse(
+            profile.speedscope(),
+            headers={"Content-Disposition": f'attachment; filename="{profile.name.replace(" ", "_").replace("/", "_")}.speedscope.json"'}
+        )
+    return PlainTextResponse(profile.collapsed())
+
+
+def get_debug_router(loop_monitor: LoopMonitor, profiler: Profiler, session_manager: SessionManager = None, story_generator: StoryGenerator = None, flux_client: FluxClient = None, elevenlabs_client: ElevenLabsClient = None) -> APIRouter:
+    router = APIRouter()
+
+    def require_debug_token(x_debug_token: Optional[str] = Header(None)):
+        if not profiler.enabled:
+            raise HTTPException(status_code=404, detail="Debug endpoints are disabled (DEBUG_TOKEN is not set)")
+        if not profiler.is_authorized(x_debug_token):
+            raise HTTPException(status_code=401, detail="Invalid debug token")
+
+    @router.get("/debug/loop", dependencies=[Depends(require_debug_token)])
+    async def get_loop_stats(stacks: bool = True):
+        """Lag de la boucle d'événements et blocages récents, avec les piles échantillonnées."""
+        return loop_monitor.get_stats(stacks=stacks)
+
+    @router.get("/debug/inflight", dependencies=[Depends(require_debug_token)])
+    async def get_inflight_work():
+        """Appels LLM, rendus Flux et synthèses TTS en cours (session, générateur, tentative, état), files et sessions."""
+        inflight = get_inflight()
+        limiters = []
+        if flux_client:
+            limiters.append(flux_client.limiter.get_stats())
+        if elevenlabs_client:
+            limiters.extend(elevenlabs_client.get_stats()["voices"])
+        return {
+            **inflight.get_stats(),
+            "operations": inflight.snapshot(),
+            "limiters": limiters,
+            "sessions": len(session_manager.sessions) if session_manager else None,
+            "segment_generators": len(story_generator.segment_generators) if story_generator else None,
+            "tasks": len(asyncio.all_tasks()),
+        }
+
+    @router.post("/debug/profile", dependencies=[Depends(require_debug_token)])
+    async def profile_process(seconds: float = 10.0, mode: str = "wall", format: str = "collapsed", interval_ms: Optional[float] = None):
+        """Profile statistique de tout le processus pendant `seconds` (temps réel ou CPU)."""
+        if mode not in MODES or format not in FORMATS:
+            raise HTTPException(status_code=400, detail=f"mode must be one of {MODES}, format one of {FORMATS}")
+        if seconds <= 0 or (interval_ms is not None and interval_ms <= 0):
+            raise HTTPException(status_code=400, detail="seconds and interval_ms must be positive")
+        if profiler.busy:
+            raise HTTPException(status_code=409, detail="A profile is already running")
+        profile = await profiler.profile_process(seconds, mode, interval_ms / 1000 if interval_ms else None)
+        return _render_profile(profile, format)
+
+    @router.get("/debug/profiles", dependencies=[Depends(require_debug_token)])
+    async def list_profiles():
+        """Profils des requêtes envoyées avec l'en-tête X-Profile."""
+        return profiler.get_stats()
+
+    @router.get("/debug/profiles/{profile_id}", dependencies=[Depends(require_debug_token)])
+    async def get_profile(profile_id: str, format: str = "collapsed"):
+        if format not in FORMATS:
+            raise HTTPException(status_code=400, detail=f"format must be one of {FORMATS}")
+        profile = profiler.get_profile(profile_id)
+        if profile is None:
+            raise HTTPException(status_code=404, detail="Profile not found")
+        return _render_profile(profile, format)
+
+    return router
@@ -0,0 +1,42 @@
+from fastapi import APIRouter, Header, HTTPException
+from fastapi.responses import StreamingResponse
+from typing import Optional
+
+from core.session_manager import SessionManager
+from core.story_export import EXPORT_FORMATS, StoryExporter
+
+router = APIRouter()
+
+def get_export_router(session_manager: SessionManager, story_exporter: StoryExporter):
+    @router.get("/export/{fmt}")
+    async def export_story(
+        fmt: str,
+        session_id: Optional[str] = None,
+        x_session_id: Optional[str] = Header(None)
+    ):
+        """Télécharge la BD d'une partie terminée en CBZ ou PDF, envoyée au fil de l'eau.
+
+        L'ID de session peut aussi passer en paramètre pour un simple lien de téléchargement.
+        """
+        if fmt not in EXPORT_FORMATS:
+            raise HTTPException(status_code=400, detail=f"Unsupported export format: {fmt}")
+        session_id = x_session_id or session_id
+        if not session_id:
+            raise HTTPException(status_code=400, detail="Session ID is required")
+        game_state = session_manager.get_session(session_id)
+        if game_state is None:
+            raise HTTPException(status_code=404, detail="Session not found")
+
+        # Copie : un nouveau tour ne doit pas modifier l'export en cours
+        story_history = list(game_state.story_history)
+        if not story_history or not (story_history[-1].is_victory or story_history[-1].is_death):
+            raise HTTPException(status_code=409, detail="The story is not finished yet")
+
+        title = f"Echoes of Influence - {game_state.universe_genre or 'Story'}"
+        return StreamingResponse(
+            story_exporter.stream(story_history, fmt, title),
+            media_type=EXPORT_FORMATS[fmt],
+            headers={"Content-Disposition": f'attachment; filename="echoes-of-influence.{fmt}"'}
+        )
+
+    return router
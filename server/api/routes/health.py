@@ -5,8 +5,19 @@ from langchain.schema import SystemMessage
 from api.models import HealthCheckResponse
 from services.mistral_client import MistralClient
 from services.flux_client import FluxClient
+from services.elevenlabs_client import ElevenLabsClient
+from services.singleflight import get_singleflight_stats
+from services.http_transport import get_http_transport
+from core.quality_policy import QualityPolicy
+from core.image_pipeline import ImagePipeline
+from core.page_compositor import PageCompositor
+from core.narration import NarrationPrefetcher
+from services.tracing import TraceExporter
+from services.token_usage import get_token_usage
+from services.log import get_logging_stats
+from services.cassette import get_cassette_stats
 
-def get_health_router(mistral_client: MistralClient, flux_client: FluxClient) -> APIRouter:
+def get_health_router(mistral_client: MistralClient, flux_client: FluxClient, quality_policy: QualityPolicy = None, image_pipeline: ImagePipeline = None, page_compositor: PageCompositor = None, elevenlabs_client: ElevenLabsClient = None, narration: NarrationPrefetcher = None, trace_exporter: TraceExporter = None) -> APIRouter:
     router = APIRouter()
 
     @router.get("/health/mistral", response_model=HealthCheckResponse)
@@ -118,4 +129,22 @@ def get_health_router(mistral_client: MistralClient, flux_client: FluxClient) ->
                 ).dict()
             )
 
+    @router.get("/health/stats")
+    async def get_upstream_stats():
+        """Expose les compteurs des appels upstream et le niveau de qualité actif."""
+        return {
+            "singleflight": get_singleflight_stats(),
+            "flux": flux_client.get_stats(),
+            "http": get_http_transport().get_stats(),
+            "quality": quality_policy.get_stats() if quality_policy else None,
+            "images": image_pipeline.get_stats() if image_pipeline else None,
+            "pages": page_compositor.get_stats() if page_compositor else None,
+            "speech": elevenlabs_client.get_stats() if elevenlabs_client else None,
+            "narration": narration.get_stats() if narration else None,
+            "tracing": trace_exporter.get_stats() if trace_exporter else None,
+            "tokens": get_token_usage().get_stats(),
+            "logging": get_logging_stats(),
+            "cassette": get_cassette_stats(),
+        }
+
     return router 
\ No newline at end of file
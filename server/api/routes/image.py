@@ -1,38 +1,161 @@
-from fastapi import APIRouter, Header
+from fastapi import APIRouter, Header, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
 from typing import Optional
 import base64
+import json
+import math
 
-from services.flux_client import FluxClient
+from core.image_pipeline import ImagePipeline
+from services.priority_limiter import Priority
 from api.models import ImageGenerationRequest
+from api.utils import cancel_on_disconnect
+from services.log import get_logger
 
 router = APIRouter()
+log = get_logger("image")
+
+def _get_priority(panel_index: Optional[int], prefetch: bool) -> Priority:
+    """Le premier panneau du tour passe avant les suivants, qui passent avant le prefetch."""
+    if prefetch:
+        return Priority.PREFETCH
+    if panel_index == 0:
+        return Priority.FIRST_PANEL
+    return Priority.PANEL
+
+def _encode_image(image_bytes) -> str:
+    if isinstance(image_bytes, str):
+        image_bytes = image_bytes.encode('utf-8')
+    return base64.b64encode(image_bytes).decode('utf-8').strip('"')
+
+def get_image_router(image_pipeline: ImagePipeline):
+    flux_client = image_pipeline.flux_client
+
+    def _failure(error: Optional[str], http_response: Optional[Response] = None) -> dict:
+        result = {"success": False, "error": error or "Failed to generate image"}
+        # Circuit ouvert : indiquer au client quand réessayer
+        retry_after = flux_client.retry_after
+        if retry_after > 0:
+            if http_response is not None:
+                http_response.headers["Retry-After"] = str(math.ceil(retry_after))
+            result["retry_after"] = round(retry_after, 1)
+        return result
+
+    def _render_status(panel_id: str) -> dict:
+        status = image_pipeline.get_render_status(panel_id)
+        if status is None:
+            raise HTTPException(status_code=404, detail="No render pending for this panel")
+        return status
+
+    @router.get("/generate-image/queue")
+    async def get_image_queue(
+        prefetch: bool = False,
+        panel_index: Optional[int] = None,
+        prompt: Optional[str] = None,
+        width: Optional[int] = None,
+        height: Optional[int] = None
+    ):
+        """Avec prompt, width et height : position et attente du rendu de ce panneau, déjà demandé.
+
+        Sans : position et attente estimées qu'obtiendrait une nouvelle requête d'image.
+        """
+        if prompt is not None and width is not None and height is not None:
+            return _render_status(image_pipeline.get_panel_id(prompt, width, height))
+        return flux_client.get_queue_status(_get_priority(panel_index, prefetch))
+
+    @router.get("/generate-image/queue/{panel_id}")
+    async def get_panel_queue_position(panel_id: str):
+        """Position et attente du rendu d'un panneau (panel_id des événements de rendu progressif)."""
+        if not all(c in "0123456789abcdef" for c in panel_id):
+            raise HTTPException(status_code=400, detail="Invalid panel ID")
+        return _render_status(panel_id)
+
+    async def _get_variant(panel_id: str, size: Optional[str], accept: Optional[str]):
+        """Variante WebP/AVIF si demandée et supportée, JPEG d'origine sinon."""
+        transcoder = image_pipeline.transcoder
+        if size and transcoder and transcoder.enabled:
+            return await transcoder.get_variant(panel_id, size, accept)
+        image_bytes = await image_pipeline.image_cache.get(panel_id)
+        return (image_bytes, "image/jpeg") if image_bytes is not None else None
+
+    @router.get("/images/{panel_id}")
+    async def get_panel_image(panel_id: str, size: Optional[str] = None, accept: Optional[str] = Header(None)):
+        """Renvoie le rendu final d'un panneau déjà généré."""
+        if not all(c in "0123456789abcdef" for c in panel_id):
+            raise HTTPException(status_code=400, detail="Invalid panel ID")
+        variant = await _get_variant(panel_id, size or "full", accept)
+        if variant is None:
+            raise HTTPException(status_code=404, detail="Panel not rendered yet")
+        image_bytes, media_type = variant
+        return Response(
+            content=image_bytes,
+            media_type=media_type,
+            headers={"Vary": "Accept", "Cache-Control": "public, max-age=31536000, immutable"}
+        )
 
-def get_image_router(flux_client: FluxClient):
     @router.post("/generate-image")
     async def generate_image(
         request: ImageGenerationRequest,
-        x_session_id: Optional[str] = Header(None)
+        http_request: Request,
+        http_response: Response,
+        x_session_id: Optional[str] = Header(None),
+        accept: Optional[str] = Header(None)
     ):
         try:
-            print(f"Generating image with dimensions: {request.width}x{request.height}")
-            print(f"Using prompt: {request.prompt}")
+            log.debug("Generating image", width=request.width, height=request.height, prompt=request.prompt)
+            priority = _get_priority(request.panel_index, request.prefetch)
+
+            if request.progressive:
+                # Une ligne JSON par phase : "preview" puis "final"
+                async def stream_phases():
+                    async for phase in image_pipeline.render_progressive(
+                        prompt=request.prompt,
+                        width=request.width,
+                        height=request.height,
+                        priority=priority
+                    ):
+                        if phase["image"]:
+                            event = {"success": True, "image_base64": _encode_image(phase["image"])}
+                        else:
+                            event = _failure(phase["error"])
+                        event.update(
+                            panel_id=phase["panel_id"],
+                            phase=phase["phase"],
+                            degradation_level=image_pipeline.get_quality_level()
+                        )
+                        yield json.dumps(event) + "\n"
+
+                return StreamingResponse(stream_phases(), media_type="application/x-ndjson")
 
-            image_bytes = await flux_client.generate_image(
-                prompt=request.prompt,
-                width=request.width,
-                height=request.height
+            image_bytes, error, panel_id = await cancel_on_disconnect(
+                http_request,
+                image_pipeline.render(
+                    prompt=request.prompt,
+                    width=request.width,
+                    height=request.height,
+                    priority=priority
+                )
             )
             
             if image_bytes:
-                if isinstance(image_bytes, str):
-                    image_bytes = image_bytes.encode('utf-8')
-                base64_image = base64.b64encode(image_bytes).decode('utf-8').strip('"')
-                return {"success": True, "image_base64": base64_image}
+                media_type = "image/jpeg"
+                if request.size:
+                    variant = await _get_variant(panel_id, request.size, accept)
+                    if variant is not None:
+                        image_bytes, media_type = variant
+                return {
+                    "success": True,
+                    "image_base64": _encode_image(image_bytes),
+                    "media_type": media_type,
+                    "panel_id": panel_id,
+                    "degradation_level": image_pipeline.get_quality_level()
+                }
             else:
-                return {"success": False, "error": "Failed to generate image"}
+                return _failure(error, http_response)
 
+        except HTTPException:
+            raise
         except Exception as e:
             print(f"Error generating image: {str(e)}")
             return {"success": False, "error": str(e)}
     
-    return router 
\ No newline at end of file
+    return router
@@ -0,0 +1,16 @@
+from fastapi import APIRouter, Response
+
+from services.metrics import render_metrics
+
+router = APIRouter()
+
+# Format texte d'exposition Prometheus
+METRICS_MEDIA_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+def get_metrics_router():
+    @router.get("/metrics")
+    async def get_metrics():
+        """Histogrammes par étape du pipeline, retries, erreurs de parsing, sessions et files d'attente."""
+        return Response(content=render_metrics(), media_type=METRICS_MEDIA_TYPE)
+
+    return router
@@ -0,0 +1,68 @@
+from fastapi import APIRouter, Header, HTTPException, Request, Response
+from typing import Optional
+
+from core.page_compositor import PageCompositor
+from core.session_manager import SessionManager
+from services.image_transcoder import MEDIA_TYPES
+from api.utils import cancel_on_disconnect
+
+router = APIRouter()
+
+# Une page publiée ne change jamais : son ID dépend des panneaux, du layout et de la légende
+PAGE_HEADERS = {"Vary": "Accept", "Cache-Control": "public, max-age=31536000, immutable"}
+
+def get_page_router(session_manager: SessionManager, page_compositor: PageCompositor):
+    @router.get("/pages/turn/{turn_index}")
+    async def get_turn_page(
+        turn_index: int,
+        request: Request,
+        captions: bool = False,
+        x_session_id: Optional[str] = Header(None),
+        accept: Optional[str] = Header(None)
+    ):
+        """Compose les panneaux d'un tour en une seule page (négatif = depuis la fin)."""
+        if not x_session_id:
+            raise HTTPException(status_code=400, detail="Session ID is required")
+        game_state = session_manager.get_session(x_session_id)
+        if game_state is None:
+            raise HTTPException(status_code=404, detail="Session not found")
+        if turn_index < 0:
+            turn_index += len(game_state.story_history)
+        if not 0 <= turn_index < len(game_state.story_history):
+            raise HTTPException(status_code=404, detail="Turn not found")
+        story = game_state.story_history[turn_index]
+        # Un choix personnalisé n'a pas de panneaux : ne pas rendre son prompt fictif
+        if game_state.is_custom_choice(story):
+            raise HTTPException(status_code=404, detail="Custom choices have no panels")
+
+        fmt = page_compositor.choose_format(accept)
+        page_id, page, error = await cancel_on_disconnect(
+            request,
+            page_compositor.compose_turn(
+                story.image_prompts,
+                caption=story.story_text.replace("**", "") if captions else None,
+                fmt=fmt,
+                layout_counter=game_state.layout_counter(turn_index)
+            )
+        )
+        if page is None:
+            raise HTTPException(status_code=503, detail=error or "Failed to compose page")
+
+        return Response(
+            content=page,
+            media_type=MEDIA_TYPES[fmt],
+            headers={**PAGE_HEADERS, "X-Page-Id": page_id, "Content-Location": f"/api/pages/{page_id}"}
+        )
+
+    @router.get("/pages/{page_id}")
+    async def get_page(page_id: str, accept: Optional[str] = Header(None)):
+        """Renvoie une page déjà composée, partageable sans session."""
+        if not all(c in "0123456789abcdef" for c in page_id):
+            raise HTTPException(status_code=400, detail="Invalid page ID")
+        result = await page_compositor.get_page(page_id, accept)
+        if result is None:
+            raise HTTPException(status_code=404, detail="Page not composed yet")
+        page, fmt = result
+        return Response(content=page, media_type=MEDIA_TYPES[fmt], headers=PAGE_HEADERS)
+
+    return router
@@ -1,57 +1,63 @@
-from fastapi import APIRouter, HTTPException, Header
+from fastapi import APIRouter, HTTPException, Header, Response
+from fastapi.responses import StreamingResponse
 from typing import Optional
-import aiohttp
 import base64
-import os
 
 from api.models import TextToSpeechRequest
+from core.narration import NarrationPrefetcher
+from services.elevenlabs_client import ElevenLabsClient, SpeechError
 
 router = APIRouter()
 
-def get_speech_router():
-    ELEVEN_LABS_API_KEY = os.getenv("ELEVEN_LABS_API_KEY")
+# Une narration est identifiée par son contenu : elle ne change jamais
+AUDIO_HEADERS = {"Cache-Control": "public, max-age=31536000, immutable"}
 
+def get_speech_router(elevenlabs_client: ElevenLabsClient, narration: Optional[NarrationPrefetcher] = None):
     @router.post("/text-to-speech")
     async def text_to_speech(
         request: TextToSpeechRequest,
         x_session_id: Optional[str] = Header(None)
     ):
-        """Endpoint pour convertir du texte en audio via ElevenLabs"""
+        """Endpoint pour convertir du texte en audio via ElevenLabs.
+
+        Avec `stream`, le MP3 est renvoyé au fil de l'eau pour démarrer la lecture dès le premier morceau.
+        """
         try:
-            if not ELEVEN_LABS_API_KEY:
+            if not elevenlabs_client.enabled:
                 raise HTTPException(status_code=500, detail="ElevenLabs API key not configured")
 
-            # Nettoyer le texte des balises markdown
-            clean_text = request.text.replace("**", "")
-
-            # Appel à l'API ElevenLabs
-            url = f"https://api.elevenlabs.io/v1/text-to-speech/{request.voice_id}"
-            headers = {
-                "Accept": "audio/mpeg",
-                "Content-Type": "application/json",
-                "xi-api-key": ELEVEN_LABS_API_KEY
-            }
-            data = {
-                "text": clean_text,
-                "model_id": "eleven_multilingual_v2",
-                "voice_settings": {
-                    "stability": 0.5,
-                    "similarity_boost": 0.75
-                }
-            }
-
-            async with aiohttp.ClientSession() as session:
-                async with session.post(url, json=data, headers=headers) as response:
-                    if response.status == 200:
-                        audio_content = await response.read()
-                        audio_base64 = base64.b64encode(audio_content).decode('utf-8')
-                        return {"success": True, "audio_base64": audio_base64}
-                    else:
-                        error_text = await response.text()
-                        raise HTTPException(status_code=response.status, detail=error_text)
-
+            audio_id = elevenlabs_client.get_audio_id(request.text, request.voice_id)
+            if narration:
+                # Servie depuis le cache ou en rejoignant la synthèse anticipée
+                narration.record_request(x_session_id, request.text, request.voice_id)
+            if request.stream:
+                audio_stream = await elevenlabs_client.open_stream(request.text, request.voice_id)
+                return StreamingResponse(
+                    audio_stream,
+                    media_type="audio/mpeg",
+                    headers={"X-Audio-Id": audio_id}
+                )
+
+            audio_content = await elevenlabs_client.synthesize(request.text, request.voice_id)
+            audio_base64 = base64.b64encode(audio_content).decode('utf-8')
+            return {"success": True, "audio_base64": audio_base64, "audio_id": audio_id}
+
+        except HTTPException:
+            raise
+        except SpeechError as e:
+            raise HTTPException(status_code=e.status, detail=e.detail)
         except Exception as e:
             print(f"Error in text_to_speech: {str(e)}")
             raise HTTPException(status_code=500, detail=str(e))
-    
-    return router 
\ No newline at end of file
+
+    @router.get("/audio/{audio_id}")
+    async def get_audio(audio_id: str):
+        """Renvoie une narration déjà synthétisée."""
+        if not all(c in "0123456789abcdef" for c in audio_id):
+            raise HTTPException(status_code=400, detail="Invalid audio ID")
+        audio_content = await elevenlabs_client.audio_cache.get(audio_id, ext="mp3")
+        if audio_content is None:
+            raise HTTPException(status_code=404, detail="Audio not synthesized yet")
+        return Response(content=audio_content, media_type="audio/mpeg", headers=AUDIO_HEADERS)
+
+    return router
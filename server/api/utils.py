@@ -0,0 +1,133 @@
+import asyncio
+from typing import Awaitable, TypeVar
+
+from fastapi import HTTPException, Request
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from services.profiler import MODES, Profiler
+from services.tracing import TraceExporter, finish_trace, start_trace
+
+T = TypeVar('T')
+
+# Code non standard (nginx) : le client a fermé la connexion avant la réponse
+CLIENT_CLOSED_REQUEST = 499
+
+
+async def cancel_on_disconnect(request: Request, awaitable: Awaitable[T], poll_interval: float = 0.5) -> T:
+    """Await `awaitable`, cancelling it if the HTTP client goes away in the meantime.
+
+    Cancellation propagates to queued upstream work, so abandoned requests free
+    their slot instead of rendering for nobody.
+    """
+    task = asyncio.ensure_future(awaitable)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=poll_interval)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                task.cancel()
+                raise HTTPException(status_code=CLIENT_CLOSED_REQUEST, detail="Client disconnected")
+    finally:
+        if not task.done():
+            task.cancel()
+
+
+class TracingMiddleware:
+    """ASGI middleware tracing each API request.
+
+    The response gets a `Server-Timing` summary of the spans finished when
+    its headers are sent, and an `X-Trace-Id`. The trace is exported once
+    the last body message has been sent, so streamed responses are covered.
+    Plain ASGI rather than `app.middleware("http")`: BaseHTTPMiddleware hides
+    client disconnects from `request.is_disconnected()`.
+    """
+
+    def __init__(self, app: ASGIApp, exporter: TraceExporter, path_prefix: str = "/api"):
+        self.app = app
+        self.exporter = exporter
+        self.path_prefix = path_prefix
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or not scope["path"].startswith(self.path_prefix):
+            await self.app(scope, receive, send)
+            return
+
+        trace = start_trace(f"{scope['method']} {scope['path']}")
+        trace.root.attributes["http.method"] = scope["method"]
+        trace.root.attributes["http.path"] = scope["path"]
+        finished = False
+
+        def finish():
+            nonlocal finished
+            if not finished:
+                finished = True
+                finish_trace(trace)
+                self.exporter.export(trace)
+
+        async def send_with_trace(message: Message):
+            if message["type"] == "http.response.start":
+                trace.root.attributes["http.status_code"] = message["status"]
+                headers = MutableHeaders(scope=message)
+                headers["Server-Timing"] = trace.server_timing()
+                headers["X-Trace-Id"] = trace.trace_id
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                finish()
+
+        try:
+            await self.app(scope, receive, send_with_trace)
+        except Exception:
+            if not finished:
+                trace.root.error = "Exception"
+            raise
+        finally:
+            # Client parti ou exception : la trace est exportée quand même
+            finish()
+
+
+class ProfilingMiddleware:
+    """ASGI middleware profiling the requests sent with `X-Profile: wall|cpu`.
+
+    The header is honoured only with a valid `X-Debug-Token`. The response
+    gets an `X-Profile-Id`; the profile, complete once the last body message
+    has been sent, is served by /api/debug/profiles/{id}.
+    """
+
+    def __init__(self, app: ASGIApp, profiler: Profiler, path_prefix: str = "/api"):
+        self.app = app
+        self.profiler = profiler
+        self.path_prefix = path_prefix
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or not scope["path"].startswith(self.path_prefix):
+            await self.app(scope, receive, send)
+            return
+        headers = Headers(scope=scope)
+        mode = headers.get("x-profile")
+        if mode not in MODES or not self.profiler.is_authorized(headers.get("x-debug-token")):
+            await self.app(scope, receive, send)
+            return
+
+        profile = self.profiler.start_request(f"{scope['method']} {scope['path']}", mode)
+        finished = False
+
+        async def finish():
+            nonlocal finished
+            if not finished:
+                finished = True
+                await self.profiler.finish_request(profile)
+
+        async def send_with_profile(message: Message):
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message)["X-Profile-Id"] = profile.profile_id
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                await finish()
+
+        try:
+            await self.app(scope, receive, send_with_profile)
+        finally:
+            self.profiler.detach_request(profile)
+            await finish()
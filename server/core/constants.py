@@ -6,6 +6,8 @@ class GameConfig:
     # Story constraints
     MIN_PANELS = 1
     MAX_PANELS = 4
+    # Prompt fictif des entrées d'historique créées pour un choix personnalisé (jamais rendu)
+    CUSTOM_CHOICE_PROMPT = "Character making a custom choice"
 
     MIN_SEGMENTS_BEFORE_END = 6
     MAX_SEGMENTS_BEFORE_END = 10
@@ -50,14 +50,15 @@ class GameState:
             self.universe_story is not None
         ])
 
-    def format_history(self) -> str:
+    def format_history(self, max_segments: int = 4) -> str:
         """Format story history for the prompt.
-        Returns only the last 4 segments of the story (or less if not available)."""
+        Returns only the last `max_segments` segments of the story (or less if not available),
+        preceded by a marker counting the segments left out."""
         if not self.story_history:
             return ""
             
-        # Ne prendre que les 3 derniers segments
-        last_segments = self.story_history[-4:] if len(self.story_history) > 4 else self.story_history
+        # Ne prendre que les derniers segments (attention : [-0:] renverrait tout)
+        last_segments = self.story_history[-max_segments:] if max_segments > 0 else []
             
         segments = []
         for story_response in last_segments:
@@ -80,11 +81,21 @@ class GameState:
             segments.append("\n".join(segment_parts))
         
         # Ajouter une indication si on a tronqué l'historique
-        if len(self.story_history) > 4:
-            segments.insert(0, f"[...{len(self.story_history) - 4} earlier segments omitted...]")
+        omitted = len(self.story_history) - len(last_segments)
+        if omitted > 0:
+            segments.insert(0, f"[...{omitted} earlier segments omitted...]")
         
         return "\n\n---\n\n".join(segments)
 
+    @staticmethod
+    def is_custom_choice(story_response: StoryResponse) -> bool:
+        """Placeholder entry added for a custom choice: the client shows no panels for it."""
+        return story_response.image_prompts == [GameConfig.CUSTOM_CHOICE_PROMPT]
+
+    def layout_counter(self, turn_index: int) -> int:
+        """Client layout counter of a history entry: the turns with panels before it."""
+        return sum(1 for story in self.story_history[:turn_index] if not self.is_custom_choice(story))
+
     def add_to_history(self, story_response: StoryResponse):
         """Add a story response to history."""
         self.story_history.append(story_response)
@@ -1,7 +1,9 @@
-from typing import Any, TypeVar, Type
+from typing import Any, AsyncIterator, TypeVar, Type
 from pydantic import BaseModel
 from langchain.prompts import ChatPromptTemplate
 from services.mistral_client import MistralClient
+from services.metrics import generator_scope
+from services.tracing import span
 
 T = TypeVar('T', bound=BaseModel)
 
@@ -9,6 +11,7 @@ class BaseGenerator:
     """Classe de base pour tous les générateurs de contenu."""
     
     debug_mode = False  # Class attribute for debug mode
+    metrics_name = "generator"  # Label des retries et erreurs de parsing dans /api/metrics
     
     def __init__(self, mistral_client: MistralClient, hero_name: str = None, hero_desc: str = None, is_universe_generator: bool = False, universe_style: str = None, universe_genre: str = None, universe_epoch: str = None):
         self.mistral_client = mistral_client
@@ -58,7 +61,19 @@ class BaseGenerator:
         """
         messages = self.prompt.format_messages(**kwargs)
         self._print_debug_info(messages)  # Print debug info if debug mode is enabled
-        return await self.mistral_client.generate(
-            messages=messages,
-            custom_parser=self._custom_parser
-        ) 
\ No newline at end of file
+        with generator_scope(self.metrics_name), span(f"{self.metrics_name}.call"):
+            return await self.mistral_client.generate(
+                messages=messages,
+                custom_parser=self._custom_parser
+            )
+
+    async def stream(self, **kwargs) -> AsyncIterator[str]:
+        """Stream the raw model output, without parsing.
+
+        Args:
+            **kwargs: Arguments spécifiques au générateur pour formater le prompt
+        """
+        messages = self.prompt.format_messages(**kwargs)
+        self._print_debug_info(messages)
+        async for token in self.mistral_client.stream_text(messages):
+            yield token 
\ No newline at end of file
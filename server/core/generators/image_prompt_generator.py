@@ -1,9 +1,17 @@
-from typing import List
+from typing import Awaitable, Callable, List, Optional
 from pydantic import BaseModel, Field
 from langchain.prompts import ChatPromptTemplate, SystemMessagePromptTemplate, HumanMessagePromptTemplate
 import json
 import random
 from core.generators.base_generator import BaseGenerator
+from core.incremental_json import IncrementalStringArrayParser
+from services.metrics import generator_scope, record_parse_failure
+from services.log import get_logger
+
+log = get_logger("image_prompts")
+
+# (index du panneau, prompt formaté, nombre de panneaux demandés)
+PromptCallback = Callable[[int, str, int], Awaitable[None]]
 
 class ImagePromptResponse(BaseModel):
     """Response format for image prompt generation."""
@@ -12,6 +20,8 @@ class ImagePromptResponse(BaseModel):
 class ImagePromptGenerator(BaseGenerator):
     """Generator for image prompts based on story text."""
 
+    metrics_name = "image_prompts"
+
     def __init__(self, mistral_client, artist_style: str, hero_name: str = None, hero_desc: str = None, universe_style: str = None, universe_genre: str = None, universe_epoch: str = None):
         super().__init__(mistral_client, hero_name=hero_name, hero_desc=hero_desc, universe_style=universe_style, universe_genre=universe_genre, universe_epoch=universe_epoch)
         if not artist_style:
@@ -186,11 +196,7 @@ Dont put the hero name every time.
                 )
 
             # Add hero description if hero name is mentioned
-            prompts = data["image_prompts"]
-            prompts = [
-                f"{prompt} {self.hero_desc}" if self.hero_name.lower() in prompt.lower() else prompt
-                for prompt in prompts
-            ]
+            prompts = [self._add_hero_description(prompt) for prompt in data["image_prompts"]]
             
             # Create and validate with Pydantic
             try:
@@ -204,6 +210,11 @@ Dont put the hero name every time.
         except json.JSONDecodeError:
             raise ValueError("Response must be a valid JSON object with 'image_prompts' array")
 
+    def _add_hero_description(self, prompt: str) -> str:
+        if self.hero_name.lower() in prompt.lower():
+            return f"{prompt} {self.hero_desc}"
+        return prompt
+
     def _format_prompt(self, prompt: str, time: str, location: str) -> str:
         """Format a prompt with time and location metadata and universe style."""
         metadata = f"[{time} - {location}] "
@@ -213,7 +224,7 @@ Dont put the hero name every time.
         
         return f"{style_prefix} comic book style -- {metadata}{prompt}"
 
-    async def generate(self, story_text: str, time: str, location: str, is_death: bool = False, is_victory: bool = False, turn_before_end: int = 0, is_winning_story: bool = False, story_beat: int = 0) -> ImagePromptResponse:
+    async def generate(self, story_text: str, time: str, location: str, is_death: bool = False, is_victory: bool = False, turn_before_end: int = 0, is_winning_story: bool = False, story_beat: int = 0, max_panels: int = 4, on_prompt: Optional[PromptCallback] = None, on_discard: Optional[Callable[[], None]] = None) -> ImagePromptResponse:
         """Generate image prompts based on story text.
         
         Args:
@@ -223,6 +234,11 @@ Dont put the hero name every time.
             is_death: Whether this is a death scene
             is_victory: Whether this is a victory scene
             story_beat: Current story beat (0-6+)
+            max_panels: Upper bound on the number of panels, lowered under load
+            on_prompt: If set, the response is streamed and this callback receives
+                each formatted prompt as soon as the model has finished writing it
+            on_discard: Called when the streamed response is unusable, before
+                falling back: the prompts already passed to on_prompt are dropped
             
         Returns:
             ImagePromptResponse containing the generated and formatted image prompts
@@ -234,6 +250,7 @@ Dont put the hero name every time.
             how_many_panels = 1
         else:
             how_many_panels = random.choices([1, 2, 3, 4], weights=[0.05, 0.3, 0.4, 0.25], k=1)[0]
+        how_many_panels = min(how_many_panels, max_panels)
 
         is_end=""
         if is_death:
@@ -243,18 +260,54 @@ Dont put the hero name every time.
 
         
 
-        response = await super().generate(
+        prompt_kwargs = dict(
             story_text=story_text,
             is_death=is_death,
             is_victory=is_victory,
             is_end=is_end,
             how_many_panels=how_many_panels,
         )
+        response = None
+        if on_prompt is not None:
+            with generator_scope(self.metrics_name):
+                response = await self._generate_streaming(prompt_kwargs, time, location, how_many_panels, max_panels, on_prompt)
+            if response is None and on_discard is not None:
+                on_discard()
+        if response is None:
+            response = await super().generate(**prompt_kwargs)
         
         # Format each prompt with metadata
         response.image_prompts = [
             self._format_prompt(prompt, time, location)
-            for prompt in response.image_prompts
+            for prompt in response.image_prompts[:max_panels]
         ]
         
-        return response 
\ No newline at end of file
+        return response
+
+    async def _generate_streaming(self, prompt_kwargs: dict, time: str, location: str, how_many_panels: int, max_panels: int, on_prompt: PromptCallback) -> Optional[ImagePromptResponse]:
+        """Stream the response and hand each prompt to `on_prompt` as soon as its string closes.
+
+        Returns None if the stream fails or its response cannot be parsed, so
+        the caller can fall back to the regular call with retries.
+        """
+        parser = IncrementalStringArrayParser(key="image_prompts")
+        content = ""
+        try:
+            async for token in self.stream(**prompt_kwargs):
+                content += token
+                # Un même token peut fermer plusieurs prompts
+                first_index = len(parser.items)
+                for index, prompt in enumerate(parser.feed(token), start=first_index):
+                    if index < max_panels:
+                        formatted = self._format_prompt(self._add_hero_description(prompt), time, location)
+                        await on_prompt(index, formatted, how_many_panels)
+        except Exception as e:
+            log.warning("Streaming failed, falling back to regular generation", error=str(e))
+            return None
+
+        try:
+            return self._custom_parser(content)
+        except ValueError as e:
+            log.warning("Streamed response could not be parsed, falling back to regular generation", error=str(e))
+            record_parse_failure(self.metrics_name)
+            return None
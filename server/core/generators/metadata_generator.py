@@ -4,10 +4,16 @@ from langchain.prompts import ChatPromptTemplate, SystemMessagePromptTemplate, H
 from core.generators.base_generator import BaseGenerator
 from core.prompts.formatting_rules import FORMATTING_RULES
 from api.models import StoryMetadataResponse
+from services.metrics import record_parse_failure, record_retry
+from services.log import get_logger
+
+log = get_logger("metadata")
 
 class MetadataGenerator(BaseGenerator):
     """Générateur pour les métadonnées de l'histoire."""
 
+    metrics_name = "metadata"
+
     def __init__(self, mistral_client, hero_name: str = None, hero_desc: str = None):
         self.max_retries = 5  # Nombre maximum de tentatives
         super().__init__(mistral_client, hero_name=hero_name, hero_desc=hero_desc)
@@ -171,26 +177,28 @@ THE CHOICE HAVE TO REFERENCE THE CURRENT SEGMENT OF THE STORY.
                     story_history=story_history
                 )
 
-                print(f"[MetadataGenerator] Raw response before validation (attempt {retry_count + 1}):", response)
-                
                 # Valider les choix
                 if self._validate_choices(response.choices):
-                    print("[MetadataGenerator] Validation successful!")
+                    log.debug("Validation successful", attempt=retry_count + 1)
                     return response
                 
-                print(f"[MetadataGenerator] Validation failed for choices:", response.choices)
+                log.warning("Validation failed for choices", attempt=retry_count + 1, choices=response.choices)
+                record_parse_failure(self.metrics_name)
                 last_response = response
                 last_error = ValueError("Invalid choices format")
                 retry_count += 1
+                if retry_count < self.max_retries:
+                    record_retry("validation", self.metrics_name)
                 continue
 
             except Exception as e:
-                print(f"[MetadataGenerator] Error during generation (attempt {retry_count + 1}):", str(e))
+                log.warning("Error during generation", attempt=retry_count + 1, error=str(e))
                 retry_count += 1
                 last_error = e
                 if retry_count >= self.max_retries:
-                    print(f"[MetadataGenerator] Failed to generate valid metadata after {self.max_retries} attempts. Last error: {str(e)}")
+                    log.error("Failed to generate valid metadata", attempts=self.max_retries, error=str(e))
                     raise e
+                record_retry("error", self.metrics_name)
                 continue
 
         # Si on arrive ici, c'est qu'on a épuisé toutes les tentatives
@@ -198,51 +206,41 @@ THE CHOICE HAVE TO REFERENCE THE CURRENT SEGMENT OF THE STORY.
 
     def _custom_parser(self, response_content: str) -> StoryMetadataResponse:
         """Parse la réponse et gère les erreurs."""
-        print("[MetadataGenerator] Starting parsing process...")
-        print("[MetadataGenerator] Raw response content:", response_content)
+        log.debug("Parsing response", response=response_content)
         
         try:
             # Première tentative : nettoyer les caractères d'échappement problématiques
             cleaned_content = response_content.replace('\\', '')
-            print("[MetadataGenerator] First cleaning attempt:", cleaned_content)
             
             try:
                 data = json.loads(cleaned_content)
-                print("[MetadataGenerator] Successfully parsed JSON after first cleaning")
             except json.JSONDecodeError as e1:
-                print("[MetadataGenerator] First cleaning failed:", str(e1))
+                log.debug("First cleaning failed", error=str(e1))
                 # Deuxième tentative : supprimer les commentaires et les espaces superflus
                 import re
                 cleaned_content = re.sub(r'#.*$', '', cleaned_content, flags=re.MULTILINE)
                 cleaned_content = re.sub(r'\s+', ' ', cleaned_content)
-                print("[MetadataGenerator] Second cleaning attempt:", cleaned_content)
                 try:
                     data = json.loads(cleaned_content)
-                    print("[MetadataGenerator] Successfully parsed JSON after second cleaning")
                 except json.JSONDecodeError as e2:
-                    print("[MetadataGenerator] Second cleaning failed:", str(e2))
+                    log.debug("Second cleaning failed", error=str(e2))
                     raise ValueError("Failed to parse JSON after multiple cleaning attempts")
 
             # Vérifier que les choix sont valides selon les règles
             choices = data.get('choices', [])
-            print("[MetadataGenerator] Extracted choices:", choices)
             
             # Vérifier qu'il y a exactement 2 choix
             if len(choices) != 2:
-                print("[MetadataGenerator] Invalid number of choices:", len(choices))
                 raise ValueError('Must have exactly 2 choices')
             
             # Vérifier que tous les champs requis sont présents
             required_fields = ['is_death', 'is_victory', 'choices', 'time', 'location']
             missing_fields = [field for field in required_fields if field not in data]
             if missing_fields:
-                print("[MetadataGenerator] Missing required fields:", missing_fields)
                 raise ValueError(f'Missing required fields: {", ".join(missing_fields)}')
             
-            print("[MetadataGenerator] All validations passed, creating response object")
             return StoryMetadataResponse(**data)
             
         except Exception as e:
-            print("[MetadataGenerator] Final error:", str(e))
-            print("[MetadataGenerator] Failed to parse response content")
+            log.warning("Failed to parse response", error=str(e), response=response_content)
             raise ValueError(str(e)) 
\ No newline at end of file
@@ -1,15 +1,41 @@
 import json
+import re
+from contextlib import aclosing
+from typing import Awaitable, Callable, Optional
 from langchain.prompts import ChatPromptTemplate, SystemMessagePromptTemplate, HumanMessagePromptTemplate
 
 from core.generators.base_generator import BaseGenerator
 from api.models import StorySegmentResponse
 from services.mistral_client import MistralClient
+from services.metrics import generator_scope
+from services.log import get_logger
 from core.prompts.formatting_rules import FORMATTING_RULES
 import random
 
+log = get_logger("segment")
+
+TokenCallback = Callable[[str], Awaitable[None]]
+
+# Fin de phrase, éventuellement suivie de guillemets ou de markdown, puis un espace
+SENTENCE_END = re.compile(r'[.!?…]["\'»)*]*(?=\s)')
+
+
+def cut_at_word_budget(text: str, word_budget: int) -> Optional[str]:
+    """Text up to the first sentence end at or past `word_budget` words, None if not reached yet."""
+    for match in SENTENCE_END.finditer(text):
+        if len(text[:match.end()].split()) >= word_budget:
+            return text[:match.end()]
+    return None
+
+
 class StorySegmentGenerator(BaseGenerator):
     """Generator for story segments based on game state and universe context."""
 
+    metrics_name = "segment"
+
+    # Même limite que le prompt ("LIMIT: 15 words")
+    WORD_BUDGET = 15
+
     def __init__(self, mistral_client: MistralClient, universe_style: str = None, universe_genre: str = None, universe_epoch: str = None, universe_story: str = None, universe_macguffin: str = None, hero_name: str = None, hero_desc: str = None):
         # Initialize universe variables first
         self.universe_style = universe_style
@@ -138,9 +164,12 @@ LIMIT: 15 words.
             return StorySegmentResponse(**data)
             
         except (json.JSONDecodeError, ValueError) as e:
-            print(f"Error parsing response: {str(e)}")
-            print(f"Original response: {response_content}")
-            print(f"Cleaned response: {cleaned_response if 'cleaned_response' in locals() else 'Not cleaned yet'}")
+            log.warning(
+                "Error parsing response",
+                error=str(e),
+                response=response_content,
+                cleaned=cleaned_response if 'cleaned_response' in locals() else None
+            )
             raise ValueError(
                 "Response must be a valid JSON object with 'story_text' field. "
                 "Example: {'story_text': 'Your story segment here'}"
@@ -151,8 +180,33 @@ LIMIT: 15 words.
         word_count = len(text.split())
         return 0 <= word_count <= 30
 
-    async def generate(self, story_beat: int, current_time: str, current_location: str, previous_choice: str, story_history: str = "", turn_before_end: int = 0, is_winning_story: bool = False) -> StorySegmentResponse:
-        """Generate the next story segment."""
+    async def _stream_text(self, messages, on_token: Optional[TokenCallback]) -> str:
+        """Stream the segment and stop at the first sentence end past the word budget.
+
+        Closing the stream cancels the upstream completion, so the tokens we
+        would have truncated are never generated.
+        """
+        text = ""
+        async with aclosing(self.mistral_client.stream_text(messages)) as tokens:
+            async for token in tokens:
+                text += token
+                cut = cut_at_word_budget(text, self.WORD_BUDGET)
+                if cut is not None:
+                    token = token[:len(token) - (len(text) - len(cut))]
+                    text = cut
+                if on_token and token:
+                    await on_token(token)
+                if cut is not None:
+                    break
+        return text.strip()
+
+    async def generate(self, story_beat: int, current_time: str, current_location: str, previous_choice: str, story_history: str = "", turn_before_end: int = 0, is_winning_story: bool = False, on_token: Optional[TokenCallback] = None) -> StorySegmentResponse:
+        """Generate the next story segment, forwarding each token to `on_token`.
+
+        A stream that fails before any text was forwarded falls back to a
+        plain completion; once text has reached `on_token`, the error is
+        raised instead, since another completion would not match it.
+        """
         is_end = True if story_beat == turn_before_end else False
         is_death = True if is_end and is_winning_story else False
         is_victory = True if is_end and not is_winning_story else False
@@ -183,6 +237,22 @@ MANDATORY : Start with a direct reaction to the player's choice, Show immediate
             universe_macguffin=self.universe_macguffin
         )
 
-        # Générer le texte
-        story_text = await self.mistral_client.generate_text(messages)
+        forwarded = []
+
+        async def forward(token: str):
+            forwarded.append(token)
+            await on_token(token)
+
+        # Générer le texte en streaming, avec repli sur un appel classique
+        with generator_scope(self.metrics_name):
+            try:
+                story_text = await self._stream_text(messages, forward if on_token else None)
+            except Exception as e:
+                if "".join(forwarded).strip():
+                    log.warning("Streaming failed after tokens were forwarded", error=str(e), forwarded=len(forwarded))
+                    raise
+                log.warning("Streaming failed, falling back to generate_text", error=str(e))
+                story_text = ""
+            if not story_text:
+                story_text = await self.mistral_client.generate_text(messages)
         return StorySegmentResponse(story_text=story_text) 
\ No newline at end of file
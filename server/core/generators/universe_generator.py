@@ -5,10 +5,13 @@ from langchain.prompts import ChatPromptTemplate, SystemMessagePromptTemplate, H
 
 from core.generators.base_generator import BaseGenerator
 from services.mistral_client import MistralClient
+from services.metrics import time_stage
 
 class UniverseGenerator(BaseGenerator):
     """Générateur pour les univers alternatifs."""
 
+    metrics_name = "universe"
+
     def __init__(self, mistral_client: MistralClient):
         self.styles_data = self._load_universe_styles()
         super().__init__(mistral_client, is_universe_generator=True)
@@ -85,15 +88,16 @@ Always write a direction to the story. (a small strange thing must happen, as a
         style, genre, epoch, macguffin, hero_name, hero_desc, artist, works = self._get_random_elements()
         
         # Create the universe prompt
-        response = await super().generate(
-            style_name=style["name"],
-            style_description=style["description"],
-            artists=artist,
-            works=works,
-            genre=genre,
-            epoch=epoch,
-            macguffin=macguffin,
-            hero=hero_name
-        )
+        with time_stage("universe"):
+            response = await super().generate(
+                style_name=style["name"],
+                style_description=style["description"],
+                artists=artist,
+                works=works,
+                genre=genre,
+                epoch=epoch,
+                macguffin=macguffin,
+                hero=hero_name
+            )
         
         return response, style, genre, epoch, macguffin, hero_name, hero_desc 
\ No newline at end of file
@@ -0,0 +1,215 @@
+import asyncio
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from core.layouts import LAYOUTS_BY_PANEL_COUNT, get_layout_type, get_panel_size
+from core.quality_policy import QUALITY_LEVELS, QualityPolicy
+from services.flux_client import FluxClient
+from services.image_cache import ImageCache
+from services.image_transcoder import ImageTranscoder
+from services.priority_limiter import Priority
+from services.singleflight import SingleFlight
+from services.log import get_logger
+
+log = get_logger("pipeline")
+
+
+class ImagePipeline:
+    """Renders comic panels through Flux, caching full-quality renders by panel ID.
+
+    A panel ID identifies a panel (prompt + dimensions) independently of the
+    render quality, so the preview and the final image share the same ID.
+    """
+
+    # Rendu rapide affiché en attendant le rendu final
+    PREVIEW_STEPS = 1
+    PREVIEW_SCALE = 0.5
+    PREVIEW_MIN_SIZE = 256
+
+    def __init__(self, flux_client: FluxClient, image_cache: ImageCache, quality_policy: Optional[QualityPolicy] = None, transcoder: Optional[ImageTranscoder] = None):
+        self.flux_client = flux_client
+        self.image_cache = image_cache
+        self.quality_policy = quality_policy
+        self.transcoder = transcoder
+        self.previews_skipped = 0
+        self.prefetched = 0
+        self.prefetches_cancelled = 0
+        # Garde une référence sur les rendus en arrière-plan
+        self._background_tasks = set()
+        self._prefetch_tasks: Dict[str, asyncio.Task] = {}
+
+    @staticmethod
+    def get_panel_id(prompt: str, width: int, height: int) -> str:
+        # Mêmes arrondis que FluxClient pour que 513x512 et 512x512 soient le même panneau
+        return SingleFlight.make_key(prompt, (width // 8) * 8, (height // 8) * 8)[:32]
+
+    @staticmethod
+    def panel_variants() -> List[Optional[str]]:
+        return [None] + [f"q{quality.level}" for quality in QUALITY_LEVELS[1:]]
+
+    def has_panel(self, panel_id: str) -> bool:
+        return any(self.image_cache.has(panel_id, variant) for variant in self.panel_variants())
+
+    async def load_panel(self, panel_id: str) -> Tuple[Optional[bytes], Optional[str]]:
+        """Full render of a panel if cached, else its least degraded render."""
+        for variant in self.panel_variants():
+            data = await self.image_cache.get(panel_id, variant)
+            if data is not None:
+                return data, variant
+        return None, None
+
+    def find_turn_panels(self, prompts: List[str], layout_counter: int = 0) -> Tuple[str, List[str]]:
+        """Layout and panel IDs of a turn.
+
+        The client picks one of several layouts for a given panel count, so
+        the layout whose panel sizes are all in the cache is the one it used;
+        the turn's `layout_counter` is tried first.
+        """
+        count = len(prompts)
+        candidates = LAYOUTS_BY_PANEL_COUNT.get(count, ["COVER"])
+        for counter in range(layout_counter, layout_counter + len(candidates)):
+            layout = get_layout_type(count, counter)
+            panel_ids = [
+                self.get_panel_id(prompt, *get_panel_size(count, index, counter))
+                for index, prompt in enumerate(prompts)
+            ]
+            if all(self.has_panel(panel_id) for panel_id in panel_ids):
+                return layout, panel_ids
+        # Aucun layout complet en cache : celui que le client choisit pour ce tour
+        layout = get_layout_type(count, layout_counter)
+        return layout, [self.get_panel_id(prompt, *get_panel_size(count, index, layout_counter)) for index, prompt in enumerate(prompts)]
+
+    def get_quality_level(self) -> int:
+        return self.quality_policy.current().level if self.quality_policy else 0
+
+    async def render(self, prompt: str, width: int, height: int, priority: Priority = Priority.PANEL) -> Tuple[Optional[bytes], Optional[str], str]:
+        """Return (image, error, panel_id), serving the full render from cache when possible.
+
+        Under load, the quality policy lowers resolution and inference steps.
+        Degraded renders are cached as a separate variant so they are not
+        served once load has subsided.
+        """
+        panel_id = self.get_panel_id(prompt, width, height)
+        cached = await self.image_cache.get(panel_id)
+        if cached is not None:
+            return cached, None, panel_id
+
+        quality = self.quality_policy.current() if self.quality_policy else None
+        variant = f"q{quality.level}" if quality and quality.level > 0 else None
+        if variant:
+            cached = await self.image_cache.get(panel_id, variant)
+            if cached is not None:
+                return cached, None, panel_id
+
+        params = {"width": width, "height": height}
+        if quality:
+            params.update(
+                width=int(width * quality.resolution_scale),
+                height=int(height * quality.resolution_scale),
+                num_inference_steps=quality.num_inference_steps
+            )
+        image, error = await self.flux_client.generate_image(prompt=prompt, priority=priority, request_id=panel_id, **params)
+        if image:
+            await self.image_cache.put(panel_id, image, variant)
+            # Variantes WebP/AVIF préparées en arrière-plan pour les rendus complets
+            if variant is None and self.transcoder and self.transcoder.enabled:
+                self._run_in_background(self.transcoder.transcode(panel_id, image))
+        return image, error, panel_id
+
+    def get_render_status(self, panel_id: str) -> Optional[dict]:
+        """State of a panel's render ("queued" with its position, "rendering", "done"), None if unknown."""
+        status = self.flux_client.get_request_status(panel_id)
+        if status is not None:
+            return {"panel_id": panel_id, **status}
+        if self.has_panel(panel_id):
+            return {"panel_id": panel_id, "state": "done", "position": None, "expected_wait": 0.0}
+        return None
+
+    def prefetch(self, prompt: str, width: int, height: int, priority: Priority = Priority.PREFETCH) -> str:
+        """Start rendering a panel in the background and return its panel ID.
+
+        A later `render` of the same panel joins the in-flight request or hits
+        the cache; `cancel_prefetch` drops it if the panel is no longer needed.
+        """
+        self.prefetched += 1
+        panel_id = self.get_panel_id(prompt, width, height)
+        task = self._run_in_background(self.render(prompt, width, height, priority))
+        self._prefetch_tasks[panel_id] = task
+        task.add_done_callback(lambda task, panel_id=panel_id: self._forget_prefetch(panel_id, task))
+        return panel_id
+
+    def _forget_prefetch(self, panel_id: str, task: asyncio.Task):
+        if self._prefetch_tasks.get(panel_id) is task:
+            del self._prefetch_tasks[panel_id]
+
+    def cancel_prefetch(self, panel_id: str) -> bool:
+        """Cancel a pending prefetch. Other callers waiting for the same render keep it."""
+        task = self._prefetch_tasks.pop(panel_id, None)
+        if task is None or task.done():
+            return False
+        task.cancel()
+        self.prefetches_cancelled += 1
+        return True
+
+    def _run_in_background(self, coro) -> asyncio.Task:
+        task = asyncio.ensure_future(coro)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._on_background_done)
+        return task
+
+    def _on_background_done(self, task: asyncio.Task):
+        self._background_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            log.warning("Background task failed", error=str(task.exception()))
+
+    async def render_preview(self, prompt: str, width: int, height: int, priority: Priority = Priority.PANEL) -> Tuple[Optional[bytes], Optional[str]]:
+        """Cheap low-step, low-resolution render of a panel. Never cached."""
+        return await self.flux_client.generate_image(
+            prompt=prompt,
+            width=max(self.PREVIEW_MIN_SIZE, int(width * self.PREVIEW_SCALE)),
+            height=max(self.PREVIEW_MIN_SIZE, int(height * self.PREVIEW_SCALE)),
+            num_inference_steps=self.PREVIEW_STEPS,
+            priority=priority
+        )
+
+    async def render_progressive(self, prompt: str, width: int, height: int, priority: Priority = Priority.PANEL) -> AsyncIterator[Dict]:
+        """Yield a preview phase then the final phase for one panel.
+
+        The preview is skipped when the full render is already cached or
+        finishes first.
+        """
+        panel_id = self.get_panel_id(prompt, width, height)
+        if self.image_cache.has(panel_id):
+            self.previews_skipped += 1
+            image, error, _ = await self.render(prompt, width, height, priority)
+            yield {"panel_id": panel_id, "phase": "final", "image": image, "error": error}
+            return
+
+        # L'aperçu est soumis en premier pour passer devant le rendu complet dans la file
+        preview_task = asyncio.ensure_future(self.render_preview(prompt, width, height, priority))
+        final_task = asyncio.ensure_future(self.render(prompt, width, height, priority))
+        try:
+            done, _ = await asyncio.wait({preview_task, final_task}, return_when=asyncio.FIRST_COMPLETED)
+            if final_task in done:
+                self.previews_skipped += 1
+                preview_task.cancel()
+            else:
+                preview, _ = preview_task.result()
+                if preview:
+                    yield {"panel_id": panel_id, "phase": "preview", "image": preview, "error": None}
+
+            image, error, _ = await final_task
+            yield {"panel_id": panel_id, "phase": "final", "image": image, "error": error}
+        finally:
+            for task in (preview_task, final_task):
+                if not task.done():
+                    task.cancel()
+
+    def get_stats(self) -> dict:
+        return {
+            "cache": self.image_cache.get_stats(),
+            "previews_skipped": self.previews_skipped,
+            "prefetched": self.prefetched,
+            "prefetches_cancelled": self.prefetches_cancelled,
+            "background_tasks": len(self._background_tasks),
+            "transcoder": self.transcoder.get_stats() if self.transcoder else None,
+        }
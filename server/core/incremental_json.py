@@ -0,0 +1,74 @@
+import json
+from typing import List, Optional
+
+
+class IncrementalStringArrayParser:
+    """Extract the strings of a JSON array as soon as each one is complete.
+
+    Feed the raw model output chunk by chunk; `feed` returns the strings whose
+    closing quote arrived in that chunk. Only the array following `key` is
+    read (or the first array if `key` is None); anything else, such as
+    markdown fences around the JSON, is ignored.
+    """
+
+    def __init__(self, key: Optional[str] = None):
+        self.key = key
+        self._buffer = ""
+        self._pos = 0
+        self._in_array = False
+        self._done = False
+        self._string_start: Optional[int] = None
+        self._escaped = False
+        self.items: List[str] = []
+
+    @property
+    def done(self) -> bool:
+        return self._done
+
+    def _find_array_start(self) -> bool:
+        search_from = 0
+        if self.key is not None:
+            key_index = self._buffer.find(f'"{self.key}"')
+            if key_index == -1:
+                return False
+            search_from = key_index + len(self.key) + 2
+        bracket = self._buffer.find("[", search_from)
+        if bracket == -1:
+            return False
+        self._pos = bracket + 1
+        self._in_array = True
+        return True
+
+    def feed(self, chunk: str) -> List[str]:
+        if self._done:
+            return []
+        self._buffer += chunk
+        if not self._in_array and not self._find_array_start():
+            return []
+
+        completed = []
+        buffer = self._buffer
+        while self._pos < len(buffer):
+            char = buffer[self._pos]
+            if self._string_start is not None:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    raw = buffer[self._string_start:self._pos + 1]
+                    self._string_start = None
+                    try:
+                        value = json.loads(raw)
+                    except json.JSONDecodeError:
+                        value = raw[1:-1]
+                    self.items.append(value)
+                    completed.append(value)
+            elif char == '"':
+                self._string_start = self._pos
+            elif char == "]":
+                self._done = True
+                self._pos += 1
+                break
+            self._pos += 1
+        return completed
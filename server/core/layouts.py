@@ -0,0 +1,67 @@
+"""Server-side copy of the comic page layouts defined in client/src/layouts/config.js.
+
+Keep both files in sync: the server uses these sizes to render panels ahead
+of the client's requests, so they must match what the client will ask for.
+"""
+from typing import Dict, List, Tuple
+
+PANEL_SIZES: Dict[str, Tuple[int, int]] = {
+    "PORTRAIT": (512, 768),
+    "COLUMN": (512, 1024),
+    "LANDSCAPE": (768, 512),
+    "PANORAMIC": (1024, 512),
+    "COVER_SIZE": (512, 1024),
+    "SQUARE": (512, 512),
+}
+
+# Taille de chaque panneau, dans l'ordre des prompts
+LAYOUTS: Dict[str, List[Tuple[int, int]]] = {
+    "COVER": [PANEL_SIZES["COVER_SIZE"]],
+    "LAYOUT_1": [PANEL_SIZES["LANDSCAPE"], PANEL_SIZES["PORTRAIT"], PANEL_SIZES["LANDSCAPE"], PANEL_SIZES["PORTRAIT"]],
+    "LAYOUT_2": [PANEL_SIZES["LANDSCAPE"], PANEL_SIZES["PORTRAIT"], PANEL_SIZES["LANDSCAPE"]],
+    "LAYOUT_3": [PANEL_SIZES["SQUARE"], PANEL_SIZES["COLUMN"], PANEL_SIZES["COLUMN"], PANEL_SIZES["SQUARE"]],
+    "LAYOUT_4": [PANEL_SIZES["PANORAMIC"], PANEL_SIZES["COLUMN"], PANEL_SIZES["SQUARE"], PANEL_SIZES["SQUARE"]],
+    "LAYOUT_5": [PANEL_SIZES["PANORAMIC"], PANEL_SIZES["COLUMN"], PANEL_SIZES["SQUARE"]],
+    "LAYOUT_7": [PANEL_SIZES["LANDSCAPE"], PANEL_SIZES["LANDSCAPE"]],
+}
+
+# Grille CSS de chaque layout : (colonnes, lignes) et, par panneau,
+# (colonne, ligne, nb colonnes, nb lignes), indices à partir de 0
+LAYOUT_GRIDS: Dict[str, Tuple[Tuple[int, int], List[Tuple[int, int, int, int]]]] = {
+    "COVER": ((1, 1), [(0, 0, 1, 1)]),
+    "LAYOUT_1": ((2, 2), [(0, 0, 1, 1), (1, 0, 1, 1), (0, 1, 1, 1), (1, 1, 1, 1)]),
+    "LAYOUT_2": ((3, 2), [(0, 0, 2, 1), (2, 0, 1, 1), (0, 1, 3, 1)]),
+    "LAYOUT_3": ((3, 2), [(0, 0, 2, 1), (2, 0, 1, 1), (0, 1, 1, 1), (1, 1, 2, 1)]),
+    "LAYOUT_4": ((2, 3), [(0, 0, 2, 1), (0, 1, 1, 2), (1, 1, 1, 1), (1, 2, 1, 1)]),
+    "LAYOUT_5": ((3, 3), [(0, 0, 3, 1), (0, 1, 1, 2), (1, 1, 2, 2)]),
+    "LAYOUT_7": ((1, 2), [(0, 0, 1, 1), (0, 1, 1, 1)]),
+}
+
+LAYOUTS_BY_PANEL_COUNT: Dict[int, List[str]] = {
+    1: ["COVER"],
+    2: ["LAYOUT_7"],
+    3: ["LAYOUT_2", "LAYOUT_5"],
+    4: ["LAYOUT_3", "LAYOUT_4"],
+}
+
+
+def get_layout_type(panel_count: int, layout_counter: int = 0) -> str:
+    """Same choice as getNextLayoutType on the client.
+
+    The client's layout counter goes up by one for every turn that shows
+    images, the intro included: for a turn it equals the story beat the turn
+    was generated at.
+    """
+    available = LAYOUTS_BY_PANEL_COUNT.get(panel_count)
+    if not available:
+        return "COVER"
+    return available[layout_counter % len(available)]
+
+
+def get_layout_panel_size(layout: str, panel_index: int) -> Tuple[int, int]:
+    panels = LAYOUTS[layout]
+    return panels[min(panel_index, len(panels) - 1)]
+
+
+def get_panel_size(panel_count: int, panel_index: int, layout_counter: int = 0) -> Tuple[int, int]:
+    return get_layout_panel_size(get_layout_type(panel_count, layout_counter), panel_index)
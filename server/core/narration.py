@@ -0,0 +1,103 @@
+import asyncio
+import os
+from collections import OrderedDict
+from typing import Optional
+
+from services.elevenlabs_client import ElevenLabsClient
+from services.priority_limiter import Priority
+from services.log import get_logger
+
+log = get_logger("narration")
+
+
+class NarrationPrefetcher:
+    """Synthesizes each turn's narration as soon as its story text is known.
+
+    The audio itself lives in the ElevenLabs client's content-addressed
+    cache; this keeps, per session, the narrations synthesized ahead of time
+    so that `/api/text-to-speech` requests can be counted as hits or misses.
+    A request arriving mid-synthesis joins it and moves it up the voice's
+    queue. Requests without a session ID are matched against every
+    session's recent narrations.
+    """
+
+    MAX_SESSIONS = 1000
+    MAX_NARRATIONS_PER_SESSION = 8
+    MAX_RECENT = MAX_SESSIONS * MAX_NARRATIONS_PER_SESSION
+
+    def __init__(self, elevenlabs_client: ElevenLabsClient, voice_id: Optional[str] = None, enabled: Optional[bool] = None):
+        self.elevenlabs_client = elevenlabs_client
+        # Même voix que le client (Rachel)
+        self.voice_id = voice_id or os.getenv("NARRATION_VOICE_ID", "21m00Tcm4TlvDq8ikWAM")
+        if enabled is None:
+            enabled = os.getenv("PRESYNTHESIZE_NARRATION", "false").lower() == "true"
+        self.enabled = enabled and elevenlabs_client.enabled
+        self._sessions: "OrderedDict[str, OrderedDict[str, None]]" = OrderedDict()
+        # Toutes sessions confondues, pour les requêtes sans x-session-id
+        self._recent: "OrderedDict[str, None]" = OrderedDict()
+        # Garde une référence sur les synthèses en arrière-plan
+        self._tasks = set()
+
+        self.started = 0
+        self.failed = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _session_narrations(self, session_id: str) -> "OrderedDict[str, None]":
+        narrations = self._sessions.pop(session_id, None) or OrderedDict()
+        self._sessions[session_id] = narrations
+        while len(self._sessions) > self.MAX_SESSIONS:
+            self._sessions.popitem(last=False)
+        return narrations
+
+    def presynthesize(self, session_id: str, text: str):
+        """Start synthesizing a narration in the background."""
+        if not self.enabled or not text:
+            return
+        narrations = self._session_narrations(session_id)
+        audio_id = self.elevenlabs_client.get_audio_id(text, self.voice_id)
+        if audio_id in narrations:
+            return
+        narrations[audio_id] = None
+        while len(narrations) > self.MAX_NARRATIONS_PER_SESSION:
+            narrations.popitem(last=False)
+        self._recent[audio_id] = None
+        while len(self._recent) > self.MAX_RECENT:
+            self._recent.popitem(last=False)
+
+        self.started += 1
+        task = asyncio.ensure_future(self.elevenlabs_client.synthesize(text, self.voice_id, Priority.PREFETCH))
+        self._tasks.add(task)
+        task.add_done_callback(self._on_done)
+
+    def _on_done(self, task: asyncio.Task):
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            self.failed += 1
+            log.warning("Presynthesis failed", error=str(task.exception()))
+
+    def record_request(self, session_id: Optional[str], text: str, voice_id: str) -> bool:
+        """Count a client request as a hit if its narration was synthesized ahead of time."""
+        if not self.enabled:
+            return False
+        narrations = self._sessions.get(session_id) if session_id else self._recent
+        hit = narrations is not None and self.elevenlabs_client.get_audio_id(text, voice_id) in narrations
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return hit
+
+    def get_stats(self) -> dict:
+        requests = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "voice_id": self.voice_id,
+            "started": self.started,
+            "in_flight": len(self._tasks),
+            "failed": self.failed,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / requests, 3) if requests else None,
+            "sessions": len(self._sessions),
+        }
@@ -0,0 +1,168 @@
+import asyncio
+import io
+import textwrap
+import time
+from typing import List, Optional, Tuple
+
+from core.image_pipeline import ImagePipeline
+from core.layouts import LAYOUT_GRIDS, get_layout_panel_size
+from services.process_pool import get_process_pool
+from services.singleflight import SingleFlight
+from services.log import get_logger
+
+log = get_logger("compositor")
+
+# Pillow fait partie des dépendances ; s'il manque, pas de composition de pages
+try:
+    from PIL import Image, ImageDraw, ImageFont, ImageOps, features
+except ImportError:
+    Image = None
+    features = None
+
+PAGE_WIDTH = 1024
+PAGE_HEIGHT = 1448  # Format A4
+GUTTER = 16
+CAPTION_HEIGHT = 120
+CAPTION_FONT_SIZE = 28
+BACKGROUND = (255, 255, 255)
+BORDER = (0, 0, 0)
+
+
+def _load_font(size: int):
+    try:
+        return ImageFont.load_default(size=size)
+    except TypeError:
+        # Pillow < 10.1 : police bitmap de taille fixe
+        return ImageFont.load_default()
+
+
+def _compose_page(layout: str, panels: List[bytes], caption: Optional[str], fmt: str) -> bytes:
+    """Draw the panels on a page following the layout grid. Runs in a worker process."""
+    (cols, rows), cells = LAYOUT_GRIDS[layout]
+    page = Image.new("RGB", (PAGE_WIDTH, PAGE_HEIGHT), BACKGROUND)
+    draw = ImageDraw.Draw(page)
+
+    grid_height = PAGE_HEIGHT - (CAPTION_HEIGHT if caption else 0)
+    cell_width = (PAGE_WIDTH - GUTTER * (cols + 1)) / cols
+    cell_height = (grid_height - GUTTER * (rows + 1)) / rows
+
+    for data, (col, row, col_span, row_span) in zip(panels, cells):
+        left = int(GUTTER + col * (cell_width + GUTTER))
+        top = int(GUTTER + row * (cell_height + GUTTER))
+        width = int(col_span * cell_width + (col_span - 1) * GUTTER)
+        height = int(row_span * cell_height + (row_span - 1) * GUTTER)
+        panel = Image.open(io.BytesIO(data)).convert("RGB")
+        page.paste(ImageOps.fit(panel, (width, height)), (left, top))
+        draw.rectangle((left, top, left + width - 1, top + height - 1), outline=BORDER, width=3)
+
+    if caption:
+        font = _load_font(CAPTION_FONT_SIZE)
+        top = grid_height
+        draw.rectangle((GUTTER, top, PAGE_WIDTH - GUTTER, PAGE_HEIGHT - GUTTER), fill=BACKGROUND, outline=BORDER, width=3)
+        wrapped = textwrap.fill(caption, width=60)
+        draw.multiline_text((GUTTER * 2, top + GUTTER), wrapped, fill=BORDER, font=font, spacing=6)
+
+    buffer = io.BytesIO()
+    if fmt == "webp":
+        page.save(buffer, "WEBP", quality=80)
+    else:
+        page.save(buffer, "JPEG", quality=85, optimize=True, progressive=True)
+    return buffer.getvalue()
+
+
+class PageCompositor:
+    """Composes a turn's panels into a single page image, in the shared process pool.
+
+    Pages are cached as `<page_id>.page.<ext>`, where the page ID hashes the
+    layout, the panels (including the quality variant they were rendered at)
+    and the caption, so a page URL can be shared and served without Flux.
+    """
+
+    def __init__(self, image_pipeline: ImagePipeline):
+        self.image_pipeline = image_pipeline
+        self.image_cache = image_pipeline.image_cache
+        self._singleflight = SingleFlight("pages")
+        self.composed = 0
+        self.cache_hits = 0
+        self.panels_rendered = 0
+        self.compose_seconds = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return Image is not None
+
+    def choose_format(self, accept: Optional[str]) -> str:
+        """WebP when the client accepts it and Pillow can write it, JPEG otherwise."""
+        if self.enabled and "image/webp" in (accept or "").lower() and features.check("webp"):
+            return "webp"
+        return "jpg"
+
+    @staticmethod
+    def get_page_id(layout: str, panels: List[Tuple[str, Optional[str]]], caption: Optional[str]) -> str:
+        return SingleFlight.make_key("page", layout, panels, caption)[:32]
+
+    async def get_page(self, page_id: str, accept: Optional[str] = None) -> Optional[Tuple[bytes, str]]:
+        """Return a cached page as (bytes, format), preferring what the client accepts."""
+        formats = [self.choose_format(accept), "jpg"]
+        for fmt in dict.fromkeys(formats):
+            data = await self.image_cache.get(page_id, variant="page", ext=fmt)
+            if data is not None:
+                return data, fmt
+        return None
+
+    async def compose_turn(self, prompts: List[str], caption: Optional[str] = None, fmt: str = "jpg", layout_counter: int = 0) -> Tuple[Optional[str], Optional[bytes], Optional[str]]:
+        """Return (page_id, page, error) for a turn's image prompts.
+
+        Panels missing from the cache are rendered first, at the sizes of the
+        layout the client picks with `layout_counter` (GameState.layout_counter).
+        """
+        if not self.enabled:
+            return None, None, "Page composition requires Pillow"
+        prompts = prompts[:len(LAYOUT_GRIDS["LAYOUT_1"][1])]
+        if not prompts:
+            return None, None, "No panels in this turn"
+
+        layout, panel_ids = self.image_pipeline.find_turn_panels(prompts, layout_counter)
+        panels = []
+        for index, (prompt, panel_id) in enumerate(zip(prompts, panel_ids)):
+            data, variant = await self.image_pipeline.load_panel(panel_id)
+            if data is None:
+                width, height = get_layout_panel_size(layout, index)
+                data, error, _ = await self.image_pipeline.render(prompt, width, height)
+                if data is None:
+                    return None, None, error
+                self.panels_rendered += 1
+                data, variant = await self.image_pipeline.load_panel(panel_id)
+            panels.append((panel_id, variant, data))
+
+        page_id = self.get_page_id(layout, [(panel_id, variant) for panel_id, variant, _ in panels], caption)
+        cached = await self.image_cache.get(page_id, variant="page", ext=fmt)
+        if cached is not None:
+            self.cache_hits += 1
+            return page_id, cached, None
+
+        async def render():
+            started = time.perf_counter()
+            loop = asyncio.get_running_loop()
+            page = await loop.run_in_executor(get_process_pool(), _compose_page, layout, [data for _, _, data in panels], caption, fmt)
+            self.compose_seconds += time.perf_counter() - started
+            self.composed += 1
+            await self.image_cache.put(page_id, page, variant="page", ext=fmt)
+            return page
+
+        try:
+            page = await self._singleflight.do(SingleFlight.make_key(page_id, fmt), render)
+        except Exception as e:
+            log.exception("Failed to compose page", page_id=page_id, error=str(e))
+            return None, None, str(e)
+        return page_id, page, None
+
+    def get_stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "composed": self.composed,
+            "cache_hits": self.cache_hits,
+            "panels_rendered": self.panels_rendered,
+            "compose_seconds": round(self.compose_seconds, 3),
+            "avg_compose_seconds": round(self.compose_seconds / self.composed, 3) if self.composed else None,
+        }
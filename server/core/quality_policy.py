@@ -0,0 +1,99 @@
+import time
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from services.flux_client import FluxClient
+from services.metrics import QUALITY_DEGRADATION_LEVEL
+from services.log import get_logger
+
+log = get_logger("quality")
+
+
+class QualityLevel(NamedTuple):
+    level: int
+    max_panels: int
+    resolution_scale: float
+    num_inference_steps: int
+    # Seuils à partir desquels ce niveau s'active
+    min_queue_depth: int
+    min_latency: float
+
+
+# Du plus beau au plus économique
+QUALITY_LEVELS: List[QualityLevel] = [
+    QualityLevel(0, max_panels=4, resolution_scale=1.0, num_inference_steps=5, min_queue_depth=0, min_latency=0.0),
+    QualityLevel(1, max_panels=3, resolution_scale=1.0, num_inference_steps=4, min_queue_depth=4, min_latency=8.0),
+    QualityLevel(2, max_panels=2, resolution_scale=0.75, num_inference_steps=3, min_queue_depth=8, min_latency=15.0),
+    QualityLevel(3, max_panels=1, resolution_scale=0.5, num_inference_steps=2, min_queue_depth=16, min_latency=25.0),
+]
+
+
+class QualityPolicy:
+    """Picks how cheap comics should be rendered based on live Flux load.
+
+    Load is read from the Flux queue depth and the recent render latency. The
+    policy degrades immediately when a threshold is crossed and recovers one
+    level at a time once load has stayed lower for `recovery_period` seconds.
+    """
+
+    def __init__(self, flux_client: FluxClient, recovery_period: float = 30.0, latency_max_age: float = 60.0):
+        self.flux_client = flux_client
+        self.recovery_period = recovery_period
+        self.latency_max_age = latency_max_age
+        self._level = 0
+        self._below_since: Optional[float] = None
+        self.level_changes = 0
+        QUALITY_DEGRADATION_LEVEL.set_function(lambda: self.level)
+
+    @property
+    def level(self) -> int:
+        """Level chosen at the last evaluation, without re-evaluating the load."""
+        return self._level
+
+    def _observed_load(self):
+        limiter = self.flux_client.limiter
+        queue_depth = limiter.queued
+        latency = limiter.avg_service_time or 0.0
+        # Une latence ancienne ne reflète plus la charge actuelle
+        if limiter.last_completed_at is None or time.monotonic() - limiter.last_completed_at > self.latency_max_age:
+            latency = 0.0
+        return queue_depth, latency
+
+    def _target_level(self, queue_depth: int, latency: float) -> int:
+        target = 0
+        for level in QUALITY_LEVELS[1:]:
+            if queue_depth >= level.min_queue_depth or latency >= level.min_latency:
+                target = level.level
+        return target
+
+    def current(self) -> QualityLevel:
+        """Re-evaluate the load and return the active quality level."""
+        target = self._target_level(*self._observed_load())
+        now = time.monotonic()
+
+        if target > self._level:
+            log.warning("Degrading quality", level=self._level, target=target)
+            self._level = target
+            self._below_since = None
+            self.level_changes += 1
+        elif target < self._level:
+            if self._below_since is None:
+                self._below_since = now
+            elif now - self._below_since >= self.recovery_period:
+                log.info("Recovering quality", level=self._level, target=self._level - 1)
+                self._level -= 1
+                self._below_since = now
+                self.level_changes += 1
+        else:
+            self._below_since = None
+
+        return QUALITY_LEVELS[self._level]
+
+    def get_stats(self) -> Dict[str, Any]:
+        queue_depth, latency = self._observed_load()
+        return {
+            "level": self._level,
+            "queue_depth": queue_depth,
+            "latency": round(latency, 3),
+            "level_changes": self.level_changes,
+            **QUALITY_LEVELS[self._level]._asdict(),
+        }
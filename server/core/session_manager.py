@@ -2,6 +2,10 @@ from typing import Dict, Optional
 from datetime import datetime, timedelta
 import time
 from .game_state import GameState
+from services.metrics import LIVE_SESSIONS, SESSIONS_CREATED
+from services.log import get_logger
+
+log = get_logger("session")
 
 class SessionManager:
     _instance = None
@@ -19,6 +23,7 @@ class SessionManager:
             self.sessions: Dict[str, GameState] = {}
             self.last_activity: Dict[str, float] = {}
             self.session_timeout = session_timeout
+            LIVE_SESSIONS.set_function(lambda: len(self.sessions))
             self._initialized = True
     
     def create_session(self, session_id: str, game_state: GameState = None):
@@ -31,12 +36,12 @@ class SessionManager:
         Returns:
             GameState: The newly created game state
         """
-        print(f"Creating session {session_id} in SessionManager singleton")
         if game_state is None:
             game_state = GameState()
         self.sessions[session_id] = game_state
         self.last_activity[session_id] = time.time()
-        print(f"Current sessions in SessionManager: {list(self.sessions.keys())}")
+        SESSIONS_CREATED.inc()
+        log.info("Session created", session_id=session_id, sessions=len(self.sessions))
         return game_state
     
     def get_session(self, session_id: str) -> GameState | None:
@@ -48,22 +53,19 @@ class SessionManager:
         Returns:
             GameState | None: The game state if found and not expired, None otherwise
         """
-        print(f"Getting session {session_id} from SessionManager singleton")
-        print(f"Current sessions in SessionManager: {list(self.sessions.keys())}")
-        
         if session_id in self.sessions:
             # Check if session has expired
             if time.time() - self.last_activity[session_id] > self.session_timeout:
-                print(f"Session {session_id} has expired")
+                log.info("Session expired", session_id=session_id)
                 self.cleanup_session(session_id)
                 return None
             
             # Update last activity time
             self.last_activity[session_id] = time.time()
-            print(f"Session {session_id} found and active")
+            log.debug("Session found", session_id=session_id)
             return self.sessions[session_id]
             
-        print(f"Session {session_id} not found")
+        log.info("Session not found", session_id=session_id)
         return None
     
     def cleanup_session(self, session_id: str):
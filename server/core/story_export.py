@@ -0,0 +1,239 @@
+import asyncio
+import io
+import struct
+import time
+import zipfile
+from typing import AsyncIterator, List, Optional, Tuple
+from xml.sax.saxutils import escape
+
+from api.models import StoryResponse
+from core.image_pipeline import ImagePipeline
+from services.log import get_logger
+
+log = get_logger("export")
+
+# Pillow (dépendance du projet) ne sert qu'à convertir les panneaux qui ne sont pas en JPEG
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+EXPORT_FORMATS = {
+    "cbz": "application/vnd.comicbook+zip",
+    "pdf": "application/pdf",
+}
+
+# Marqueurs SOF (Start Of Frame) portant les dimensions d'un JPEG
+_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+_PDF_COLOR_SPACES = {1: "DeviceGray", 3: "DeviceRGB", 4: "DeviceCMYK"}
+
+
+def jpeg_info(data: bytes) -> Optional[Tuple[int, int, int]]:
+    """(width, height, components) read from the JPEG header, None if not a JPEG."""
+    if data[:2] != b"\xff\xd8":
+        return None
+    pos = 2
+    while pos + 4 <= len(data):
+        if data[pos] != 0xFF:
+            return None
+        marker = data[pos + 1]
+        if marker == 0xFF:
+            pos += 1
+            continue
+        length = struct.unpack(">H", data[pos + 2:pos + 4])[0]
+        if marker in _SOF_MARKERS:
+            height, width = struct.unpack(">HH", data[pos + 5:pos + 9])
+            return width, height, data[pos + 9]
+        pos += 2 + length
+    return None
+
+
+def _to_jpeg(data: bytes) -> Optional[bytes]:
+    if Image is None:
+        return None
+    buffer = io.BytesIO()
+    Image.open(io.BytesIO(data)).convert("RGB").save(buffer, "JPEG", quality=90)
+    return buffer.getvalue()
+
+
+class _ChunkSink:
+    """Write-only, non-seekable file object: zipfile writes into it and we drain it."""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._position = 0
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+class _PdfWriter:
+    """Minimal PDF writer with one full-bleed JPEG per page.
+
+    JPEGs are embedded as-is (DCTDecode), and objects are emitted as soon as
+    they are complete; only the xref offsets and page references are kept.
+    """
+
+    CATALOG = 1
+    PAGES = 2
+
+    def __init__(self):
+        self._offset = 0
+        self._xref: dict = {}
+        self._next_object = 3
+        self._pages: List[int] = []
+
+    def _emit(self, data: bytes) -> bytes:
+        self._offset += len(data)
+        return data
+
+    def _object(self, number: int, body: bytes, stream: Optional[bytes] = None) -> bytes:
+        self._xref[number] = self._offset
+        data = f"{number} 0 obj\n".encode() + body
+        if stream is not None:
+            data += b"\nstream\n" + stream + b"\nendstream"
+        return self._emit(data + b"\nendobj\n")
+
+    def header(self) -> bytes:
+        return self._emit(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+
+    def add_page(self, jpeg: bytes) -> bytes:
+        width, height, components = jpeg_info(jpeg)
+        image, content, page = self._next_object, self._next_object + 1, self._next_object + 2
+        self._next_object += 3
+        self._pages.append(page)
+
+        drawing = f"q {width} 0 0 {height} 0 0 cm /Im0 Do Q".encode()
+        return b"".join([
+            self._object(image, (
+                f"<< /Type /XObject /Subtype /Image /Width {width} /Height {height} "
+                f"/ColorSpace /{_PDF_COLOR_SPACES.get(components, 'DeviceRGB')} /BitsPerComponent 8 "
+                f"/Filter /DCTDecode /Length {len(jpeg)} >>"
+            ).encode(), jpeg),
+            self._object(content, f"<< /Length {len(drawing)} >>".encode(), drawing),
+            self._object(page, (
+                f"<< /Type /Page /Parent {self.PAGES} 0 R /MediaBox [0 0 {width} {height}] "
+                f"/Resources << /XObject << /Im0 {image} 0 R >> >> /Contents {content} 0 R >>"
+            ).encode()),
+        ])
+
+    def trailer(self, title: str) -> bytes:
+        kids = " ".join(f"{page} 0 R" for page in self._pages)
+        info = self._next_object
+        title = title.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+        data = b"".join([
+            self._object(self.PAGES, f"<< /Type /Pages /Kids [{kids}] /Count {len(self._pages)} >>".encode()),
+            self._object(self.CATALOG, f"<< /Type /Catalog /Pages {self.PAGES} 0 R >>".encode()),
+            self._object(info, f"<< /Title ({title}) /Producer (Echoes of Influence) >>".encode("latin-1", "replace")),
+        ])
+        xref_offset = self._offset
+        entries = [b"0000000000 65535 f \n"] + [b"%010d 00000 n \n" % self._xref[number] for number in range(1, info + 1)]
+        return data + self._emit(
+            f"xref\n0 {info + 1}\n".encode() + b"".join(entries)
+            + f"trailer\n<< /Size {info + 1} /Root {self.CATALOG} 0 R /Info {info} 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n".encode()
+        )
+
+
+class StoryExporter:
+    """Streams a finished story as a CBZ or PDF, one panel at a time.
+
+    Only the panel being written is held in memory, whatever the story
+    length, so concurrent exports don't grow the process RSS. Panels are read
+    from the image cache and never re-rendered; missing ones are skipped.
+    """
+
+    def __init__(self, image_pipeline: ImagePipeline):
+        self.image_pipeline = image_pipeline
+        self.exports = 0
+        self.in_progress = 0
+        self.bytes_sent = 0
+        self.panels_exported = 0
+        self.panels_missing = 0
+        self.export_seconds = 0.0
+
+    async def _iter_panels(self, story_history: List[StoryResponse]) -> AsyncIterator[Tuple[str, bytes]]:
+        """(entry name, JPEG bytes) for every cached panel, in reading order."""
+        for turn, story in enumerate(story_history, start=1):
+            _, panel_ids = self.image_pipeline.find_turn_panels(story.image_prompts)
+            for index, panel_id in enumerate(panel_ids, start=1):
+                data, _ = await self.image_pipeline.load_panel(panel_id)
+                jpeg = data
+                if data is not None and jpeg_info(data) is None:
+                    try:
+                        jpeg = await asyncio.to_thread(_to_jpeg, data)
+                    except Exception as e:
+                        # Panneau corrompu ou tronqué dans le cache : on l'omet, l'export continue
+                        log.warning("Skipping unreadable panel", panel_id=panel_id, error=str(e))
+                        jpeg = None
+                if jpeg is None:
+                    self.panels_missing += 1
+                    continue
+                self.panels_exported += 1
+                yield f"{turn:03d}-{index:02d}.jpg", jpeg
+
+    @staticmethod
+    def _comic_info(story_history: List[StoryResponse], title: str) -> str:
+        summary = "\n\n".join(story.story_text.replace("**", "") for story in story_history)
+        return (
+            '<?xml version="1.0" encoding="utf-8"?>\n'
+            "<ComicInfo>\n"
+            f"  <Title>{escape(title)}</Title>\n"
+            f"  <Summary>{escape(summary)}</Summary>\n"
+            "</ComicInfo>\n"
+        )
+
+    async def stream_cbz(self, story_history: List[StoryResponse], title: str) -> AsyncIterator[bytes]:
+        sink = _ChunkSink()
+        # Les JPEG sont déjà compressés : stockés tels quels
+        with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_STORED) as archive:
+            archive.writestr("ComicInfo.xml", self._comic_info(story_history, title), compress_type=zipfile.ZIP_DEFLATED)
+            yield sink.drain()
+            async for name, jpeg in self._iter_panels(story_history):
+                archive.writestr(name, jpeg)
+                yield sink.drain()
+        yield sink.drain()
+
+    async def stream_pdf(self, story_history: List[StoryResponse], title: str) -> AsyncIterator[bytes]:
+        writer = _PdfWriter()
+        yield writer.header()
+        async for _, jpeg in self._iter_panels(story_history):
+            yield writer.add_page(jpeg)
+        yield writer.trailer(title)
+
+    async def stream(self, story_history: List[StoryResponse], fmt: str, title: str = "Echoes of Influence") -> AsyncIterator[bytes]:
+        """Export chunks in `fmt` ("cbz" or "pdf")."""
+        stream = self.stream_cbz if fmt == "cbz" else self.stream_pdf
+        started = time.perf_counter()
+        self.in_progress += 1
+        try:
+            async for chunk in stream(story_history, title):
+                if chunk:
+                    self.bytes_sent += len(chunk)
+                    yield chunk
+            self.exports += 1
+        finally:
+            self.in_progress -= 1
+            self.export_seconds += time.perf_counter() - started
+
+    def get_stats(self) -> dict:
+        return {
+            "exports": self.exports,
+            "in_progress": self.in_progress,
+            "bytes_sent": self.bytes_sent,
+            "panels_exported": self.panels_exported,
+            "panels_missing": self.panels_missing,
+            "export_seconds": round(self.export_seconds, 3),
+        }
@@ -1,11 +1,19 @@
-from typing import List, Dict
+from functools import partial
+from typing import List, Dict, Optional
 from core.constants import GameConfig
 from services.mistral_client import MistralClient
 from api.models import StoryResponse, Choice
-from core.generators.story_segment_generator import StorySegmentGenerator
+from core.generators.story_segment_generator import StorySegmentGenerator, TokenCallback
 from core.generators.image_prompt_generator import ImagePromptGenerator
 from core.generators.metadata_generator import MetadataGenerator
 from core.game_state import GameState
+from core.quality_policy import QualityPolicy
+from core.image_pipeline import ImagePipeline
+from core.narration import NarrationPrefetcher
+from core.layouts import get_panel_size
+from services.priority_limiter import Priority
+from services.metrics import time_stage
+from services.token_usage import get_token_usage
 import random
 from core.constants import GameConfig
 
@@ -19,7 +27,7 @@ class StoryGenerator:
             cls._instance._initialized = False
         return cls._instance
     
-    def __init__(self, api_key: str, model_name: str = "mistral-small"):
+    def __init__(self, api_key: str, model_name: str = "mistral-small", quality_policy: QualityPolicy = None, image_pipeline: ImagePipeline = None, narration: NarrationPrefetcher = None):
         if not self._initialized:
             print("Initializing StoryGenerator singleton")
             self.api_key = api_key
@@ -36,6 +44,12 @@ class StoryGenerator:
             self.image_prompt_generator = None  # Will be initialized with the first universe style
             self.metadata_generator = None  # Will be initialized with hero description
             self.segment_generators: Dict[str, StorySegmentGenerator] = {}
+            # Réduit le nombre de panneaux quand Flux est surchargé
+            self.quality_policy = quality_policy
+            # Si défini, les panneaux sont rendus dès que leur prompt est écrit par le LLM
+            self.image_pipeline = image_pipeline
+            # Si défini, la narration est synthétisée pendant la génération des métadonnées et des prompts
+            self.narration = narration
             self._initialized = True
 
     def create_segment_generator(self, session_id: str, style: dict, genre: str, epoch: str, base_story: str, macguffin: str, hero_name: str, hero_desc: str):
@@ -97,48 +111,87 @@ class StoryGenerator:
             raise RuntimeError(f"No story segment generator found for session {session_id}. Generate a universe first.")
         return self.segment_generators[session_id]
 
-    async def generate_story_segment(self, session_id: str, game_state: GameState, previous_choice: str) -> StoryResponse:
+    async def _start_panel_render(self, panel_index: int, prompt: str, panel_count: int, layout_counter: int = 0, panel_ids: Optional[List[str]] = None):
+        """Render a panel while the LLM is still writing the next ones.
+
+        Panel sizes follow the layout the client will pick for this turn; the
+        client's request for the same panel then joins this render.
+        """
+        width, height = get_panel_size(panel_count, panel_index, layout_counter)
+        priority = Priority.FIRST_PANEL if panel_index == 0 else Priority.PANEL
+        panel_id = self.image_pipeline.prefetch(prompt, width, height, priority)
+        if panel_ids is not None:
+            panel_ids.append(panel_id)
+
+    def _cancel_panel_renders(self, panel_ids: List[str]):
+        """Drop the renders started for prompts that won't be shown."""
+        for panel_id in panel_ids:
+            self.image_pipeline.cancel_prefetch(panel_id)
+        panel_ids.clear()
+
+    async def generate_story_segment(self, session_id: str, game_state: GameState, previous_choice: str, on_token: Optional[TokenCallback] = None) -> StoryResponse:
         try:
             # On utilise toujours le générateur de segments, même pour un choix personnalisé
             segment_generator = self.get_segment_generator(session_id)
             if not segment_generator:
                 raise ValueError("No story segment generator found for this session")
             
+            # Session au-delà de son quota de tokens : historique et panneaux réduits
+            degraded = get_token_usage().should_degrade(session_id)
+            story_history = game_state.format_history(max_segments=1 if degraded else 4)
+
             if(game_state.story_beat == GameConfig.STORY_BEAT_INTRO):
                 story_text = game_state.universe_story
             else:
-                segment_response = await segment_generator.generate(
-                    story_beat=game_state.story_beat,
+                with time_stage("segment"):
+                    segment_response = await segment_generator.generate(
+                        story_beat=game_state.story_beat,
+                        current_time=game_state.current_time,
+                        current_location=game_state.current_location,
+                        previous_choice=previous_choice,
+                        story_history=story_history,
+                        turn_before_end=self.turn_before_end,
+                        is_winning_story=self.is_winning_story,
+                        on_token=on_token
+                    )
+                story_text = segment_response.story_text
+
+            if self.narration:
+                self.narration.presynthesize(session_id, story_text)
+
+            # Then get metadata using the new story text
+            with time_stage("metadata"):
+                metadata_response = await self.metadata_generator.generate(
+                    story_text=story_text,
                     current_time=game_state.current_time,
                     current_location=game_state.current_location,
-                    previous_choice=previous_choice,
-                    story_history=game_state.format_history(),
+                    story_beat=game_state.story_beat,
                     turn_before_end=self.turn_before_end,
-                    is_winning_story=self.is_winning_story
+                    is_winning_story=self.is_winning_story,
+                    story_history=story_history
                 )
-                story_text = segment_response.story_text
-
-            # Then get metadata using the new story text
-            metadata_response = await self.metadata_generator.generate(
-                story_text=story_text,
-                current_time=game_state.current_time,
-                current_location=game_state.current_location,
-                story_beat=game_state.story_beat,
-                turn_before_end=self.turn_before_end,
-                is_winning_story=self.is_winning_story,
-                story_history=game_state.format_history()
-            )
             
             # Generate image prompts
-            prompts_response = await self.image_prompt_generator.generate(
-                story_text=story_text,
-                time=metadata_response.time,
-                location=metadata_response.location,
-                is_death=metadata_response.is_death,
-                is_victory=metadata_response.is_victory,
-                turn_before_end=self.turn_before_end,
-                is_winning_story=self.is_winning_story
-            )
+            quality = self.quality_policy.current() if self.quality_policy else None
+            max_panels = quality.max_panels if quality else GameConfig.MAX_PANELS
+            # Le premier tour n'affiche qu'un seul panneau
+            if game_state.story_beat == GameConfig.STORY_BEAT_INTRO or degraded:
+                max_panels = 1
+            # Rendus lancés pendant le streaming, annulés si les prompts sont régénérés
+            prefetched: List[str] = []
+            with time_stage("image_prompts"):
+                prompts_response = await self.image_prompt_generator.generate(
+                    story_text=story_text,
+                    time=metadata_response.time,
+                    location=metadata_response.location,
+                    is_death=metadata_response.is_death,
+                    is_victory=metadata_response.is_victory,
+                    turn_before_end=self.turn_before_end,
+                    is_winning_story=self.is_winning_story,
+                    max_panels=max_panels,
+                    on_prompt=partial(self._start_panel_render, layout_counter=game_state.story_beat, panel_ids=prefetched) if self.image_pipeline else None,
+                    on_discard=partial(self._cancel_panel_renders, prefetched) if self.image_pipeline else None
+                )
             
             # Create choices
             choices = [
@@ -156,7 +209,8 @@ class StoryGenerator:
                 is_first_step=(game_state.story_beat == GameConfig.STORY_BEAT_INTRO),
                 is_death=metadata_response.is_death,
                 is_victory=metadata_response.is_victory,
-                previous_choice=previous_choice
+                previous_choice=previous_choice,
+                degradation_level=quality.level if quality else 0
             )
             
             # Add the response to game state history
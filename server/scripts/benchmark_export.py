@@ -0,0 +1,99 @@
+"""Throughput and memory of the streaming CBZ/PDF export on long synthetic stories.
+
+Usage:
+    python scripts/benchmark_export.py --turns 60 --concurrency 20 --format cbz
+
+Each export is drained chunk by chunk, as the HTTP response would be; peak
+memory is the peak of Python allocations (tracemalloc) while exports run.
+`--buffered` joins each export in memory instead, for comparison.
+"""
+import argparse
+import asyncio
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+# Add server directory to PYTHONPATH
+server_dir = Path(__file__).parent.parent
+sys.path.append(str(server_dir))
+
+from api.models import Choice, StoryResponse
+from core.image_pipeline import ImagePipeline
+from core.layouts import get_panel_size
+from core.story_export import StoryExporter
+from services.image_cache import ImageCache
+from scripts.fake_servers import render_jpeg
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the streaming story export")
+    parser.add_argument("--turns", type=int, default=60, help="Turns per story (default: 60)")
+    parser.add_argument("--panels", type=int, default=4, help="Panels per turn (default: 4)")
+    parser.add_argument("--concurrency", type=int, default=20, help="Concurrent exports (default: 20)")
+    parser.add_argument("--format", choices=["cbz", "pdf"], default="cbz")
+    parser.add_argument("--buffered", action="store_true", help="Join each export in memory instead of streaming")
+    return parser.parse_args()
+
+
+async def build_story(image_pipeline: ImagePipeline, turns: int, panels: int):
+    """Synthetic story whose panels are all in the image cache."""
+    story_history = []
+    for turn in range(turns):
+        prompts = [f"turn {turn} panel {index}" for index in range(panels)]
+        for index, prompt in enumerate(prompts):
+            width, height = get_panel_size(panels, index)
+            panel_id = image_pipeline.get_panel_id(prompt, width, height)
+            await image_pipeline.image_cache.put(panel_id, render_jpeg(width, height))
+        story_history.append(StoryResponse(
+            previous_choice="none" if turn == 0 else "Go left",
+            story_text=f"Turn {turn}: Sarah pushes deeper into the ruins.",
+            choices=[Choice(id=1, text="Go left"), Choice(id=2, text="Go right")],
+            raw_choices=["Go left", "Go right"],
+            time="18:00",
+            location="Ruins",
+            image_prompts=prompts,
+            is_first_step=turn == 0,
+            is_death=turn == turns - 1
+        ))
+    return story_history
+
+
+async def export(story_exporter: StoryExporter, story_history, fmt: str, buffered: bool) -> int:
+    if buffered:
+        return len(b"".join([chunk async for chunk in story_exporter.stream(story_history, fmt)]))
+    size = 0
+    async for chunk in story_exporter.stream(story_history, fmt):
+        size += len(chunk)
+    return size
+
+
+async def main():
+    args = parse_args()
+    with tempfile.TemporaryDirectory() as cache_dir:
+        image_pipeline = ImagePipeline(flux_client=None, image_cache=ImageCache(cache_dir))
+        story_exporter = StoryExporter(image_pipeline)
+        story_history = await build_story(image_pipeline, args.turns, args.panels)
+
+        tracemalloc.start()
+        started = time.perf_counter()
+        sizes = await asyncio.gather(*[
+            export(story_exporter, story_history, args.format, args.buffered)
+            for _ in range(args.concurrency)
+        ])
+        elapsed = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    total = sum(sizes)
+    print(f"Format: {args.format} ({'buffered' if args.buffered else 'streaming'})")
+    print(f"Story: {args.turns} turns x {args.panels} panels, export size {sizes[0] / 1e6:.1f} MB")
+    print(f"Exports: {args.concurrency} concurrent in {elapsed:.2f}s ({total / 1e6 / elapsed:.1f} MB/s)")
+    print(f"Peak Python allocations: {peak / 1e6:.1f} MB ({peak / 1e6 / args.concurrency:.2f} MB per export)")
+    print(f"Max RSS: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.1f} MB")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,354 @@
+"""CPU cost of the per-turn hot paths: prompt rendering, history formatting, LLM output parsing.
+
+Usage:
+    python scripts/benchmark_hot_paths.py
+    python scripts/benchmark_hot_paths.py --compare scripts/benchmark_hot_paths_baseline.json
+    python scripts/benchmark_hot_paths.py --rounds 50 --save scripts/benchmark_hot_paths_baseline.json
+    python scripts/benchmark_hot_paths.py --compare baseline.json --max-regression 20
+    python scripts/benchmark_hot_paths.py --filter metadata --rounds 50
+
+Each benchmark is calibrated like pytest-benchmark: a round runs the code
+enough times to last `--min-time`, `--rounds` rounds are timed and their
+min/median/mean/stddev reported per call. The parsers run over a corpus of
+realistic and malformed model outputs (markdown fences, prompt comments
+copied into the JSON, truncated streams, prose around the JSON...); every
+case declares whether it must parse or raise, and a case that changes
+outcome fails the run before anything is timed.
+
+"CPU per turn" adds up the medians of what one /api/chat turn runs on the
+event loop. With `--compare`, the run fails (exit code 1) when a benchmark
+or the per-turn total is more than `--max-regression` percent slower than
+the saved baseline. Timings are wall-clock on an idle machine: compare runs
+from the same host.
+
+scripts/benchmark_hot_paths_baseline.json is the reference baseline, saved
+with `--rounds 50` (its machine_info says where). Before using it as a gate on
+another machine, re-save it there from the base branch, then run `--compare`
+on the change; commit a refreshed baseline together with any intended
+speed-up or slowdown of the hot paths.
+"""
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+# Add server directory to PYTHONPATH
+server_dir = Path(__file__).parent.parent
+sys.path.append(str(server_dir))
+
+from api.models import Choice, StoryResponse
+from core.game_state import GameState
+from core.generators.image_prompt_generator import ImagePromptGenerator
+from core.generators.metadata_generator import MetadataGenerator
+from core.generators.story_segment_generator import StorySegmentGenerator, cut_at_word_budget
+from core.incremental_json import IncrementalStringArrayParser
+from core.prompts.formatting_rules import FORMATTING_RULES
+from services.log import setup_logging, shutdown_logging
+
+HERO_NAME = "Sarah"
+HERO_DESC = "Sarah, a young woman in her late 20s with short dark hair, wearing a worn leather jacket and carrying a compass"
+UNIVERSE_STORY = (
+    "In the drowned city of Vel Arath, where canals have replaced the streets, the clockmakers' guild "
+    "keeps time for the whole world. When the Great Clock stops at midnight, Sarah, a disgraced apprentice, "
+    "must find the Secret Formula before the tide swallows the last dry quarter."
+) * 2
+
+STORY_TEXT = "Sarah pries open the flooded vault; inside, a ticking brass heart glows beneath the water."
+
+METADATA = {
+    "is_death": False,
+    "is_victory": False,
+    "time": "23:40",
+    "location": "Flooded guild vault",
+    "choices": ["Grab the brass heart", "Follow the ticking upstream"],
+}
+IMAGE_PROMPTS = [
+    "low angle shot of Sarah wading into a flooded vault, lantern light rippling on the walls",
+    "close-up of a brass heart ticking beneath the dark water, gears glowing amber",
+    "medium shot of Sarah's hand hesitating above the surface, reflections of the Great Clock",
+    "wide shot of the drowned guild hall, a shadow moving behind the flooded arches",
+]
+
+# (cas, sortie du modèle, doit parser)
+METADATA_CORPUS = [
+    ("valid", json.dumps(METADATA, indent=2), True),
+    ("compact", json.dumps(METADATA), True),
+    ("commented", """{
+    "is_death": false,  # Set to true for death scenes
+    "is_victory": false,  # Set to true for victory scenes
+    "time": "23:40",
+    "location": "Flooded guild vault",
+    "choices": ["Grab the brass heart", "Follow the ticking upstream"]  # ALWAYS exactly two choices
+}""", True),
+    ("escaped", json.dumps(METADATA, indent=2).replace("Flooded", "Flooded\\u00a0"), True),
+    ("fenced", "```json\n" + json.dumps(METADATA, indent=2) + "\n```", False),
+    ("prose", "Here is the metadata for this segment:\n" + json.dumps(METADATA, indent=2), False),
+    ("three_choices", json.dumps({**METADATA, "choices": ["Grab it", "Run", "Hide in the arches"]}), False),
+    ("missing_field", json.dumps({key: value for key, value in METADATA.items() if key != "location"}), False),
+    ("truncated", json.dumps(METADATA, indent=2)[:90], False),
+]
+
+SEGMENT_CORPUS = [
+    ("json", json.dumps({"story_text": STORY_TEXT}), True),
+    ("plain", STORY_TEXT, True),
+    ("quoted", f'"{STORY_TEXT}"', False),
+    ("dialogue", 'Sarah whispers "not yet" as the brass heart ticks louder beneath the water.', True),
+    ("fenced", "```json\n" + json.dumps({"story_text": STORY_TEXT}, indent=2) + "\n```", True),
+    ("prose", "Sure! Here is the next segment: " + json.dumps({"story_text": STORY_TEXT}), True),
+    ("truncated", '{"story_text": "Sarah pries open the flooded vault; inside, a ticking', False),
+    ("long", " ".join([STORY_TEXT] * 8), True),
+]
+
+IMAGE_PROMPTS_CORPUS = [
+    ("valid", json.dumps({"image_prompts": IMAGE_PROMPTS}, indent=2), True),
+    ("single", json.dumps({"image_prompts": IMAGE_PROMPTS[:1]}), True),
+    ("fenced", "```json\n" + json.dumps({"image_prompts": IMAGE_PROMPTS}, indent=2) + "\n```", True),
+    ("prose_list", "Panels:\n" + "\n".join(f'{index}. "{prompt}"' for index, prompt in enumerate(IMAGE_PROMPTS, 1)), True),
+    # Repli sur les chaînes entre guillemets : la clé devient un prompt
+    ("truncated", json.dumps({"image_prompts": IMAGE_PROMPTS})[:-40], True),
+    ("python_dict", str({"image_prompts": IMAGE_PROMPTS}), False),
+    ("too_many", json.dumps({"image_prompts": IMAGE_PROMPTS + IMAGE_PROMPTS[:1]}), False),
+    ("empty", json.dumps({"image_prompts": []}), False),
+    ("no_prompts", "I cannot describe this scene.", False),
+]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the CPU hot paths of a turn")
+    parser.add_argument("--rounds", type=int, default=20, help="Timed rounds per benchmark (default: 20)")
+    parser.add_argument("--min-time", type=float, default=0.005, help="Minimum duration of a round in seconds (default: 0.005)")
+    parser.add_argument("--history", type=int, default=12, help="Turns in the game history (default: 12)")
+    parser.add_argument("--filter", help="Only run benchmarks whose name contains this")
+    parser.add_argument("--save", help="Write the results to this JSON file")
+    parser.add_argument("--compare", help="Baseline JSON file written by --save")
+    parser.add_argument("--max-regression", type=float, default=20.0, help="Allowed slowdown over the baseline median, in percent (default: 20)")
+    return parser.parse_args()
+
+
+def make_story_response(turn: int) -> StoryResponse:
+    return StoryResponse(
+        previous_choice="none" if turn == 0 else METADATA["choices"][turn % 2],
+        story_text=f"Turn {turn}: {STORY_TEXT}",
+        choices=[Choice(id=index, text=text) for index, text in enumerate(METADATA["choices"], 1)],
+        raw_choices=METADATA["choices"],
+        time=METADATA["time"],
+        location=METADATA["location"],
+        image_prompts=IMAGE_PROMPTS,
+        is_first_step=turn == 0
+    )
+
+
+def tokens(text: str, size: int = 4) -> List[str]:
+    """Model output cut into stream chunks of about `size` characters."""
+    return [text[index:index + size] for index in range(0, len(text), size)]
+
+
+def stream_segment(chunks: List[str]) -> str:
+    """StorySegmentGenerator._stream_text without the network: the word budget check on every token."""
+    text = ""
+    for chunk in chunks:
+        text += chunk
+        cut = cut_at_word_budget(text, StorySegmentGenerator.WORD_BUDGET)
+        if cut is not None:
+            return cut
+    return text
+
+
+def stream_image_prompts(generator: ImagePromptGenerator, chunks: List[str]) -> int:
+    """ImagePromptGenerator._generate_streaming without the network: incremental parse, then the full parse."""
+    parser = IncrementalStringArrayParser(key="image_prompts")
+    content = ""
+    for chunk in chunks:
+        content += chunk
+        for prompt in parser.feed(chunk):
+            generator._format_prompt(generator._add_hero_description(prompt), METADATA["time"], METADATA["location"])
+    return len(generator._custom_parser(content).image_prompts)
+
+
+def outcome(fn: Callable[[], object]) -> bool:
+    try:
+        fn()
+        return True
+    except ValueError:
+        return False
+
+
+def parser_benchmarks(prefix: str, parse: Callable[[str], object], corpus, check: bool = True) -> Dict[str, Callable[[], object]]:
+    benchmarks = {}
+    for case, content, parses in corpus:
+        if check and outcome(lambda: parse(content)) != parses:
+            raise SystemExit(f"{prefix}[{case}] should {'parse' if parses else 'raise ValueError'}, it doesn't")
+        if parses:
+            benchmarks[f"{prefix}[{case}]"] = lambda content=content: parse(content)
+        else:
+            benchmarks[f"{prefix}[{case}]"] = lambda content=content: outcome(lambda: parse(content))
+    return benchmarks
+
+
+def build_benchmarks(history_turns: int) -> Dict[str, Callable[[], object]]:
+    segment_generator = StorySegmentGenerator(
+        None, universe_style="Franco-Belgian", universe_genre="Steampunk", universe_epoch="Victorian",
+        universe_story=UNIVERSE_STORY, universe_macguffin="The Secret Formula", hero_name=HERO_NAME, hero_desc=HERO_DESC
+    )
+    metadata_generator = MetadataGenerator(None, hero_name=HERO_NAME, hero_desc=HERO_DESC)
+    image_prompt_generator = ImagePromptGenerator(
+        None, artist_style="Moebius", hero_name=HERO_NAME, hero_desc=HERO_DESC,
+        universe_style="Franco-Belgian", universe_genre="Steampunk", universe_epoch="Victorian"
+    )
+
+    game_state = GameState()
+    game_state.set_universe("Franco-Belgian", "Steampunk", "Victorian", UNIVERSE_STORY)
+    for turn in range(history_turns):
+        game_state.add_to_history(make_story_response(turn))
+    story_history = game_state.format_history()
+
+    segment_chunks = tokens(" ".join([STORY_TEXT] * 3))
+    image_prompt_chunks = tokens(json.dumps({"image_prompts": IMAGE_PROMPTS}, indent=2))
+    story_response = make_story_response(1).model_dump()
+
+    benchmarks = {
+        "history.format": lambda: game_state.format_history(max_segments=4),
+        "prompt.segment": lambda: segment_generator.prompt.format_messages(
+            hero_description=HERO_DESC, FORMATTING_RULES=FORMATTING_RULES, story_beat=3,
+            current_time=METADATA["time"], current_location=METADATA["location"],
+            previous_choice=METADATA["choices"][0], story_history=story_history, what_to_represent="",
+            universe_style="Franco-Belgian", universe_genre="Steampunk", universe_epoch="Victorian",
+            universe_macguffin="The Secret Formula"
+        ),
+        "prompt.metadata": lambda: metadata_generator.prompt.format_messages(
+            story_text=STORY_TEXT, current_time=METADATA["time"], current_location=METADATA["location"],
+            story_beat=3, error_feedback="", is_end="", turn_before_end=8, is_winning_story=False,
+            story_history=story_history
+        ),
+        "prompt.image_prompts": lambda: image_prompt_generator.prompt.format_messages(
+            story_text=STORY_TEXT, is_death=False, is_victory=False, is_end="", how_many_panels=3
+        ),
+        "segment.stream": lambda: stream_segment(segment_chunks),
+        "image_prompts.stream": lambda: stream_image_prompts(image_prompt_generator, image_prompt_chunks),
+        "story_response.validate": lambda: StoryResponse(**story_response),
+    }
+    benchmarks.update(parser_benchmarks("metadata.parse", metadata_generator._custom_parser, METADATA_CORPUS))
+    benchmarks.update(parser_benchmarks("segment.clean", segment_generator._clean_and_fix_response, SEGMENT_CORPUS, check=False))
+    benchmarks.update(parser_benchmarks("segment.parse", segment_generator._custom_parser, SEGMENT_CORPUS))
+    benchmarks.update(parser_benchmarks("image_prompts.parse", image_prompt_generator._custom_parser, IMAGE_PROMPTS_CORPUS))
+    return benchmarks
+
+
+# Ce qu'un tour de /api/chat exécute sur la boucle (segment et prompts d'images en streaming)
+TURN = (
+    "history.format",
+    "prompt.segment",
+    "segment.stream",
+    "prompt.metadata",
+    "metadata.parse[valid]",
+    "prompt.image_prompts",
+    "image_prompts.stream",
+    "story_response.validate",
+)
+
+
+def run_benchmark(fn: Callable[[], object], rounds: int, min_time: float) -> dict:
+    """Per-call timings in seconds, pytest-benchmark style."""
+    iterations = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(iterations):
+            fn()
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time:
+            break
+        iterations = max(iterations * 2, int(iterations * min_time / max(elapsed, 1e-9)))
+
+    timings = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        for _ in range(iterations):
+            fn()
+        timings.append((time.perf_counter() - started) / iterations)
+    median = statistics.median(timings)
+    return {
+        "min": min(timings),
+        "max": max(timings),
+        "mean": statistics.mean(timings),
+        "stddev": statistics.stdev(timings) if len(timings) > 1 else 0.0,
+        "median": median,
+        "rounds": rounds,
+        "iterations": iterations,
+        "ops": 1 / median if median else None,
+    }
+
+
+def turn_total(results: Dict[str, dict]) -> Optional[float]:
+    if not all(name in results for name in TURN):
+        return None
+    return sum(results[name]["median"] for name in TURN)
+
+
+def compare(results: Dict[str, dict], per_turn: Optional[float], baseline: dict, max_regression: float) -> List[str]:
+    """Benchmarks slower than the baseline by more than `max_regression` percent."""
+    previous = {benchmark["name"]: benchmark["stats"]["median"] for benchmark in baseline["benchmarks"]}
+    if per_turn is not None and baseline.get("per_turn"):
+        previous["CPU per turn"] = baseline["per_turn"]
+    current = {name: stats["median"] for name, stats in results.items()}
+    if per_turn is not None:
+        current["CPU per turn"] = per_turn
+
+    regressions = []
+    for name, median in current.items():
+        if name not in previous:
+            continue
+        change = (median / previous[name] - 1) * 100
+        if change > max_regression:
+            regressions.append(f"{name}: {previous[name] * 1e6:.1f}us -> {median * 1e6:.1f}us (+{change:.0f}%)")
+    return regressions
+
+
+def main():
+    args = parse_args()
+    # Comme en production : les avertissements des parseurs passent par la file de logs
+    with open("/dev/null" if sys.platform != "win32" else "nul", "w") as devnull:
+        setup_logging(level="INFO", stream=devnull)
+        try:
+            benchmarks = build_benchmarks(args.history)
+            if args.filter:
+                benchmarks = {name: fn for name, fn in benchmarks.items() if args.filter in name}
+            results = {name: run_benchmark(fn, args.rounds, args.min_time) for name, fn in benchmarks.items()}
+        finally:
+            shutdown_logging()
+
+    print(f"{'benchmark':<34} {'min':>9} {'median':>9} {'mean':>9} {'stddev':>9} {'ops/s':>10} {'rounds':>7}")
+    for name, stats in results.items():
+        print(f"{name:<34} " + " ".join(f"{stats[key] * 1e6:>7.1f}us" for key in ("min", "median", "mean", "stddev"))
+              + f" {stats['ops']:>10.0f} {stats['rounds']:>7}")
+    per_turn = turn_total(results)
+    if per_turn is not None:
+        print(f"\nCPU per turn: {per_turn * 1e6:.1f}us ({', '.join(TURN)}; history of {args.history} turns)")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({
+                "machine_info": {"python": platform.python_version(), "machine": platform.machine(), "node": platform.node()},
+                "options": {"rounds": args.rounds, "min_time": args.min_time, "history": args.history},
+                "benchmarks": [{"name": name, "stats": stats} for name, stats in results.items()],
+                "per_turn": per_turn,
+            }, f, indent=2)
+        print(f"Results written to {args.save}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, per_turn, baseline, args.max_regression)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) over {args.max_regression:.0f}% against {args.compare}:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print(f"\nNo regression over {args.max_regression:.0f}% against {args.compare}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""Per-request logging overhead: the former print() calls against the structured logger.
+
+Usage:
+    python scripts/benchmark_logging.py --requests 2000 --sessions 500
+
+Replays the log calls of one /api/chat turn (session lookups, metadata
+parsing, Flux request and response) with the payloads they carry under load:
+a session table of `--sessions` entries, a raw LLM response, HTTP headers.
+Output goes to a real file, as it would in a container. The time measured is
+the time spent on the calling thread, i.e. on the event loop.
+"""
+import argparse
+import contextlib
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Add server directory to PYTHONPATH
+server_dir = Path(__file__).parent.parent
+sys.path.append(str(server_dir))
+
+from services.log import get_logger, setup_logging, shutdown_logging
+
+RAW_RESPONSE = json.dumps({
+    "is_death": False,
+    "is_victory": False,
+    "choices": ["Follow the footsteps into the dark corridor", "Barricade the door and wait for dawn"],
+    "time": "23:40",
+    "location": "Abandoned factory, east wing",
+}, indent=2) * 3
+HEADERS = {f"X-Header-{i}": "x" * 40 for i in range(20)}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark logging overhead per request")
+    parser.add_argument("--requests", type=int, default=2000, help="Simulated requests per mode (default: 2000)")
+    parser.add_argument("--sessions", type=int, default=500, help="Live sessions (default: 500)")
+    return parser.parse_args()
+
+
+def print_request(session_ids: list):
+    """The prints of one turn before structured logging."""
+    session_id = session_ids[-1]
+    for _ in range(2):  # Deux get_session par tour (chat, puis image)
+        print(f"Getting session {session_id} from SessionManager singleton")
+        print(f"Current sessions in SessionManager: {session_ids}")
+        print(f"Session {session_id} found and active")
+    print(f"Processing chat message for session {session_id}: message='choice' choice_id=1")
+    print("[MetadataGenerator] Starting parsing process...")
+    print("[MetadataGenerator] Raw response content:", RAW_RESPONSE)
+    print("[MetadataGenerator] First cleaning attempt:", RAW_RESPONSE)
+    print("[MetadataGenerator] Successfully parsed JSON after first cleaning")
+    print(f"[MetadataGenerator] Raw response before validation (attempt 1):", RAW_RESPONSE)
+    for _ in range(3):  # Un appel Flux par panneau
+        print("Sending request to Hugging Face API: https://flux.example")
+        print(f"Request body: {RAW_RESPONSE[:100]}...")
+        print(f"Response status code: 200")
+        print(f"Response headers: {HEADERS}")
+
+
+def log_request(session_ids: list):
+    """The same turn with the structured logger."""
+    session_log, chat_log, metadata_log, flux_log = (get_logger(c) for c in ("session", "chat", "metadata", "flux"))
+    session_id = session_ids[-1]
+    for _ in range(2):
+        session_log.debug("Session found", session_id=session_id)
+    chat_log.debug("Processing chat message", session_id=session_id, text="choice", choice_id=1)
+    metadata_log.debug("Parsing response", response=RAW_RESPONSE)
+    metadata_log.debug("Validation successful", attempt=1)
+    for _ in range(3):
+        flux_log.debug("Sending request", endpoint="https://flux.example", width=512, height=512, prompt=RAW_RESPONSE[:100])
+        flux_log.debug("Response received", endpoint="https://flux.example", status=200)
+
+
+def measure(request, session_ids: list, requests: int) -> float:
+    timings = []
+    for _ in range(requests):
+        started = time.perf_counter()
+        request(session_ids)
+        timings.append(time.perf_counter() - started)
+    return statistics.mean(timings)
+
+
+def main():
+    args = parse_args()
+    session_ids = [f"{i:08x}-0000-4000-8000-000000000000" for i in range(args.sessions)]
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "out.log")
+        results = {}
+        with open(path, "w") as output:
+            with contextlib.redirect_stdout(output):
+                results["print()"] = measure(print_request, session_ids, args.requests)
+
+            for label, level, sampling in (
+                ("structured, INFO", "INFO", ""),
+                ("structured, DEBUG", "DEBUG", ""),
+                ("structured, DEBUG 1% sampled", "DEBUG", "session=0.01,chat=0.01,metadata=0.01,flux=0.01"),
+            ):
+                os.environ["LOG_SAMPLING"] = sampling
+                setup_logging(level=level, stream=output)
+                results[label] = measure(log_request, session_ids, args.requests)
+                shutdown_logging()
+        size = os.path.getsize(path)
+
+    logging.getLogger().handlers = []
+    print(f"{args.requests} requests, {args.sessions} live sessions, {size / 1e6:.1f} MB written in total")
+    print(f"{'mode':<30} {'per request':>12} {'vs print()':>10}")
+    for label, seconds in results.items():
+        print(f"{label:<30} {seconds * 1e6:>10.1f}us {seconds / results['print()']:>9.1%}")
+
+
+if __name__ == "__main__":
+    main()
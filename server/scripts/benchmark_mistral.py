@@ -0,0 +1,111 @@
+"""Compare the langchain and native Mistral transports against a local stand-in.
+
+Usage:
+    python scripts/benchmark_mistral.py --calls 200 --concurrency 10 --latency 0.05
+
+Starts scripts/fake_servers.py's Mistral stand-in in-process, then times
+import cost, completions (latency minus the stand-in's own delay is the
+client overhead) and streamed completions (time to first token) for each
+transport.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from aiohttp import web
+
+# Add server directory to PYTHONPATH
+server_dir = Path(__file__).parent.parent
+sys.path.append(str(server_dir))
+
+from langchain.schema import HumanMessage, SystemMessage
+from scripts.fake_servers import LatencyModel, create_mistral_app
+from services.http_transport import close_http_transport
+from services.mistral_client import MistralClient
+
+IMPORTS = {
+    "langchain": "from langchain_mistralai.chat_models import ChatMistralAI",
+    "native": "import aiohttp",
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the Mistral transports")
+    parser.add_argument("--calls", type=int, default=200, help="Completions per transport (default: 200)")
+    parser.add_argument("--concurrency", type=int, default=10, help="Concurrent calls (default: 10)")
+    parser.add_argument("--latency", type=float, default=0.05, help="Stand-in time to first token in seconds")
+    parser.add_argument("--token-delay", type=float, default=0.005, help="Stand-in delay between streamed tokens")
+    parser.add_argument("--port", type=int, default=9191)
+    return parser.parse_args()
+
+
+def measure_import(statement: str) -> float:
+    """Import time in a fresh interpreter."""
+    code = f"import time; t = time.perf_counter(); {statement}; print(time.perf_counter() - t)"
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    return float(output.stdout.strip())
+
+
+def percentile(values, fraction: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+async def run_calls(client: MistralClient, calls: int, concurrency: int, stream: bool):
+    messages = [SystemMessage(content="You are a narrator."), HumanMessage(content="Continue the story.")]
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, first_tokens = [], []
+
+    async def one_call():
+        async with semaphore:
+            started = time.perf_counter()
+            if stream:
+                first = None
+                async for _ in client.stream_text(messages):
+                    if first is None:
+                        first = time.perf_counter() - started
+                first_tokens.append(first)
+            else:
+                await client.generate_text(messages)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*[one_call() for _ in range(calls)])
+    return time.perf_counter() - started, latencies, first_tokens
+
+
+async def main():
+    args = parse_args()
+    runner = web.AppRunner(create_mistral_app(LatencyModel(args.latency, sigma=0.0), args.token_delay))
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", args.port).start()
+    os.environ["MISTRAL_API_URL"] = f"http://127.0.0.1:{args.port}/v1"
+
+    print(f"Stand-in: {args.latency * 1000:.0f} ms to first token, {args.token_delay * 1000:.0f} ms per token")
+    print(f"{'transport':<10} {'import':>8} {'calls/s':>8} {'p50':>8} {'p95':>8} {'overhead':>9} {'ttft p50':>9}")
+    for kind in ("langchain", "native"):
+        client = MistralClient(api_key="benchmark", model_name="mistral-small-latest", transport=kind)
+        # Pas d'espacement entre appels : on mesure le transport, pas le rate limit
+        client.min_delay = 0
+        await run_calls(client, args.concurrency, args.concurrency, stream=False)  # Préchauffage
+
+        elapsed, latencies, _ = await run_calls(client, args.calls, args.concurrency, stream=False)
+        _, _, first_tokens = await run_calls(client, max(1, args.calls // 4), args.concurrency, stream=True)
+        p50 = statistics.median(latencies)
+        print(
+            f"{kind:<10} {measure_import(IMPORTS[kind]) * 1000:>6.0f}ms {args.calls / elapsed:>8.1f} "
+            f"{p50 * 1000:>6.1f}ms {percentile(latencies, 0.95) * 1000:>6.1f}ms "
+            f"{(p50 - args.latency) * 1000:>7.1f}ms {statistics.median(first_tokens) * 1000:>7.1f}ms"
+        )
+
+    await close_http_transport()
+    await runner.cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,311 @@
+"""Local stand-ins for the upstream APIs, for load tests and multi-endpoint checks.
+
+Usage:
+    python scripts/fake_servers.py flux --port 9001 --replicas 3 --latency 2.0 --error-rate 0.1
+    python scripts/fake_servers.py mistral --port 9101 --latency 0.3 --token-delay 0.02
+    python scripts/fake_servers.py elevenlabs --port 9201 --latency 0.4 --token-delay 0.05
+
+Then point the server at them:
+    FLUX_ENDPOINTS=http://localhost:9001,http://localhost:9002|2,http://localhost:9003
+    MISTRAL_API_URL=http://localhost:9101/v1
+    ELEVEN_LABS_API_URL=http://localhost:9201/v1/text-to-speech
+
+The Mistral stand-in answers each generator (universe, segment, metadata,
+image prompts) in the format its parser expects, so a whole game can be
+played against it. scripts/load_test.py starts all three in-process.
+"""
+import argparse
+import asyncio
+import functools
+import io
+import json
+import random
+import time
+
+from aiohttp import web
+
+# JPEG 8x8 gris, utilisé quand Pillow n'est pas installé
+TINY_JPEG = bytes.fromhex(
+    "ffd8ffe000104a46494600010100000100010000ffdb004300100b0c0e0c0a100e0d0e1211101318281a181616183123251d283a333d3c3933383740485c4e404457453738506d51575f626768673e4d"
+    "71797064785c656763ffdb0043011112121815182f1a1a2f634238426363636363636363636363636363636363636363636363636363636363636363636363636363636363636363636363636363ffc0"
+    "0011080008000803012200021101031101ffc4001f0000010501010101010100000000000000000102030405060708090a0bffc400b5100002010303020403050504040000017d010203000411051221"
+    "31410613516107227114328191a1082342b1c11552d1f02433627282090a161718191a25262728292a3435363738393a434445464748494a535455565758595a636465666768696a737475767778797a"
+    "838485868788898a92939495969798999aa2a3a4a5a6a7a8a9aab2b3b4b5b6b7b8b9bac2c3c4c5c6c7c8c9cad2d3d4d5d6d7d8d9dae1e2e3e4e5e6e7e8e9eaf1f2f3f4f5f6f7f8f9faffc4001f010003"
+    "0101010101010101010000000000000102030405060708090a0bffc400b51100020102040403040705040400010277000102031104052131061241510761711322328108144291a1b1c109233352f015"
+    "6272d10a162434e125f11718191a262728292a35363738393a434445464748494a535455565758595a636465666768696a737475767778797a82838485868788898a92939495969798999aa2a3a4a5a6"
+    "a7a8a9aab2b3b4b5b6b7b8b9bac2c3c4c5c6c7c8c9cad2d3d4d5d6d7d8d9dae2e3e4e5e6e7e8e9eaf2f3f4f5f6f7f8f9faffda000c03010002110311003f0028a28a00ffd9"
+)
+
+
+@functools.lru_cache(maxsize=32)
+def render_jpeg(width: int, height: int) -> bytes:
+    """A gradient JPEG of the requested size, so payload sizes look like real panels."""
+    try:
+        from PIL import Image
+    except ImportError:
+        return TINY_JPEG
+    image = Image.linear_gradient("L").resize((width, height)).convert("RGB")
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=90)
+    return buffer.getvalue()
+
+
+class LatencyModel:
+    """Log-normal latency around `median` seconds, scaled by `speed`."""
+
+    def __init__(self, median: float, sigma: float = 0.3, speed: float = 1.0):
+        self.median = median
+        self.sigma = sigma
+        self.speed = speed
+
+    async def wait(self):
+        if self.median > 0:
+            await asyncio.sleep(random.lognormvariate(0, self.sigma) * self.median / self.speed)
+
+
+def create_flux_app(latency: LatencyModel, error_rate: float = 0.0, loading_seconds: float = 0.0) -> web.Application:
+    """Hugging Face inference endpoint stand-in.
+
+    Answers 503 "currently loading" for the first `loading_seconds`, then
+    returns a JPEG of the requested size, failing with a 500 for `error_rate` of the requests.
+    """
+    started_at = time.monotonic()
+    stats = {"requests": 0, "errors": 0, "loading": 0}
+
+    async def generate(request: web.Request) -> web.Response:
+        stats["requests"] += 1
+        payload = await request.json()
+        remaining = loading_seconds - (time.monotonic() - started_at)
+        if remaining > 0:
+            stats["loading"] += 1
+            return web.json_response(
+                {"error": "Model is currently loading", "estimated_time": remaining},
+                status=503
+            )
+        await latency.wait()
+        if random.random() < error_rate:
+            stats["errors"] += 1
+            return web.json_response({"error": "Internal server error"}, status=500)
+        parameters = payload.get("parameters", {})
+        image = render_jpeg(int(parameters.get("width", 512)), int(parameters.get("height", 512)))
+        return web.Response(body=image, content_type="image/jpeg")
+
+    async def get_stats(request: web.Request) -> web.Response:
+        return web.json_response(stats)
+
+    app = web.Application()
+    app.router.add_post("/", generate)
+    app.router.add_get("/stats", get_stats)
+    return app
+
+
+DEFAULT_COMPLETION = "Sarah pushes the heavy door open and steps into the dark corridor."
+
+STORY_SENTENCES = [
+    "Sarah pushes the heavy door open and steps into the dark corridor.",
+    "A distant siren wails as the rain hammers the corrugated roof.",
+    "She kneels beside the broken radio and turns the dial slowly.",
+    "Footsteps echo somewhere above, then stop all at once.",
+    "The map is torn, but the red circle is still visible near the docks.",
+    "A flicker of green light crawls along the wall and disappears.",
+]
+PANEL_PROMPTS = [
+    "Sarah, low angle, standing in a flooded corridor, flashlight beam cutting the dark",
+    "close-up of a trembling hand turning a radio dial, green glow",
+    "wide shot of an abandoned factory under heavy rain, neon reflections",
+    "over the shoulder shot, Sarah studying a torn map, tense lighting",
+    "Dutch angle, silhouette at the top of a metal staircase",
+]
+LOCATIONS = ["Abandoned factory", "Flooded tunnel", "Rooftop", "Old harbour", "Control room"]
+CHOICES = [
+    "Follow the footsteps", "Hide behind the crates", "Climb to the roof",
+    "Open the sealed door", "Call for help on the radio", "Run towards the docks",
+]
+# Part des tours qui terminent la partie (mort ou victoire, à parts égales)
+ENDING_RATE = 0.1
+
+
+def smart_reply(payload: dict) -> str:
+    """A completion each generator can parse, chosen from its system prompt."""
+    system = next((m["content"] for m in payload.get("messages", []) if m.get("role") == "system"), "")
+    if "storyboard artist" in system:
+        return json.dumps({"image_prompts": random.sample(PANEL_PROMPTS, random.randint(1, 4))})
+    if "Generate the metadata" in system:
+        ending = random.random()
+        return json.dumps({
+            "choices": random.sample(CHOICES, 2),
+            "time": f"{random.randint(0, 23):02d}:{random.randint(0, 59):02d}",
+            "location": random.choice(LOCATIONS),
+            "is_death": ending < ENDING_RATE / 2,
+            "is_victory": ENDING_RATE / 2 <= ending < ENDING_RATE,
+        })
+    if "comic book universes" in system:
+        return " ".join(random.sample(STORY_SENTENCES, 4))
+    return " ".join(random.sample(STORY_SENTENCES, 2))
+
+
+def create_mistral_app(latency: LatencyModel, token_delay: float = 0.0, error_rate: float = 0.0, reply=None) -> web.Application:
+    """Mistral chat completions stand-in, with and without SSE streaming.
+
+    `latency` is the time to first token, `token_delay` the time between
+    streamed tokens. `reply(payload)` returns the completion text.
+    """
+    stats = {"requests": 0, "streams": 0, "errors": 0, "cancelled_streams": 0}
+
+    def completion_chunk(payload: dict, delta: dict, finish_reason=None, usage=None) -> bytes:
+        chunk = {
+            "id": "cmpl-fake",
+            "object": "chat.completion.chunk",
+            "model": payload.get("model"),
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+        }
+        if usage:
+            chunk["usage"] = usage
+        return f"data: {json.dumps(chunk)}\n\n".encode()
+
+    async def chat_completions(request: web.Request) -> web.StreamResponse:
+        stats["requests"] += 1
+        payload = await request.json()
+        await latency.wait()
+        if random.random() < error_rate:
+            stats["errors"] += 1
+            return web.json_response({"message": "Service unavailable"}, status=503)
+        content = reply(payload) if reply else DEFAULT_COMPLETION
+        usage = {
+            "prompt_tokens": sum(len(m["content"].split()) for m in payload.get("messages", [])),
+            "completion_tokens": len(content.split()),
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+
+        if not payload.get("stream"):
+            return web.json_response({
+                "id": "cmpl-fake",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": payload.get("model"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": usage
+            })
+
+        stats["streams"] += 1
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        await response.write(completion_chunk(payload, {"role": "assistant", "content": ""}))
+        words = content.split(" ")
+        try:
+            for index, word in enumerate(words):
+                if index and token_delay > 0:
+                    await asyncio.sleep(token_delay)
+                await response.write(completion_chunk(payload, {"content": word if index == 0 else " " + word}))
+            await response.write(completion_chunk(payload, {}, "stop", usage))
+            await response.write(b"data: [DONE]\n\n")
+            await response.write_eof()
+        except ConnectionError:
+            # Le client a fermé le flux avant la fin (arrêt anticipé)
+            stats["cancelled_streams"] += 1
+        return response
+
+    async def get_stats(request: web.Request) -> web.Response:
+        return web.json_response(stats)
+
+    app = web.Application()
+    app.router.add_post("/v1/chat/completions", chat_completions)
+    app.router.add_get("/stats", get_stats)
+    return app
+
+
+# En-tête de trame MPEG-1 Layer III, 128 kbit/s, 44,1 kHz : 417 octets par trame, ~38 trames par seconde
+MP3_FRAME = b"\xff\xfb\x90\x64" + bytes(413)
+MP3_FRAMES_PER_SECOND = 38
+
+
+def create_elevenlabs_app(latency: LatencyModel, chunk_delay: float = 0.0, error_rate: float = 0.0, chunk_size: int = 16384) -> web.Application:
+    """ElevenLabs streaming text-to-speech stand-in.
+
+    `latency` is the time to first byte, `chunk_delay` the time between
+    chunks. The MP3 lasts as long as the text takes to read (~2.5 words per second).
+    """
+    stats = {"requests": 0, "errors": 0, "bytes": 0, "cancelled_streams": 0}
+
+    async def text_to_speech(request: web.Request) -> web.StreamResponse:
+        stats["requests"] += 1
+        payload = await request.json()
+        await latency.wait()
+        if random.random() < error_rate:
+            stats["errors"] += 1
+            return web.json_response({"detail": {"status": "service_unavailable"}}, status=503)
+        seconds = max(1.0, len(payload.get("text", "").split()) / 2.5)
+        audio = MP3_FRAME * int(seconds * MP3_FRAMES_PER_SECOND)
+
+        response = web.StreamResponse(headers={"Content-Type": "audio/mpeg"})
+        await response.prepare(request)
+        try:
+            for offset in range(0, len(audio), chunk_size):
+                if offset and chunk_delay > 0:
+                    await asyncio.sleep(chunk_delay)
+                await response.write(audio[offset:offset + chunk_size])
+                stats["bytes"] += min(chunk_size, len(audio) - offset)
+            await response.write_eof()
+        except ConnectionError:
+            stats["cancelled_streams"] += 1
+        return response
+
+    async def get_stats(request: web.Request) -> web.Response:
+        return web.json_response(stats)
+
+    app = web.Application()
+    app.router.add_post("/v1/text-to-speech/{voice_id}/stream", text_to_speech)
+    app.router.add_get("/stats", get_stats)
+    return app
+
+
+async def serve(apps, host: str, port: int):
+    """Run each app on consecutive ports until interrupted."""
+    runners = []
+    for offset, app in enumerate(apps):
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, host, port + offset).start()
+        runners.append(runner)
+        print(f"Listening on http://{host}:{port + offset}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        for runner in runners:
+            await runner.cleanup()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run local stand-ins for the upstream APIs")
+    parser.add_argument("service", choices=["flux", "mistral", "elevenlabs"])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9001)
+    parser.add_argument("--replicas", type=int, default=1, help="Number of servers, on consecutive ports")
+    parser.add_argument("--latency", type=float, default=1.0, help="Median latency in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--loading-seconds", type=float, default=0.0, help="Answer 503 'currently loading' at startup")
+    parser.add_argument("--token-delay", type=float, default=0.0, help="Seconds between streamed tokens (mistral) or audio chunks (elevenlabs)")
+    parser.add_argument("--reply", choices=["smart", "fixed"], default="smart", help="Per-generator completions, or always the same sentence (mistral)")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.service == "mistral":
+        reply = smart_reply if args.reply == "smart" else None
+        apps = [create_mistral_app(LatencyModel(args.latency), args.token_delay, args.error_rate, reply) for _ in range(args.replicas)]
+    elif args.service == "elevenlabs":
+        apps = [create_elevenlabs_app(LatencyModel(args.latency), args.token_delay, args.error_rate) for _ in range(args.replicas)]
+    else:
+        apps = [
+            create_flux_app(LatencyModel(args.latency), args.error_rate, args.loading_seconds)
+            for _ in range(args.replicas)
+        ]
+    try:
+        asyncio.run(serve(apps, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
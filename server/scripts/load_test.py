@@ -0,0 +1,420 @@
+"""End-to-end load test against local stand-ins for Mistral, Flux and ElevenLabs.
+
+Usage:
+    python scripts/load_test.py --players 1000 --concurrency 100 --turns 5
+    python scripts/load_test.py --players 200 --flux-latency 3 --flux-error-rate 0.05 --flux-loading-seconds 20
+    python scripts/load_test.py --players 500 --server-env FLUX_MAX_CONCURRENCY=4 --json before.json
+    python scripts/load_test.py --server-env CASSETTE_MODE=replay --server-env CASSETTE_PATH=prod.jsonl.gz --server-env CASSETTE_SPEED=10
+
+Starts scripts/fake_servers.py's stand-ins in-process, boots the API in a
+separate uvicorn process pointed at them (throwaway caches), then plays
+`--players` games, `--concurrency` at a time: universe, then chat turns,
+each followed by its panel images and narration, until the story ends or
+`--turns` is reached. Reports throughput and p50/p95/p99 latency per
+endpoint, game outcomes, the API process' CPU time, peak memory and event
+loop lag, and what the stand-ins served.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import secrets
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import aiohttp
+from aiohttp import web
+
+# Add server directory to PYTHONPATH
+server_dir = Path(__file__).parent.parent
+sys.path.append(str(server_dir))
+
+from core.layouts import get_panel_size
+from scripts.fake_servers import LatencyModel, create_elevenlabs_app, create_flux_app, create_mistral_app, smart_reply
+
+VOICE_ID = "21m00Tcm4TlvDq8ikWAM"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Load test the API against local upstream stand-ins")
+    parser.add_argument("--players", type=int, default=200, help="Games to play (default: 200)")
+    parser.add_argument("--concurrency", type=int, default=50, help="Games played at the same time (default: 50)")
+    parser.add_argument("--turns", type=int, default=5, help="Maximum chat turns per game (default: 5)")
+    parser.add_argument("--ramp-up", type=float, default=5.0, help="Seconds over which the first games start")
+    parser.add_argument("--stream", action="store_true", help="Stream chat turns (NDJSON) and measure time to first token")
+    parser.add_argument("--no-images", action="store_true", help="Skip panel images")
+    parser.add_argument("--no-tts", action="store_true", help="Skip narration")
+
+    upstream = parser.add_argument_group("stand-ins (latencies are log-normal medians in seconds)")
+    upstream.add_argument("--latency-sigma", type=float, default=0.3, help="Spread of every latency distribution")
+    upstream.add_argument("--speed", type=float, default=1.0, help="Divide every stand-in latency by this factor")
+    upstream.add_argument("--mistral-latency", type=float, default=0.5, help="Time to first token")
+    upstream.add_argument("--mistral-token-delay", type=float, default=0.01)
+    upstream.add_argument("--mistral-error-rate", type=float, default=0.0)
+    upstream.add_argument("--flux-latency", type=float, default=2.0)
+    upstream.add_argument("--flux-replicas", type=int, default=2)
+    upstream.add_argument("--flux-error-rate", type=float, default=0.0)
+    upstream.add_argument("--flux-loading-seconds", type=float, default=0.0, help="Flux answers 503 'loading' at startup")
+    upstream.add_argument("--tts-latency", type=float, default=0.4, help="Time to first byte")
+    upstream.add_argument("--tts-chunk-delay", type=float, default=0.05)
+    upstream.add_argument("--tts-error-rate", type=float, default=0.0)
+
+    parser.add_argument("--port", type=int, default=8765, help="API port")
+    parser.add_argument("--upstream-port", type=int, default=9301, help="First stand-in port, the others follow")
+    parser.add_argument("--server-env", action="append", default=[], metavar="KEY=VALUE", help="Extra API environment (repeatable)")
+    parser.add_argument("--json", help="Also write the results to this file")
+    parser.add_argument("--verbose", action="store_true", help="Show the API's output")
+    return parser.parse_args()
+
+
+def percentile(values: List[float], fraction: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class Recorder:
+    """Latency and status of every request, by endpoint."""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.statuses: Dict[str, Counter] = defaultdict(Counter)
+        self.outcomes = Counter()
+        self.turns = 0
+
+    def record(self, endpoint: str, seconds: float, status):
+        self.latencies[endpoint].append(seconds)
+        self.statuses[endpoint][status] += 1
+
+    async def request(self, http: aiohttp.ClientSession, endpoint: str, method: str, url: str, **kwargs):
+        """JSON body of a 200 response, None otherwise."""
+        started = time.perf_counter()
+        try:
+            async with http.request(method, url, **kwargs) as response:
+                data = await response.json() if response.status == 200 else await response.read()
+                self.record(endpoint, time.perf_counter() - started, response.status)
+                return data if response.status == 200 else None
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self.record(endpoint, time.perf_counter() - started, type(e).__name__)
+            return None
+
+    async def stream_chat(self, http: aiohttp.ClientSession, url: str, **kwargs):
+        """Streamed chat turn: time to first token and to the complete story."""
+        started = time.perf_counter()
+        story = None
+        try:
+            async with http.post(url, **kwargs) as response:
+                if response.status != 200:
+                    self.record("POST /api/chat (stream)", time.perf_counter() - started, response.status)
+                    return None
+                first_token = True
+                async for line in response.content:
+                    event = json.loads(line)
+                    if event["type"] == "token" and first_token:
+                        self.record("POST /api/chat (first token)", time.perf_counter() - started, 200)
+                        first_token = False
+                    elif event["type"] == "story":
+                        story = event["story"]
+            self.record("POST /api/chat (stream)", time.perf_counter() - started, 200 if story else "error")
+            return story
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self.record("POST /api/chat (stream)", time.perf_counter() - started, type(e).__name__)
+            return None
+
+    def report(self, wall: float) -> dict:
+        endpoints = {}
+        for endpoint, latencies in sorted(self.latencies.items()):
+            statuses = self.statuses[endpoint]
+            endpoints[endpoint] = {
+                "requests": len(latencies),
+                "errors": sum(count for status, count in statuses.items() if status != 200),
+                "rps": round(len(latencies) / wall, 2),
+                "p50": percentile(latencies, 0.5),
+                "p95": percentile(latencies, 0.95),
+                "p99": percentile(latencies, 0.99),
+                "max": max(latencies),
+                "statuses": {str(status): count for status, count in statuses.items()},
+            }
+        return endpoints
+
+
+async def request_panels(http: aiohttp.ClientSession, api: str, recorder: Recorder, headers: dict, prompts: List[str], layout_counter: int):
+    for index, prompt in enumerate(prompts):
+        width, height = get_panel_size(len(prompts), index, layout_counter)
+        await recorder.request(http, "POST /api/generate-image", "POST", f"{api}/api/generate-image", headers=headers,
+                               json={"prompt": prompt, "width": width, "height": height, "panel_index": index})
+
+
+async def play_game(http: aiohttp.ClientSession, api: str, recorder: Recorder, args):
+    universe = await recorder.request(http, "POST /api/universe/generate", "POST", f"{api}/api/universe/generate")
+    if universe is None:
+        recorder.outcomes["failed"] += 1
+        return
+    headers = {"x-session-id": universe["session_id"]}
+    # Compteur de layouts du client : +1 à chaque tour avec des panneaux
+    layout_counter = 0
+
+    for turn in range(args.turns):
+        message = {"message": "restart"} if turn == 0 else {"message": "choice", "choice_id": random.randint(1, 2)}
+        if args.stream:
+            story = await recorder.stream_chat(http, f"{api}/api/chat", json={**message, "stream": True}, headers=headers)
+        else:
+            story = await recorder.request(http, "POST /api/chat", "POST", f"{api}/api/chat", json=message, headers=headers)
+        if story is None:
+            recorder.outcomes["failed"] += 1
+            return
+        recorder.turns += 1
+
+        # Comme le client web : les panneaux l'un après l'autre, aux tailles du layout du tour,
+        # la narration en même temps
+        work = []
+        if not args.no_images and story["image_prompts"]:
+            work.append(request_panels(http, api, recorder, headers, story["image_prompts"], layout_counter))
+            layout_counter += 1
+        if not args.no_tts:
+            work.append(recorder.request(http, "POST /api/text-to-speech", "POST", f"{api}/api/text-to-speech", headers=headers,
+                                         json={"text": story["story_text"], "voice_id": VOICE_ID}))
+        await asyncio.gather(*work)
+
+        if story["is_death"] or story["is_victory"]:
+            recorder.outcomes["death" if story["is_death"] else "victory"] += 1
+            return
+    recorder.outcomes["max_turns"] += 1
+
+
+async def play_games(api: str, recorder: Recorder, args):
+    slots = asyncio.Semaphore(args.concurrency)
+    timeout = aiohttp.ClientTimeout(total=600)
+
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=0), timeout=timeout) as http:
+        async def player(index: int):
+            async with slots:
+                if index < args.concurrency:
+                    await asyncio.sleep(index * args.ramp_up / args.concurrency)
+                await play_game(http, api, recorder, args)
+
+        await asyncio.gather(*(player(index) for index in range(args.players)))
+
+
+def _children(pid: int) -> List[int]:
+    children = []
+    for task in os.listdir(f"/proc/{pid}/task"):
+        with open(f"/proc/{pid}/task/{task}/children") as f:
+            children.extend(int(child) for child in f.read().split())
+    return children
+
+
+def _cpu_and_rss(pid: int):
+    """CPU seconds and RSS in MB of a process, from /proc."""
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    cpu = (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    with open(f"/proc/{pid}/status") as f:
+        rss = next(int(line.split()[1]) for line in f if line.startswith("VmRSS:")) / 1024
+    return cpu, rss
+
+
+class ResourceSampler:
+    """CPU time and peak memory of the API process and its workers (Linux only)."""
+
+    def __init__(self, pid: int, interval: float = 0.5):
+        self.pid = pid
+        self.interval = interval
+        self.cpu: Dict[int, float] = {}
+        self.peak_rss = 0.0
+        self.available = os.path.exists(f"/proc/{pid}/stat")
+
+    def sample(self):
+        rss = 0.0
+        try:
+            pids = [self.pid] + _children(self.pid)
+        except OSError:
+            # Processus terminé
+            return
+        for pid in pids:
+            try:
+                cpu, process_rss = _cpu_and_rss(pid)
+            except (OSError, StopIteration):
+                continue
+            self.cpu[pid] = cpu
+            rss += process_rss
+        self.peak_rss = max(self.peak_rss, rss)
+
+    async def run(self):
+        while self.available:
+            self.sample()
+            await asyncio.sleep(self.interval)
+
+    def report(self, wall: float) -> Optional[dict]:
+        if not self.available:
+            return None
+        cpu = sum(self.cpu.values())
+        return {
+            "cpu_seconds": round(cpu, 2),
+            "cpu_percent": round(100 * cpu / wall, 1),
+            "peak_rss_mb": round(self.peak_rss, 1),
+            "processes": len(self.cpu),
+        }
+
+
+async def start_stand_ins(args) -> tuple:
+    latency = lambda median: LatencyModel(median, args.latency_sigma, args.speed)
+    mistral_port, tts_port, flux_port = args.upstream_port, args.upstream_port + 1, args.upstream_port + 2
+    apps = {
+        f"mistral:{mistral_port}": (mistral_port, create_mistral_app(latency(args.mistral_latency), args.mistral_token_delay / args.speed, args.mistral_error_rate, smart_reply)),
+        f"elevenlabs:{tts_port}": (tts_port, create_elevenlabs_app(latency(args.tts_latency), args.tts_chunk_delay / args.speed, args.tts_error_rate)),
+    }
+    for replica in range(args.flux_replicas):
+        apps[f"flux:{flux_port + replica}"] = (
+            flux_port + replica,
+            create_flux_app(latency(args.flux_latency), args.flux_error_rate, args.flux_loading_seconds)
+        )
+    runners = []
+    for port, app in apps.values():
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, "127.0.0.1", port).start()
+        runners.append(runner)
+
+    env = {
+        "MISTRAL_API_KEY": "load-test",
+        "MISTRAL_TRANSPORT": "native",
+        "MISTRAL_API_URL": f"http://127.0.0.1:{mistral_port}/v1",
+        "HF_API_KEY": "load-test",
+        "FLUX_ENDPOINTS": ",".join(f"http://127.0.0.1:{flux_port + replica}" for replica in range(args.flux_replicas)),
+        "ELEVEN_LABS_API_KEY": "load-test",
+        "ELEVEN_LABS_API_URL": f"http://127.0.0.1:{tts_port}/v1/text-to-speech",
+    }
+    return runners, env, {name: port for name, (port, _) in apps.items()}
+
+
+async def wait_until_ready(api: str, process: subprocess.Popen, timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as http:
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f"API exited with code {process.returncode}")
+            try:
+                async with http.get(f"{api}/api/health") as response:
+                    if response.status == 200:
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.25)
+    raise RuntimeError("API did not start in time")
+
+
+async def fetch_json(url: str, headers: Optional[dict] = None) -> Optional[dict]:
+    try:
+        async with aiohttp.ClientSession() as http:
+            async with http.get(url, headers=headers) as response:
+                return await response.json() if response.status == 200 else None
+    except aiohttp.ClientError:
+        return None
+
+
+def print_report(results: dict):
+    print(f"\n{results['players']} players, {results['turns']} turns in {results['wall_seconds']:.1f}s "
+          f"({results['turns_per_second']:.2f} turns/s)")
+    print("Outcomes: " + ", ".join(f"{name}={count}" for name, count in results["outcomes"].items()))
+    print(f"\n{'endpoint':<32} {'requests':>8} {'errors':>7} {'rps':>7} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}")
+    for endpoint, stats in results["endpoints"].items():
+        print(f"{endpoint:<32} {stats['requests']:>8} {stats['errors']:>7} {stats['rps']:>7.2f} "
+              + " ".join(f"{stats[key]:>7.3f}s" for key in ("p50", "p95", "p99", "max")))
+    if results["resources"]:
+        resources = results["resources"]
+        print(f"\nAPI: {resources['cpu_seconds']}s CPU ({resources['cpu_percent']}%), "
+              f"peak RSS {resources['peak_rss_mb']} MB over {resources['processes']} process(es)")
+    if results["event_loop"]:
+        loop = results["event_loop"]
+        print(f"Event loop lag: p50 {loop['lag_ms']['p50']}ms, p99 {loop['lag_ms']['p99']}ms, max {loop['lag_ms']['max']}ms, "
+              f"{loop['stalls']} stall(s)")
+        for site in loop["sites"][:5]:
+            print(f"  {site['total_ms']:>8.1f}ms in {site['count']} stall(s): {site['site']}")
+    print("Stand-ins: " + ", ".join(f"{name} {stats}" for name, stats in results["stand_ins"].items()))
+
+
+async def run(args):
+    runners, upstream_env, stand_ins = await start_stand_ins(args)
+    api = f"http://127.0.0.1:{args.port}"
+    debug_token = secrets.token_hex(16)
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        env = {
+            **os.environ,
+            **upstream_env,
+            "IMAGE_CACHE_DIR": os.path.join(cache_dir, "images"),
+            "AUDIO_CACHE_DIR": os.path.join(cache_dir, "audio"),
+            "LOG_LEVEL": "WARNING",
+            "DEBUG_TOKEN": debug_token,
+            "PYTHONPATH": str(server_dir),
+        }
+        for item in args.server_env:
+            key, _, value = item.partition("=")
+            env[key] = value
+        process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "server:app", "--host", "127.0.0.1", "--port", str(args.port), "--log-level", "warning"],
+            cwd=server_dir,
+            env=env,
+            stdout=None if args.verbose else subprocess.DEVNULL
+        )
+        try:
+            await wait_until_ready(api, process)
+            print(f"API ready, playing {args.players} games ({args.concurrency} at a time)...")
+
+            recorder = Recorder()
+            sampler = ResourceSampler(process.pid)
+            sampling = asyncio.ensure_future(sampler.run())
+            started = time.perf_counter()
+            await play_games(api, recorder, args)
+            wall = time.perf_counter() - started
+            sampling.cancel()
+            sampler.sample()
+
+            event_loop = await fetch_json(f"{api}/api/debug/loop?stacks=false", headers={"X-Debug-Token": debug_token})
+            upstream_stats = {}
+            for name, port in stand_ins.items():
+                upstream_stats[name] = await fetch_json(f"http://127.0.0.1:{port}/stats")
+        finally:
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+            for runner in runners:
+                await runner.cleanup()
+
+    return {
+        "players": args.players,
+        "concurrency": args.concurrency,
+        "turns": recorder.turns,
+        "wall_seconds": round(wall, 2),
+        "turns_per_second": round(recorder.turns / wall, 3),
+        "outcomes": dict(recorder.outcomes),
+        "endpoints": recorder.report(wall),
+        "resources": sampler.report(wall),
+        "event_loop": event_loop,
+        "stand_ins": upstream_stats,
+        "config": vars(args),
+    }
+
+
+def main():
+    args = parse_args()
+    results = asyncio.run(run(args))
+    print_report(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
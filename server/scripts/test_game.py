@@ -88,15 +88,13 @@ async def play_game(show_context: bool = False, auto_mode: bool = False, max_tur
     print_separator()
     
     # Test universe generation
-    style, genre, epoch, macguffin, hero = universe_generator._get_random_elements()
+    base_story, style, genre, epoch, macguffin, hero_name, hero_desc = await universe_generator.generate()
     print(f"\nGenerated universe elements:")
     print(f"Style: {style['name']}")
     print(f"Genre: {genre}")
     print(f"Epoch: {epoch}")
     print(f"MacGuffin: {macguffin}")
-    print(f"Hero: {hero}")
-
-    base_story = await universe_generator.generate()
+    print(f"Hero: {hero_desc}")
     print(f"\nGenerated base story:\n{base_story}")
     
     # Create session and game state
@@ -117,7 +115,8 @@ async def play_game(show_context: bool = False, auto_mode: bool = False, max_tur
         epoch=epoch,
         base_story=base_story,
         macguffin=macguffin,
-        hero=hero
+        hero_name=hero_name,
+        hero_desc=hero_desc
     )
     
     # Display universe information
@@ -10,16 +10,40 @@ from core.story_generator import StoryGenerator
 from core.setup import setup_game, get_universe_generator
 from core.session_manager import SessionManager
 from services.flux_client import FluxClient
+from services.image_cache import ImageCache
+from services.image_transcoder import ImageTranscoder
+from services.process_pool import start_process_pool, shutdown_process_pool
+from services.http_transport import get_http_transport, close_http_transport
+from services.tracing import TraceExporter
+from services.log import setup_logging, shutdown_logging
+from services.loop_monitor import LoopMonitor
+from services.profiler import Profiler
+from services.cassette import close_cassette
+from core.image_pipeline import ImagePipeline
+from core.page_compositor import PageCompositor
+from core.story_export import StoryExporter
+from core.narration import NarrationPrefetcher
+from core.quality_policy import QualityPolicy
 from services.mistral_client import MistralClient
+from services.audio_cache import AudioCache
+from services.elevenlabs_client import ElevenLabsClient
 from api.routes.chat import get_chat_router
 from api.routes.image import get_image_router
 from api.routes.speech import get_speech_router
 from api.routes.universe import get_universe_router
 from api.routes.health import get_health_router
+from api.routes.page import get_page_router
+from api.routes.export import get_export_router
+from api.routes.metrics import get_metrics_router
+from api.routes.debug import get_debug_router
+from api.utils import TracingMiddleware, ProfilingMiddleware
 
 # Load environment variables
 load_dotenv()
 
+# Logs structurés, écrits par un thread à partir d'une file (LOG_LEVEL, LOG_SAMPLING...)
+setup_logging()
+
 # API configuration
 API_HOST = os.getenv("API_HOST", "0.0.0.0")
 API_PORT = int(os.getenv("API_PORT", "8000"))
@@ -27,6 +51,7 @@ STATIC_FILES_DIR = os.getenv("STATIC_FILES_DIR", "../client/dist")
 HF_API_KEY = os.getenv("HF_API_KEY")
 ELEVEN_LABS_API_KEY = os.getenv("ELEVEN_LABS_API_KEY")
 IS_DOCKER = os.getenv("IS_DOCKER", "false").lower() == "true"
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "true").lower() == "true"
 
 app = FastAPI(title="Echoes of Influence")
 
@@ -43,8 +68,19 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing", "X-Trace-Id", "X-Profile-Id"],
 )
 
+# Spans par requête, résumés dans l'en-tête Server-Timing (export optionnel : TRACE_EXPORT)
+trace_exporter = TraceExporter()
+if TRACING_ENABLED:
+    app.add_middleware(TracingMiddleware, exporter=trace_exporter)
+
+# Profilage à la demande, réservé aux porteurs de DEBUG_TOKEN ; rien n'est installé sans
+profiler = Profiler()
+if profiler.enabled:
+    app.add_middleware(ProfilingMiddleware, profiler=profiler)
+
 # Initialize components
 mistral_api_key = os.getenv("MISTRAL_API_KEY")
 if not mistral_api_key:
@@ -52,9 +88,19 @@ if not mistral_api_key:
 
 print("Creating global SessionManager")
 session_manager = SessionManager()
-story_generator = StoryGenerator(api_key=mistral_api_key)
 flux_client = FluxClient(api_key=HF_API_KEY)
+quality_policy = QualityPolicy(flux_client)
+image_cache = ImageCache()
+image_transcoder = ImageTranscoder(image_cache)
+image_pipeline = ImagePipeline(flux_client, image_cache, quality_policy, image_transcoder)
+page_compositor = PageCompositor(image_pipeline)
+story_exporter = StoryExporter(image_pipeline)
+elevenlabs_client = ElevenLabsClient(ELEVEN_LABS_API_KEY, AudioCache())
+narration = NarrationPrefetcher(elevenlabs_client)
+story_generator = StoryGenerator(api_key=mistral_api_key, quality_policy=quality_policy, image_pipeline=image_pipeline, narration=narration)
 mistral_client = MistralClient(api_key=mistral_api_key)
+# Lag de la boucle et appels bloquants (LOOP_MONITOR_ENABLED, LOOP_BLOCK_THRESHOLD)
+loop_monitor = LoopMonitor()
 
 # Health check endpoint
 @app.get("/api/health")
@@ -65,15 +111,23 @@ async def health_check():
 # Register route handlers
 print("Registering route handlers with SessionManager", id(session_manager))
 app.include_router(get_chat_router(session_manager, story_generator), prefix="/api")
-app.include_router(get_image_router(flux_client), prefix="/api")
-app.include_router(get_speech_router(), prefix="/api")
+app.include_router(get_image_router(image_pipeline), prefix="/api")
+app.include_router(get_page_router(session_manager, page_compositor), prefix="/api")
+app.include_router(get_export_router(session_manager, story_exporter), prefix="/api")
+app.include_router(get_speech_router(elevenlabs_client, narration), prefix="/api")
 app.include_router(get_universe_router(session_manager, story_generator), prefix="/api")
-app.include_router(get_health_router(mistral_client, flux_client), prefix="/api")
+app.include_router(get_health_router(mistral_client, flux_client, quality_policy, image_pipeline, page_compositor, elevenlabs_client, narration, trace_exporter), prefix="/api")
+app.include_router(get_metrics_router(), prefix="/api")
+app.include_router(get_debug_router(loop_monitor, profiler, session_manager, story_generator, flux_client, elevenlabs_client), prefix="/api")
 
 @app.on_event("startup")
 async def startup_event():
     """Initialize components on startup"""
-    pass
+    # Pool HTTP sortant partagé par Flux et ElevenLabs
+    await get_http_transport().start()
+    loop_monitor.start()
+    # Lancer les workers d'images bloquerait la boucle au premier rendu
+    await start_process_pool()
 
 @app.on_event("shutdown")
 async def shutdown_event():
@@ -81,8 +135,14 @@ async def shutdown_event():
     # Clean up expired sessions
     session_manager.cleanup_expired_sessions()
     
+    loop_monitor.stop()
+
     # Close API clients
-    await flux_client.close()
+    await elevenlabs_client.close()
+    await close_http_transport()
+    shutdown_process_pool()
+    close_cassette()
+    shutdown_logging()
 
 # Mount static files (this should be after all API routes)
 if IS_DOCKER:
@@ -0,0 +1,11 @@
+import os
+from typing import Optional
+
+from services.image_cache import ImageCache
+
+
+class AudioCache(ImageCache):
+    """On-disk store of synthesized narrations, addressed by audio ID (`<audio_id>.mp3`)."""
+
+    def __init__(self, cache_dir: Optional[str] = None):
+        super().__init__(cache_dir or os.getenv("AUDIO_CACHE_DIR", "cache/audio"))
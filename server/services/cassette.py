@@ -0,0 +1,196 @@
+import asyncio
+import base64
+import gzip
+import json
+import os
+import queue
+import threading
+import time
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from services.log import get_logger
+from services.metrics import current_generator
+
+log = get_logger("cassette")
+
+FALLBACKS = ("none", "generator")
+
+
+class CassetteMissError(Exception):
+    """Replay found no recording for a request."""
+
+
+class ReplayedError(Exception):
+    """An upstream error served from a cassette, with its original message."""
+
+
+def _open(path: str, mode: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def _encode_bytes(value):
+    if isinstance(value, bytes):
+        return base64.b64encode(value).decode("ascii")
+    return str(value)
+
+
+class Cassette:
+    """Upstream calls recorded to, or replayed from, a JSON Lines file.
+
+    Record mode appends one line per Mistral completion or Flux render: the
+    hash of the request, the generator that made it, when it started and how
+    long it took, and the response (streamed chunks with their offsets, HTTP
+    status and body) or the error. A writer thread does the encoding and the
+    I/O. Names ending in .gz are gzipped.
+
+    Replay mode serves those responses by request hash, in recorded order,
+    cycling when a request comes back more often than it was recorded. With
+    `speed` > 0 the original latencies are emulated, divided by `speed` (1 is
+    real time, 10 ten times faster); 0 answers immediately. With the
+    "generator" fallback, a request that was never recorded (prompts changed
+    since) gets the next recording from the same generator instead of an error.
+    """
+
+    def __init__(self, path: str, mode: str, speed: float = 0.0, fallback: str = "none"):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown cassette mode: {mode}")
+        if fallback not in FALLBACKS:
+            raise ValueError(f"Unknown cassette fallback: {fallback}")
+        self.path = path
+        self.mode = mode
+        self.speed = speed
+        self.fallback = fallback
+        self.started = time.perf_counter()
+
+        self.recorded = 0
+        self.hits = 0
+        self.fallbacks = 0
+        self.misses = 0
+
+        self._entries: Dict[Tuple[str, str], List[dict]] = defaultdict(list)
+        self._by_generator: Dict[Tuple[str, str], List[dict]] = defaultdict(list)
+        self._served: Counter = Counter()
+        self._queue: Optional[queue.Queue] = None
+        self._writer: Optional[threading.Thread] = None
+
+        if mode == "replay":
+            self._load()
+        else:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._queue = queue.Queue()
+            self._writer = threading.Thread(target=self._write, name="cassette-writer", daemon=True)
+            self._writer.start()
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == "replay"
+
+    def _load(self):
+        with _open(self.path, "r") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                self._entries[(entry["kind"], entry["key"])].append(entry)
+                self._by_generator[(entry["kind"], entry.get("generator", "none"))].append(entry)
+        log.info("Cassette loaded", path=self.path, entries=sum(len(entries) for entries in self._entries.values()))
+
+    def _write(self):
+        # Ajout : un fichier .gz reçoit un membre gzip de plus, lisible d'un seul tenant
+        with _open(self.path, "a") as f:
+            while True:
+                entry = self._queue.get()
+                if entry is None:
+                    return
+                f.write(json.dumps(entry, ensure_ascii=False, separators=(",", ":"), default=_encode_bytes) + "\n")
+                if self._queue.empty():
+                    f.flush()
+
+    def record(self, kind: str, key: str, started: float, **response):
+        """Queue one call; `started` is its time.perf_counter() start, bytes are stored in base64."""
+        now = time.perf_counter()
+        self._queue.put({
+            "kind": kind,
+            "key": key,
+            "generator": current_generator(),
+            "at": round(started - self.started, 4),
+            "latency": round(now - started, 4),
+            **response,
+        })
+        self.recorded += 1
+
+    def lookup(self, kind: str, key: str) -> dict:
+        """Next recording for this request, raises CassetteMissError when there is none."""
+        entries = self._entries.get((kind, key))
+        served_key = (kind, key)
+        if not entries and self.fallback == "generator":
+            served_key = (kind, "generator", current_generator())
+            entries = self._by_generator.get((kind, current_generator()))
+            if entries:
+                self.fallbacks += 1
+        elif entries:
+            self.hits += 1
+        if not entries:
+            self.misses += 1
+            log.warning("No recording for request", kind=kind, key=key[:12], generator=current_generator())
+            raise CassetteMissError(f"No {kind} recording for request {key[:12]}")
+        index = self._served[served_key]
+        self._served[served_key] += 1
+        return entries[index % len(entries)]
+
+    async def delay(self, seconds: float):
+        if self.speed > 0 and seconds > 0:
+            await asyncio.sleep(seconds / self.speed)
+
+    def close(self):
+        if self._writer is not None:
+            self._queue.put(None)
+            self._writer.join()
+            self._writer = None
+
+    def get_stats(self) -> dict:
+        return {
+            "mode": self.mode,
+            "path": self.path,
+            "speed": self.speed,
+            "fallback": self.fallback,
+            "recorded": self.recorded,
+            "entries": sum(len(entries) for entries in self._entries.values()),
+            "hits": self.hits,
+            "fallbacks": self.fallbacks,
+            "misses": self.misses,
+        }
+
+
+_cassette: Optional[Cassette] = None
+
+
+def get_cassette() -> Optional[Cassette]:
+    """Cassette chosen by CASSETTE_MODE ("record" or "replay"), None when off."""
+    global _cassette
+    if _cassette is None:
+        mode = os.getenv("CASSETTE_MODE", "off")
+        if mode == "off":
+            return None
+        _cassette = Cassette(
+            os.getenv("CASSETTE_PATH", "cache/cassette.jsonl.gz"),
+            mode,
+            speed=float(os.getenv("CASSETTE_SPEED", "0")),
+            fallback=os.getenv("CASSETTE_FALLBACK", "none")
+        )
+    return _cassette
+
+
+def close_cassette():
+    """Flush a recording to disk."""
+    if _cassette is not None:
+        _cassette.close()
+
+
+def get_cassette_stats() -> Optional[dict]:
+    return _cassette.get_stats() if _cassette is not None else None
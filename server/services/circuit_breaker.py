@@ -0,0 +1,147 @@
+import time
+from collections import deque
+from enum import Enum
+from typing import Any, Dict, Optional
+from services.log import get_logger
+
+log = get_logger("circuit")
+
+
+class CircuitState(str, Enum):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised when a call is rejected without reaching the upstream service."""
+
+    def __init__(self, name: str, status: str, retry_after: float):
+        self.status = status
+        self.retry_after = retry_after
+        super().__init__(f"{name} circuit is open ({status}), retry after {retry_after:.1f}s")
+
+
+class CircuitBreaker:
+    """Closed/open/half-open breaker driven by error rate and cold-start responses.
+
+    - closed: calls go through, outcomes are tracked over a sliding window;
+      the circuit opens when the error rate crosses `error_threshold`, or right
+      away when the upstream reports it is still initializing.
+    - open: calls fail fast with a retry-after hint.
+    - half-open: a single probe call is let through; its outcome closes or
+      re-opens the circuit.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        window_size: int = 20,
+        min_calls: int = 5,
+        error_threshold: float = 0.5,
+        open_timeout: float = 10.0,
+        max_open_timeout: float = 120.0,
+        cold_start_timeout: float = 30.0,
+        probe_retry_after: float = 2.0,
+    ):
+        self.name = name
+        self.min_calls = min_calls
+        self.error_threshold = error_threshold
+        self.open_timeout = open_timeout
+        self.max_open_timeout = max_open_timeout
+        self.cold_start_timeout = cold_start_timeout
+        self.probe_retry_after = probe_retry_after
+
+        self.state = CircuitState.CLOSED
+        self._outcomes = deque(maxlen=window_size)  # True = échec
+        self._opened_until = 0.0
+        self._current_open_timeout = open_timeout
+        self._open_status = "unavailable"
+        self._probe_in_flight = False
+
+        self.rejected = 0
+        self.times_opened = 0
+
+    @property
+    def retry_after(self) -> float:
+        """Seconds before a new call has a chance of reaching the upstream service."""
+        if self.state == CircuitState.OPEN:
+            return max(0.0, self._opened_until - time.monotonic())
+        if self.state == CircuitState.HALF_OPEN and self._probe_in_flight:
+            return self.probe_retry_after
+        return 0.0
+
+    def _reject(self):
+        self.rejected += 1
+        raise CircuitOpenError(self.name, self._open_status, self.retry_after)
+
+    def check(self):
+        """Fail fast when the circuit is open. Does not take the probe slot."""
+        if self.state == CircuitState.OPEN and time.monotonic() < self._opened_until:
+            self._reject()
+        if self.state == CircuitState.HALF_OPEN and self._probe_in_flight:
+            self._reject()
+
+    def acquire(self):
+        """Call right before the upstream request; may grant the half-open probe."""
+        if self.state == CircuitState.OPEN:
+            if time.monotonic() < self._opened_until:
+                self._reject()
+            self.state = CircuitState.HALF_OPEN
+        if self.state == CircuitState.HALF_OPEN:
+            if self._probe_in_flight:
+                self._reject()
+            self._probe_in_flight = True
+
+    def release_probe(self):
+        """Free the probe slot if the call ended without a recorded outcome (e.g. cancelled)."""
+        self._probe_in_flight = False
+
+    def record_success(self):
+        if self.state != CircuitState.CLOSED:
+            log.info("Probe succeeded, closing circuit", breaker=self.name)
+            self.state = CircuitState.CLOSED
+            self._outcomes.clear()
+            self._current_open_timeout = self.open_timeout
+        self._probe_in_flight = False
+        self._outcomes.append(False)
+
+    def record_failure(self, initializing: bool = False, retry_after: Optional[float] = None):
+        self._probe_in_flight = False
+        if initializing:
+            # L'endpoint est froid : inutile d'attendre d'atteindre le seuil
+            self._open("initializing", retry_after or self.cold_start_timeout)
+            return
+        if self.state == CircuitState.HALF_OPEN:
+            self._current_open_timeout = min(self._current_open_timeout * 2, self.max_open_timeout)
+            self._open("unavailable", self._current_open_timeout)
+            return
+        self._outcomes.append(True)
+        if len(self._outcomes) >= self.min_calls and self.error_rate >= self.error_threshold:
+            self._open("unavailable", self._current_open_timeout)
+
+    def _open(self, status: str, duration: float):
+        if self.state != CircuitState.OPEN:
+            self.times_opened += 1
+            log.warning("Opening circuit", breaker=self.name, status=status, seconds=round(duration, 1))
+        self.state = CircuitState.OPEN
+        self._open_status = status
+        self._opened_until = time.monotonic() + duration
+        self._outcomes.clear()
+
+    @property
+    def error_rate(self) -> float:
+        if not self._outcomes:
+            return 0.0
+        return sum(self._outcomes) / len(self._outcomes)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "state": self.state.value,
+            "status": self._open_status if self.state != CircuitState.CLOSED else "healthy",
+            "error_rate": round(self.error_rate, 3),
+            "retry_after": round(self.retry_after, 3),
+            "rejected": self.rejected,
+            "times_opened": self.times_opened,
+        }
@@ -0,0 +1,263 @@
+import asyncio
+import os
+import time
+import aiohttp
+from typing import AsyncIterator, Dict, List, Optional
+
+from services.audio_cache import AudioCache
+from services.http_transport import HttpTransport, get_http_transport
+from services.priority_limiter import Priority, PriorityLimiter
+from services.metrics import time_stage
+from services.tracing import span
+from services.inflight import get_inflight
+from services.singleflight import SingleFlight
+from services.log import get_logger
+
+log = get_logger("tts")
+
+DEFAULT_MODEL_ID = "eleven_multilingual_v2"
+# Voix du client et de la narration : chacune a sa propre file
+DEFAULT_VOICE_IDS = "21m00Tcm4TlvDq8ikWAM,nPczCjzI2devNBz1zQrb"
+OTHER_VOICES = "other"
+DEFAULT_VOICE_SETTINGS = {
+    "stability": 0.5,
+    "similarity_boost": 0.75
+}
+
+
+class SpeechError(Exception):
+    """ElevenLabs refused or failed a synthesis before sending any audio."""
+
+    def __init__(self, status: int, detail: str):
+        super().__init__(detail)
+        self.status = status
+        self.detail = detail
+
+
+class _AudioBroadcast:
+    """Chunks of one synthesis as they arrive, readable by any number of listeners."""
+
+    def __init__(self):
+        self.chunks: List[bytes] = []
+        # Place dans la file de la voix, pour la remonter si un client attend
+        self.tickets: list = []
+        self.done = False
+        self.error: Optional[SpeechError] = None
+        self._changed = asyncio.Event()
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def append(self, chunk: bytes):
+        self.chunks.append(chunk)
+        self._notify()
+
+    def finish(self, error: Optional[SpeechError] = None):
+        self.done = True
+        self.error = error
+        self._notify()
+
+    async def started(self):
+        """Wait for the first chunk. Raises SpeechError if the synthesis failed first."""
+        while not self.chunks and not self.done:
+            await self._changed.wait()
+        if not self.chunks and self.error:
+            raise self.error
+
+    async def read(self) -> AsyncIterator[bytes]:
+        index = 0
+        while True:
+            changed = self._changed
+            while index < len(self.chunks):
+                yield self.chunks[index]
+                index += 1
+            if self.done:
+                if self.error:
+                    raise self.error
+                return
+            await changed.wait()
+
+
+class ElevenLabsClient:
+    """Text-to-speech through ElevenLabs' streaming endpoint, with a content-addressed cache.
+
+    A narration is identified by its text, voice, model and voice settings.
+    Concurrent requests for the same narration share one upstream stream and
+    can start playing from its first chunk; the complete MP3 is then cached.
+    """
+
+    STREAM_CHUNK_SIZE = 16384
+
+    def __init__(self, api_key: Optional[str], audio_cache: AudioCache, model_id: str = DEFAULT_MODEL_ID, voice_settings: Optional[dict] = None, transport: Optional[HttpTransport] = None):
+        self.api_key = api_key
+        self.audio_cache = audio_cache
+        self.model_id = model_id
+        self.voice_settings = voice_settings or DEFAULT_VOICE_SETTINGS
+        self.api_url = os.getenv("ELEVEN_LABS_API_URL", "https://api.elevenlabs.io/v1/text-to-speech")
+        self.transport = transport or get_http_transport()
+        # Pas de délai total : une longue narration peut streamer plus longtemps
+        self.timeout = aiohttp.ClientTimeout(connect=self.transport.timeout.connect, sock_read=30)
+        # Synthèses simultanées par voix, le reste attend par priorité
+        self.max_concurrency_per_voice = int(os.getenv("ELEVEN_LABS_MAX_CONCURRENCY_PER_VOICE", "2"))
+        # voice_id vient du client : les voix hors liste partagent une seule file,
+        # pour borner le nombre de files et de labels de métriques
+        self.voice_ids = {voice.strip() for voice in os.getenv("ELEVEN_LABS_VOICE_IDS", DEFAULT_VOICE_IDS).split(",") if voice.strip()}
+        self._limiters: Dict[str, PriorityLimiter] = {}
+        self._broadcasts: Dict[str, _AudioBroadcast] = {}
+        # Garde une référence sur les synthèses en cours
+        self._tasks = set()
+
+        self.upstream_calls = 0
+        self.joined = 0
+        self.cache_hits = 0
+        self.failures = 0
+        self.bytes_streamed = 0
+        self.avg_time_to_first_byte: Optional[float] = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.api_key)
+
+    @staticmethod
+    def clean_text(text: str) -> str:
+        # Nettoyer le texte des balises markdown
+        return text.replace("**", "")
+
+    def get_audio_id(self, text: str, voice_id: str) -> str:
+        return SingleFlight.make_key(self.clean_text(text), voice_id, self.model_id, self.voice_settings)[:32]
+
+    def _get_limiter(self, voice_id: str) -> PriorityLimiter:
+        key = voice_id if voice_id in self.voice_ids else OTHER_VOICES
+        if key not in self._limiters:
+            self._limiters[key] = PriorityLimiter(f"elevenlabs:{key}", self.max_concurrency_per_voice)
+        return self._limiters[key]
+
+    async def open_stream(self, text: str, voice_id: str, priority: Priority = Priority.PANEL) -> AsyncIterator[bytes]:
+        """Return an iterator over the MP3 chunks of a narration.
+
+        Served from the cache when possible, otherwise joins or starts the
+        upstream synthesis. Raises SpeechError if ElevenLabs fails before the
+        first chunk. Narrations synthesized ahead of time use PREFETCH
+        priority and move up when a client starts waiting for them.
+        """
+        audio_id = self.get_audio_id(text, voice_id)
+        cached = await self.audio_cache.get(audio_id, ext="mp3")
+        if cached is not None:
+            self.cache_hits += 1
+            return self._iter_cached(cached)
+
+        broadcast = self._broadcasts.get(audio_id)
+        if broadcast is None:
+            broadcast = self._start(audio_id, text, voice_id, priority)
+        else:
+            self.joined += 1
+            for ticket in broadcast.tickets:
+                self._get_limiter(voice_id).promote(ticket, priority)
+        await broadcast.started()
+        return self._count(broadcast.read())
+
+    async def synthesize(self, text: str, voice_id: str, priority: Priority = Priority.PANEL) -> bytes:
+        """Complete MP3 of a narration."""
+        stream = await self.open_stream(text, voice_id, priority)
+        return b"".join([chunk async for chunk in stream])
+
+    async def _iter_cached(self, data: bytes) -> AsyncIterator[bytes]:
+        for start in range(0, len(data), self.STREAM_CHUNK_SIZE):
+            chunk = data[start:start + self.STREAM_CHUNK_SIZE]
+            self.bytes_streamed += len(chunk)
+            yield chunk
+
+    async def _count(self, stream: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+        async for chunk in stream:
+            self.bytes_streamed += len(chunk)
+            yield chunk
+
+    def _start(self, audio_id: str, text: str, voice_id: str, priority: Priority) -> _AudioBroadcast:
+        broadcast = _AudioBroadcast()
+        self._broadcasts[audio_id] = broadcast
+        # La synthèse continue même si tous les clients partent : elle remplit le cache
+        task = asyncio.ensure_future(self._synthesize(audio_id, text, voice_id, priority, broadcast))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return broadcast
+
+    async def _synthesize(self, audio_id: str, text: str, voice_id: str, priority: Priority, broadcast: _AudioBroadcast):
+        try:
+            if not self.api_key:
+                raise SpeechError(500, "ElevenLabs API key not configured")
+            with time_stage("tts"), get_inflight().track("tts", voice_id=voice_id, chars=len(text)) as op:
+                op.set_state("queued")
+                async with self._get_limiter(voice_id).slot(priority, broadcast.tickets):
+                    op.attempt = 1
+                    op.set_state("streaming")
+                    with span("tts.request", voice_id=voice_id):
+                        await self._post(text, voice_id, broadcast)
+
+            # En cache avant de libérer la clé, pour qu'une nouvelle requête ne relance pas la synthèse
+            try:
+                await self.audio_cache.put(audio_id, b"".join(broadcast.chunks), ext="mp3")
+            except OSError as e:
+                log.warning("Failed to cache narration", audio_id=audio_id, error=str(e))
+            broadcast.finish()
+        except SpeechError as e:
+            self.failures += 1
+            log.warning("Synthesis failed", voice_id=voice_id, status=e.status, error=e.detail)
+            broadcast.finish(e)
+        except Exception as e:
+            self.failures += 1
+            log.exception("Synthesis failed", voice_id=voice_id, error=str(e))
+            broadcast.finish(SpeechError(502, str(e) or type(e).__name__))
+        except asyncio.CancelledError:
+            broadcast.finish(SpeechError(503, "Synthesis cancelled"))
+            raise
+        finally:
+            self._broadcasts.pop(audio_id, None)
+
+    async def _post(self, text: str, voice_id: str, broadcast: _AudioBroadcast):
+        self.upstream_calls += 1
+        started = time.monotonic()
+        async with self.transport.post(
+            f"{self.api_url}/{voice_id}/stream",
+            timeout=self.timeout,
+            headers={
+                "Accept": "audio/mpeg",
+                "Content-Type": "application/json",
+                "xi-api-key": self.api_key
+            },
+            json={
+                "text": self.clean_text(text),
+                "model_id": self.model_id,
+                "voice_settings": self.voice_settings
+            }
+        ) as response:
+            if response.status != 200:
+                raise SpeechError(response.status, await response.text())
+            async for chunk in response.content.iter_chunked(self.STREAM_CHUNK_SIZE):
+                if not broadcast.chunks:
+                    self._record_first_byte(time.monotonic() - started)
+                broadcast.append(chunk)
+
+    def _record_first_byte(self, seconds: float):
+        if self.avg_time_to_first_byte is None:
+            self.avg_time_to_first_byte = seconds
+        else:
+            self.avg_time_to_first_byte += 0.2 * (seconds - self.avg_time_to_first_byte)
+
+    async def close(self):
+        for task in list(self._tasks):
+            task.cancel()
+
+    def get_stats(self) -> dict:
+        requests = self.upstream_calls + self.joined + self.cache_hits
+        return {
+            "upstream_calls": self.upstream_calls,
+            "joined": self.joined,
+            "cache_hits": self.cache_hits,
+            "hit_rate": round((self.joined + self.cache_hits) / requests, 3) if requests else None,
+            "in_flight": len(self._broadcasts),
+            "voices": [limiter.get_stats() for limiter in self._limiters.values()],
+            "failures": self.failures,
+            "bytes_streamed": self.bytes_streamed,
+            "avg_time_to_first_byte": self.avg_time_to_first_byte,
+        }
@@ -1,81 +1,357 @@
 import os
+import json
+import time
+import base64
 import aiohttp
-from typing import Optional, Tuple
+from typing import Dict, List, Optional, Tuple
+
+from services.singleflight import SingleFlight
+from services.priority_limiter import Priority, PriorityLimiter
+from services.metrics import time_stage
+from services.tracing import span
+from services.log import get_logger
+from services.inflight import get_inflight
+from services.circuit_breaker import CircuitBreaker, CircuitOpenError
+from services.http_transport import HttpTransport, get_http_transport
+from services.cassette import CassetteMissError, ReplayedError, get_cassette
+
+log = get_logger("flux")
+
+class FluxEndpoint:
+    """One image inference replica, with its own health state and latency estimate."""
+
+    def __init__(self, url: str, weight: float = 1.0, ewma_alpha: float = 0.2):
+        self.url = url
+        self.weight = weight
+        self.outstanding = 0
+        self.latency_ewma: Optional[float] = None
+        self._ewma_alpha = ewma_alpha
+        # Évite de marteler un endpoint froid ou en erreur
+        self.circuit_breaker = CircuitBreaker(f"flux:{url}")
+        self.requests = 0
+        self.failures = 0
+
+    def record_latency(self, seconds: float):
+        if self.latency_ewma is None:
+            self.latency_ewma = seconds
+        else:
+            self.latency_ewma += self._ewma_alpha * (seconds - self.latency_ewma)
+
+    def score(self, default_latency: float) -> float:
+        """Expected completion time of one more request; lower is better."""
+        latency = self.latency_ewma if self.latency_ewma is not None else default_latency
+        return (self.outstanding + 1) * latency / self.weight
+
+    def get_stats(self) -> dict:
+        return {
+            "url": self.url,
+            "weight": self.weight,
+            "outstanding": self.outstanding,
+            "latency_ewma": self.latency_ewma,
+            "requests": self.requests,
+            "failures": self.failures,
+            "circuit_breaker": self.circuit_breaker.get_stats(),
+        }
+
+
+def parse_endpoints(value: str) -> List[FluxEndpoint]:
+    """Parse "url[|weight],url[|weight]" into endpoints. Weights must be positive numbers."""
+    endpoints = []
+    for item in (value or "").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        url, _, weight = item.partition("|")
+        try:
+            weight = float(weight) if weight else 1.0
+        except ValueError:
+            weight = None
+        # Un poids nul diviserait par zéro dans score(), un poids négatif inverserait le classement
+        if weight is None or not 0 < weight < float("inf"):
+            raise ValueError(f"Invalid weight in FLUX_ENDPOINTS entry {item!r}: expected a number greater than 0")
+        endpoints.append(FluxEndpoint(url.strip(), weight))
+    return endpoints
+
 
 class FluxClient:
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, endpoints: Optional[List[FluxEndpoint]] = None, transport: Optional[HttpTransport] = None):
         self.api_key = api_key
-        self.endpoint = os.getenv("FLUX_ENDPOINT")
-        self._session = None
-    
-    async def _get_session(self):
-        if self._session is None:
-            self._session = aiohttp.ClientSession()
-        return self._session
+        # FLUX_ENDPOINTS permet de répartir la charge sur plusieurs répliques
+        self.endpoints = endpoints or parse_endpoints(os.getenv("FLUX_ENDPOINTS") or os.getenv("FLUX_ENDPOINT", ""))
+        self.transport = transport or get_http_transport()
+        # Enregistrement ou rejeu des rendus (CASSETTE_MODE)
+        self.cassette = get_cassette()
+        if self.cassette is not None and self.cassette.replaying and not self.endpoints:
+            # Rejeu sans endpoint configuré : le pipeline garde un endpoint, ses disjoncteurs et ses stats
+            self.endpoints = [FluxEndpoint("cassette")]
+        # Un rendu peut dépasser le délai de lecture par défaut du pool
+        self.timeout = aiohttp.ClientTimeout(
+            total=float(os.getenv("FLUX_TIMEOUT", "120")),
+            connect=self.transport.timeout.connect
+        )
+        # Les requêtes identiques en cours partagent un seul appel GPU
+        self._singleflight = SingleFlight("flux")
+        # Nombre de rendus envoyés simultanément par endpoint, le reste attend par priorité
+        per_endpoint = int(os.getenv("FLUX_MAX_CONCURRENCY", "2"))
+        self.limiter = PriorityLimiter("flux", per_endpoint * max(1, len(self.endpoints)))
+        self._pending_tickets = {}
+        # ID de l'appelant (panel_id) -> clé de la requête, pour retrouver sa place dans la file
+        self._request_keys: Dict[str, str] = {}
     
     async def generate_image(self, 
                       prompt: str, 
                       width: int, 
                       height: int,
                       num_inference_steps: int = 5,
-                      guidance_scale: float = 9.0) -> Tuple[Optional[bytes], Optional[str]]:
-        """Génère une image à partir d'un prompt."""
+                      guidance_scale: float = 9.0,
+                      priority: Priority = Priority.PANEL,
+                      request_id: Optional[str] = None) -> Tuple[Optional[bytes], Optional[str]]:
+        """Génère une image à partir d'un prompt.
+
+        Concurrent calls with identical parameters are coalesced into a single
+        upstream request and all receive its result. Upstream requests are
+        dispatched by `priority` with bounded concurrency; cancelling the
+        caller while it is queued drops the request. Each request goes to the
+        endpoint with the least expected work and fails over to the next one
+        on 5xx or "initializing". When every endpoint's circuit breaker is
+        open, calls fail fast with "initializing" or "unavailable" and
+        `retry_after` gives the retry hint. While the call is pending,
+        `get_request_status(request_id)` reports where it stands.
+        """
+        # Ensure dimensions are multiples of 8
+        width = (width // 8) * 8
+        height = (height // 8) * 8
+
+        if not self._available_endpoints():
+            return None, self._unavailable_status()
+
+        key = SingleFlight.make_key(prompt, width, height, num_inference_steps, guidance_scale)
+
+        # Un appelant plus urgent fait remonter la requête déjà en file
+        for ticket in self._pending_tickets.get(key, []):
+            self.limiter.promote(ticket, priority)
+
+        if request_id is not None:
+            self._request_keys[request_id] = key
+        try:
+            with time_stage("flux") as stage:
+                image, error = await self._singleflight.do(
+                    key,
+                    lambda: self._queued_generate_image(key, priority, prompt, width, height, num_inference_steps, guidance_scale)
+                )
+                if image is None:
+                    stage.outcome = "error"
+        finally:
+            if request_id is not None and self._request_keys.get(request_id) == key:
+                del self._request_keys[request_id]
+        return image, error
+
+    async def _queued_generate_image(self, key: str, priority: Priority, *args) -> Tuple[Optional[bytes], Optional[str]]:
+        tickets = []
+        self._pending_tickets[key] = tickets
+        prompt, width, height = args[:3]
+        try:
+            with get_inflight().track("flux", prompt=prompt[:80], width=width, height=height, priority=Priority(priority).name.lower()) as op:
+                op.set_state("queued")
+                async with self.limiter.slot(priority, tickets):
+                    self._pending_tickets.pop(key, None)
+                    return await self._generate_with_failover(*args, op=op)
+        finally:
+            self._pending_tickets.pop(key, None)
+
+    def _available_endpoints(self) -> List[FluxEndpoint]:
+        available = []
+        for endpoint in self.endpoints:
+            try:
+                endpoint.circuit_breaker.check()
+                available.append(endpoint)
+            except CircuitOpenError:
+                pass
+        return available
+
+    def _unavailable_status(self) -> str:
+        statuses = {endpoint.circuit_breaker.get_stats()["status"] for endpoint in self.endpoints}
+        return "initializing" if "initializing" in statuses else "unavailable"
+
+    @property
+    def retry_after(self) -> float:
+        """Seconds before an endpoint may accept requests again, 0 if one is available."""
+        if not self.endpoints or self._available_endpoints():
+            return 0.0
+        return min(endpoint.circuit_breaker.retry_after for endpoint in self.endpoints)
+
+    def _pick_endpoint(self, exclude) -> Optional[FluxEndpoint]:
+        """Least expected work first, skipping endpoints whose breaker rejects the call."""
+        known = [e.latency_ewma for e in self.endpoints if e.latency_ewma is not None]
+        default_latency = sum(known) / len(known) if known else 1.0
+        candidates = sorted(
+            (e for e in self.endpoints if e not in exclude),
+            key=lambda e: e.score(default_latency)
+        )
+        for endpoint in candidates:
+            try:
+                endpoint.circuit_breaker.acquire()
+                return endpoint
+            except CircuitOpenError:
+                continue
+        return None
+
+    async def _generate_with_failover(self, *args, op=None) -> Tuple[Optional[bytes], Optional[str]]:
+        tried = set()
+        result = (None, self._unavailable_status())
+        while True:
+            endpoint = self._pick_endpoint(tried)
+            if endpoint is None:
+                return result
+            tried.add(endpoint)
+            if op is not None:
+                op.attempt += 1
+                op.set_state("rendering", endpoint=endpoint.url)
+            with span("flux.request", endpoint=endpoint.url):
+                image, error, retryable = await self._generate_on_endpoint(endpoint, *args)
+            result = (image, error)
+            if image is not None or not retryable:
+                return result
+            log.warning("Endpoint failed, trying next endpoint", endpoint=endpoint.url, error=error)
+
+    def get_request_status(self, request_id: str) -> Optional[dict]:
+        """Where a pending call stands: its queue position and expected wait, or rendering.
+
+        None when no call with this `request_id` is pending.
+        """
+        key = self._request_keys.get(request_id)
+        if key is None:
+            return None
+        tickets = self._pending_tickets.get(key)
+        position = self.limiter.position(tickets[0]) if tickets else None
+        if position is None:
+            return {"state": "rendering", "position": None, "expected_wait": None}
+        return {
+            "state": "queued",
+            "position": position,
+            "expected_wait": round(self.limiter.expected_wait(position), 3),
+        }
+
+    def get_queue_status(self, priority: Priority = Priority.PANEL) -> dict:
+        """Queue position and expected wait (seconds) a new request at `priority` would get."""
+        return {
+            **self.limiter.estimate(priority),
+            "active": self.limiter.active,
+            "queued": self.limiter.queued,
+        }
+
+    async def _generate_on_endpoint(self,
+                      endpoint: FluxEndpoint,
+                      prompt: str,
+                      width: int,
+                      height: int,
+                      num_inference_steps: int,
+                      guidance_scale: float) -> Tuple[Optional[bytes], Optional[str], bool]:
+        """Returns (image, error, retryable on another endpoint)."""
+        endpoint.outstanding += 1
+        endpoint.requests += 1
+        breaker = endpoint.circuit_breaker
+        start_time = time.monotonic()
         try:
-            # Ensure dimensions are multiples of 8
-            width = (width // 8) * 8
-            height = (height // 8) * 8
+            log.debug("Sending request", endpoint=endpoint.url, width=width, height=height, prompt=prompt[:100])
+
+            status, body = await self._post(endpoint, {
+                "inputs": prompt,
+                "parameters": {
+                    "num_inference_steps": num_inference_steps,
+                    "guidance_scale": guidance_scale,
+                    "width": width,
+                    "height": height,
+                    "negative_prompt": "Bubbles, text, caption. Do not include bright or clean clothing."
+                }
+            })
+
+            # Vérifier si le modèle est en cours d'initialisation
+            if status == 503:
+                endpoint.failures += 1
+                error_content = body.decode("utf-8", errors="replace")
+                if "currently loading" in error_content.lower() or "initializing" in error_content.lower():
+                    breaker.record_failure(
+                        initializing=True,
+                        retry_after=self._parse_estimated_time(error_content)
+                    )
+                    return None, "initializing", True
+                breaker.record_failure()
+                return None, "unavailable", True
+
+            if status == 200:
+                breaker.record_success()
+                endpoint.record_latency(time.monotonic() - start_time)
+                return body, None, False
+            else:
+                error_content = body.decode("utf-8", errors="replace")
+                log.warning("Error from Flux API", endpoint=endpoint.url, status=status, response=error_content)
+                # Les erreurs 4xx viennent de la requête, pas de l'endpoint
+                if status >= 500:
+                    endpoint.failures += 1
+                    breaker.record_failure()
+                    return None, error_content, True
+                return None, error_content, False
+
+        except CassetteMissError as e:
+            # Pas d'enregistrement pour ce rendu : ni l'endpoint ni une autre réplique n'y peuvent rien
+            return None, str(e), False
+        except Exception as e:
+            endpoint.failures += 1
+            breaker.record_failure()
+            log.exception("Request failed", endpoint=endpoint.url, error=str(e))
+            return None, str(e), True
+        finally:
+            endpoint.outstanding -= 1
+            breaker.release_probe()
             
-            print(f"Sending request to Hugging Face API: {self.endpoint}")
-            print(f"Headers: Authorization: Bearer {self.api_key[:4]}...")
-            print(f"Request body: {prompt[:100]}...")
+    async def _post(self, endpoint: FluxEndpoint, payload: dict) -> Tuple[int, bytes]:
+        """Status and body of one render, recorded to or replayed from the cassette if there is one."""
+        # Clé sans l'endpoint : un rendu rejoué ne dépend pas de la réplique qui l'a servi
+        key = SingleFlight.make_key("flux", payload) if self.cassette is not None else None
+        if self.cassette is not None and self.cassette.replaying:
+            entry = self.cassette.lookup("flux", key)
+            await self.cassette.delay(entry["latency"])
+            if "error" in entry:
+                raise ReplayedError(entry["error"])
+            return entry["status"], base64.b64decode(entry["body"])
 
-            session = await self._get_session()
-            async with session.post(
-                self.endpoint,
+        started = time.perf_counter()
+        try:
+            async with self.transport.post(
+                endpoint.url,
+                timeout=self.timeout,
                 headers={
                     "Authorization": f"Bearer {self.api_key}",
                     "Accept": "image/jpeg"
                 },
-                json={
-                    "inputs": prompt,
-                    "parameters": {
-                        "num_inference_steps": num_inference_steps,
-                        "guidance_scale": guidance_scale,
-                        "width": width,
-                        "height": height,
-                        "negative_prompt": "Bubbles, text, caption. Do not include bright or clean clothing."
-                    }
-                }
+                json=payload
             ) as response:
-                print(f"Response status code: {response.status}")
-                print(f"Response headers: {response.headers}")
-                
-                # Vérifier si le modèle est en cours d'initialisation
-                if response.status == 503:
-                    error_content = await response.text()
-                    if "currently loading" in error_content.lower() or "initializing" in error_content.lower():
-                        return None, "initializing"
-                    return None, "unavailable"
-                
-                if response.status == 200:
-                    content = await response.read()
-                    return content, None
-                else:
-                    error_content = await response.text()
-                    print(f"Error from Flux API: {response.status}")
-                    print(f"Response content: {error_content}")
-                    return None, error_content
-                
+                log.debug("Response received", endpoint=endpoint.url, status=response.status)
+                body = await response.read()
         except Exception as e:
-            print(f"Error in FluxClient.generate_image: {str(e)}")
-            import traceback
-            print(f"Traceback: {traceback.format_exc()}")
-            return None, str(e)
-            
-    async def close(self):
-        if self._session:
-            await self._session.close()
-            self._session = None
+            if self.cassette is not None:
+                self.cassette.record("flux", key, started, error=str(e))
+            raise
+        if self.cassette is not None:
+            self.cassette.record("flux", key, started, status=response.status, body=body)
+        return response.status, body
+
+    @staticmethod
+    def _parse_estimated_time(error_content: str) -> Optional[float]:
+        """Hugging Face renvoie `estimated_time` pendant le chargement du modèle."""
+        try:
+            return float(json.loads(error_content).get("estimated_time"))
+        except (ValueError, TypeError, AttributeError):
+            return None
+
+    def get_stats(self) -> dict:
+        """Return request coalescing, queue and per-endpoint counters."""
+        return {
+            "singleflight": self._singleflight.get_stats(),
+            "limiter": self.limiter.get_stats(),
+            "endpoints": [endpoint.get_stats() for endpoint in self.endpoints],
+        }
 
     async def check_health(self) -> Tuple[bool, Optional[str]]:
         """
@@ -92,7 +368,8 @@ class FluxClient:
                 prompt="test image, simple circle",
                 width=64,  # Petite image pour le test
                 height=64,
-                num_inference_steps=1  # Minimum d'étapes pour être rapide
+                num_inference_steps=1,  # Minimum d'étapes pour être rapide
+                priority=Priority.WARMUP
             )
             
             if test_image is not None:
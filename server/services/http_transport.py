@@ -0,0 +1,158 @@
+import os
+import time
+from collections import Counter
+from typing import Optional
+
+import aiohttp
+
+
+class HttpTransport:
+    """Outbound HTTP connection pool shared by every upstream client.
+
+    One aiohttp session with per-host connection limits, keep-alive and a
+    DNS cache. Requests get connect/read/total timeouts by default, which a
+    caller can override per request (e.g. long image renders). Trace hooks
+    count connection reuse and time spent waiting for a free connection, to
+    size the pool. Connections in use are read from the connector: a
+    connection stays in use until its response body has been read or the
+    response closed, which covers streamed TTS and SSE bodies.
+    """
+
+    def __init__(self):
+        self.limit = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+        self.limit_per_host = int(os.getenv("HTTP_MAX_CONNECTIONS_PER_HOST", "20"))
+        self.keepalive_timeout = float(os.getenv("HTTP_KEEPALIVE_TIMEOUT", "30"))
+        self.dns_cache_ttl = int(os.getenv("HTTP_DNS_CACHE_TTL", "300"))
+        self.timeout = aiohttp.ClientTimeout(
+            total=float(os.getenv("HTTP_TIMEOUT", "300")),
+            connect=float(os.getenv("HTTP_CONNECT_TIMEOUT", "10")),
+            sock_read=float(os.getenv("HTTP_READ_TIMEOUT", "60"))
+        )
+        self._session: Optional[aiohttp.ClientSession] = None
+
+        self.requests = 0
+        self.failures = 0
+        self.connections_created = 0
+        self.connections_reused = 0
+        self.pool_waits = 0
+        self.pool_wait_seconds = 0.0
+
+    def _trace_config(self) -> aiohttp.TraceConfig:
+        trace_config = aiohttp.TraceConfig()
+
+        async def on_request_start(session, context, params):
+            self.requests += 1
+
+        async def on_request_exception(session, context, params):
+            self.failures += 1
+
+        async def on_connection_queued_start(session, context, params):
+            context.queued_at = time.monotonic()
+            self.pool_waits += 1
+
+        async def on_connection_queued_end(session, context, params):
+            self.pool_wait_seconds += time.monotonic() - context.queued_at
+
+        async def on_connection_create_end(session, context, params):
+            self.connections_created += 1
+
+        async def on_connection_reuseconn(session, context, params):
+            self.connections_reused += 1
+
+        trace_config.on_request_start.append(on_request_start)
+        trace_config.on_request_exception.append(on_request_exception)
+        trace_config.on_connection_queued_start.append(on_connection_queued_start)
+        trace_config.on_connection_queued_end.append(on_connection_queued_end)
+        trace_config.on_connection_create_end.append(on_connection_create_end)
+        trace_config.on_connection_reuseconn.append(on_connection_reuseconn)
+        return trace_config
+
+    async def start(self):
+        """Open the pool. Called at startup; safe to call more than once."""
+        self._open()
+
+    def _open(self) -> aiohttp.ClientSession:
+        # Aucun await ici : deux coroutines ne peuvent pas créer chacune une session
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                keepalive_timeout=self.keepalive_timeout,
+                ttl_dns_cache=self.dns_cache_ttl,
+                use_dns_cache=True
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=self.timeout,
+                trace_configs=[self._trace_config()]
+            )
+        return self._session
+
+    @property
+    def connections_in_use(self) -> int:
+        if self._session is None or self._session.closed:
+            return 0
+        return len(self._session.connector._acquired)
+
+    @property
+    def connections_in_use_by_host(self) -> Counter:
+        in_use: Counter = Counter()
+        if self._session is not None and not self._session.closed:
+            for key, protocols in self._session.connector._acquired_per_host.items():
+                if protocols:
+                    in_use[key.host] += len(protocols)
+        return in_use
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        """The shared session, opened on first use outside the server (scripts)."""
+        return self._open()
+
+    def request(self, method: str, url: str, **kwargs):
+        """Same as `aiohttp.ClientSession.request`, on the shared pool."""
+        return self.session.request(method, url, **kwargs)
+
+    def post(self, url: str, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def get(self, url: str, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def get_stats(self) -> dict:
+        connections = self.connections_created + self.connections_reused
+        in_use = self.connections_in_use
+        return {
+            "limit": self.limit,
+            "limit_per_host": self.limit_per_host,
+            "connections_in_use": in_use,
+            "connections_in_use_by_host": dict(self.connections_in_use_by_host),
+            "utilization": round(in_use / self.limit, 3) if self.limit else None,
+            "requests": self.requests,
+            "failures": self.failures,
+            "connections_created": self.connections_created,
+            "connections_reused": self.connections_reused,
+            "reuse_ratio": round(self.connections_reused / connections, 3) if connections else None,
+            "pool_waits": self.pool_waits,
+            "pool_wait_seconds": round(self.pool_wait_seconds, 3),
+        }
+
+
+_transport: Optional[HttpTransport] = None
+
+
+def get_http_transport() -> HttpTransport:
+    """Transport shared by the whole process."""
+    global _transport
+    if _transport is None:
+        _transport = HttpTransport()
+    return _transport
+
+
+async def close_http_transport():
+    if _transport is not None:
+        await _transport.close()
@@ -0,0 +1,51 @@
+import asyncio
+import os
+import uuid
+from pathlib import Path
+from typing import Optional
+
+
+class ImageCache:
+    """On-disk store of rendered panels, addressed by panel ID.
+
+    Each panel keeps its full-quality render as `<panel_id>.jpg`; other
+    renditions of the same panel live next to it as `<panel_id>.<variant>.<ext>`.
+    """
+
+    def __init__(self, cache_dir: Optional[str] = None):
+        self.cache_dir = Path(cache_dir or os.getenv("IMAGE_CACHE_DIR", "cache/images"))
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+
+    def path(self, panel_id: str, variant: Optional[str] = None, ext: str = "jpg") -> Path:
+        name = f"{panel_id}.{variant}.{ext}" if variant else f"{panel_id}.{ext}"
+        return self.cache_dir / name
+
+    def has(self, panel_id: str, variant: Optional[str] = None, ext: str = "jpg") -> bool:
+        return self.path(panel_id, variant, ext).exists()
+
+    async def get(self, panel_id: str, variant: Optional[str] = None, ext: str = "jpg") -> Optional[bytes]:
+        path = self.path(panel_id, variant, ext)
+        try:
+            data = await asyncio.to_thread(path.read_bytes)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return data
+
+    async def put(self, panel_id: str, data: bytes, variant: Optional[str] = None, ext: str = "jpg") -> Path:
+        path = self.path(panel_id, variant, ext)
+        await asyncio.to_thread(self._write_atomic, path, data)
+        return path
+
+    @staticmethod
+    def _write_atomic(path: Path, data: bytes):
+        # Écriture atomique : un lecteur concurrent ne voit jamais un fichier partiel
+        tmp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+
+    def get_stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses}
@@ -0,0 +1,158 @@
+import asyncio
+import io
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+from services.image_cache import ImageCache
+from services.process_pool import get_process_pool
+from services.log import get_logger
+
+log = get_logger("transcoder")
+
+# Pillow fait partie des dépendances ; s'il manque, les JPEG d'origine sont servis tels quels
+try:
+    from PIL import Image, features
+except ImportError:
+    Image = None
+    features = None
+
+# Taille maximale du plus grand côté, None = taille d'origine
+SIZE_VARIANTS: Dict[str, Optional[int]] = {
+    "thumb": 256,
+    "mobile": 768,
+    "full": None,
+}
+
+MEDIA_TYPES = {
+    "avif": "image/avif",
+    "webp": "image/webp",
+    "jpg": "image/jpeg",
+}
+
+ENCODE_QUALITY = {
+    "avif": 60,
+    "webp": 80,
+}
+
+
+def _encode_variants(data: bytes, formats: List[str]) -> Dict[Tuple[str, str], bytes]:
+    """Encode every size variant in every format. Runs in a worker process."""
+    source = Image.open(io.BytesIO(data))
+    source.load()
+    if source.mode not in ("RGB", "RGBA"):
+        source = source.convert("RGB")
+
+    encoded = {}
+    for size, max_side in SIZE_VARIANTS.items():
+        image = source
+        if max_side is not None and max(source.size) > max_side:
+            image = source.copy()
+            image.thumbnail((max_side, max_side))
+        for fmt in formats:
+            buffer = io.BytesIO()
+            image.save(buffer, fmt.upper(), quality=ENCODE_QUALITY[fmt])
+            encoded[(size, fmt)] = buffer.getvalue()
+    return encoded
+
+
+def supported_formats() -> List[str]:
+    if Image is None:
+        return []
+    wanted = [fmt.strip() for fmt in os.getenv("IMAGE_TRANSCODE_FORMATS", "avif,webp").split(",") if fmt.strip()]
+    return [fmt for fmt in wanted if fmt in ENCODE_QUALITY and features.check(fmt)]
+
+
+class ImageTranscoder:
+    """Produces WebP/AVIF size variants of rendered panels in a process pool.
+
+    Variants are stored in the image cache next to the original JPEG, as
+    `<panel_id>.<size>.<format>`. Encoding runs in the shared process pool so
+    it never blocks the event loop.
+    """
+
+    def __init__(self, image_cache: ImageCache):
+        self.image_cache = image_cache
+        self.formats = supported_formats()
+        self._in_flight: Dict[str, asyncio.Task] = {}
+
+        self.transcoded = 0
+        self.encode_seconds = 0.0
+        self.original_bytes = 0
+        self.encoded_bytes = 0
+        self.bytes_saved = 0  # Octets économisés sur les réponses servies
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.formats)
+
+    def choose_format(self, accept: Optional[str]) -> str:
+        """Best format the client accepts, JPEG otherwise."""
+        accept = (accept or "").lower()
+        for fmt in self.formats:
+            if MEDIA_TYPES[fmt] in accept:
+                return fmt
+        return "jpg"
+
+    async def transcode(self, panel_id: str, data: Optional[bytes] = None):
+        """Encode and cache every variant of a panel. Concurrent calls share the work."""
+        if not self.enabled:
+            return
+        task = self._in_flight.get(panel_id)
+        if task is None:
+            task = asyncio.ensure_future(self._transcode(panel_id, data))
+            self._in_flight[panel_id] = task
+            task.add_done_callback(lambda _task: self._in_flight.pop(panel_id, None))
+        await asyncio.shield(task)
+
+    async def _transcode(self, panel_id: str, data: Optional[bytes]):
+        if data is None:
+            data = await self.image_cache.get(panel_id)
+            if data is None:
+                return
+        started = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        encoded = await loop.run_in_executor(get_process_pool(), _encode_variants, data, self.formats)
+        self.encode_seconds += time.perf_counter() - started
+        self.transcoded += 1
+        self.original_bytes += len(data)
+
+        for (size, fmt), variant in encoded.items():
+            self.encoded_bytes += len(variant)
+            await self.image_cache.put(panel_id, variant, variant=size, ext=fmt)
+
+    async def get_variant(self, panel_id: str, size: str, accept: Optional[str]) -> Optional[Tuple[bytes, str]]:
+        """Return (bytes, media type) of the best variant for this client, transcoding on demand."""
+        original = await self.image_cache.get(panel_id)
+        if original is None:
+            return None
+        fmt = self.choose_format(accept)
+        if fmt == "jpg" or size not in SIZE_VARIANTS:
+            return original, MEDIA_TYPES["jpg"]
+
+        variant = await self.image_cache.get(panel_id, variant=size, ext=fmt)
+        if variant is None:
+            try:
+                await self.transcode(panel_id, original)
+            except Exception as e:
+                log.warning("Failed to transcode panel", panel_id=panel_id, error=str(e))
+                return original, MEDIA_TYPES["jpg"]
+            variant = await self.image_cache.get(panel_id, variant=size, ext=fmt)
+            if variant is None:
+                return original, MEDIA_TYPES["jpg"]
+
+        self.bytes_saved += max(0, len(original) - len(variant))
+        return variant, MEDIA_TYPES[fmt]
+
+    def get_stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "formats": self.formats,
+            "transcoded": self.transcoded,
+            "in_flight": len(self._in_flight),
+            "encode_seconds": round(self.encode_seconds, 3),
+            "avg_encode_seconds": round(self.encode_seconds / self.transcoded, 3) if self.transcoded else None,
+            "original_bytes": self.original_bytes,
+            "encoded_bytes": self.encoded_bytes,
+            "bytes_saved": self.bytes_saved,
+        }
@@ -0,0 +1,101 @@
+import itertools
+import time
+from typing import Dict, Optional
+
+from services.metrics import current_generator
+from services.token_usage import current_session
+from services.tracing import get_current_trace
+
+
+class Operation:
+    """One upstream call in progress (LLM call, Flux render, TTS request)."""
+    __slots__ = ("op_id", "kind", "session_id", "generator", "trace_id", "started", "attempt", "state", "state_since", "attributes")
+
+    def __init__(self, op_id: int, kind: str, attributes: dict):
+        trace = get_current_trace()
+        self.op_id = op_id
+        self.kind = kind
+        self.session_id = current_session()
+        self.generator = current_generator()
+        self.trace_id = trace.trace_id if trace else None
+        self.started = time.monotonic()
+        self.attempt = 0
+        self.state = "starting"
+        self.state_since = self.started
+        self.attributes = attributes
+
+    def set_state(self, state: str, **attributes):
+        """`queued`, `rate_limit_wait`, `calling`, `backoff`..., with optional details (endpoint, wait, last_error)."""
+        self.state = state
+        self.state_since = time.monotonic()
+        self.attributes.update(attributes)
+
+    def to_dict(self, now: float) -> dict:
+        return {
+            "id": self.op_id,
+            "kind": self.kind,
+            "session_id": self.session_id,
+            "generator": self.generator,
+            "trace_id": self.trace_id,
+            "attempt": self.attempt,
+            "state": self.state,
+            "elapsed": round(now - self.started, 3),
+            "in_state": round(now - self.state_since, 3),
+            **self.attributes,
+        }
+
+
+class _Tracked:
+    __slots__ = ("registry", "operation")
+
+    def __init__(self, registry: "InflightRegistry", operation: Operation):
+        self.registry = registry
+        self.operation = operation
+
+    def __enter__(self) -> Operation:
+        self.registry._operations[self.operation.op_id] = self.operation
+        return self.operation
+
+    def __exit__(self, exc_type, exc, tb):
+        self.registry._operations.pop(self.operation.op_id, None)
+        self.registry.completed += 1
+        return False
+
+
+class InflightRegistry:
+    """Upstream calls in progress, for /api/debug/inflight.
+
+    Each call registers itself for its whole duration, retries and backoff
+    included, and updates its attempt and state as it goes, so a call stuck
+    in a retry loop shows where it is and for how long.
+    """
+
+    def __init__(self):
+        self._operations: Dict[int, Operation] = {}
+        self._ids = itertools.count(1)
+        self.completed = 0
+
+    def track(self, kind: str, **attributes) -> _Tracked:
+        return _Tracked(self, Operation(next(self._ids), kind, attributes))
+
+    def snapshot(self) -> list:
+        """Operations in progress, oldest first."""
+        now = time.monotonic()
+        return [operation.to_dict(now) for operation in sorted(self._operations.values(), key=lambda op: op.started)]
+
+    def get_stats(self) -> dict:
+        by_kind: Dict[str, int] = {}
+        for operation in self._operations.values():
+            by_kind[operation.kind] = by_kind.get(operation.kind, 0) + 1
+        return {"in_flight": len(self._operations), "by_kind": by_kind, "completed": self.completed}
+
+
+_registry: Optional[InflightRegistry] = None
+
+
+def get_inflight() -> InflightRegistry:
+    """Registry shared by the whole process."""
+    global _registry
+    if _registry is None:
+        _registry = InflightRegistry()
+    return _registry
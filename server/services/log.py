@@ -0,0 +1,202 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+from typing import Dict, Optional
+
+# Au-delà, les valeurs des champs sont tronquées (réponses brutes du LLM, en-têtes)
+MAX_FIELD_LENGTH = int(os.getenv("LOG_MAX_FIELD_LENGTH", "300"))
+
+
+def _parse_mapping(value: str) -> Dict[str, str]:
+    """"session=0.01,flux=0.1" -> {"session": "0.01", "flux": "0.1"}"""
+    mapping = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        key, _, setting = item.partition("=")
+        mapping[key.strip()] = setting.strip()
+    return mapping
+
+
+def _truncate(value):
+    if isinstance(value, (int, float, bool)) or value is None:
+        return value
+    text = str(value)
+    if len(text) > MAX_FIELD_LENGTH:
+        return f"{text[:MAX_FIELD_LENGTH]}... ({len(text)} chars)"
+    return text
+
+
+class StructuredLogger:
+    """Logger for one category, taking structured fields.
+
+        log = get_logger("session")
+        log.debug("Session lookup", session_id=session_id, found=True)
+
+    Disabled levels cost a single integer comparison. Records below WARNING
+    are kept with the category's sampling rate (LOG_SAMPLING); warnings and
+    errors are never sampled. Field values are truncated before formatting.
+    """
+
+    __slots__ = ("category", "logger", "sample_rate")
+
+    def __init__(self, category: str, sample_rate: float = 1.0):
+        self.category = category
+        self.logger = logging.getLogger(f"comic.{category}")
+        self.sample_rate = sample_rate
+
+    def _log(self, level: int, message: str, fields: dict, exc_info=None):
+        if not self.logger.isEnabledFor(level):
+            return
+        if level < logging.WARNING and self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return
+        if exc_info is True:
+            exc_info = sys.exc_info()
+        # makeRecord + handle : évite findCaller, qui remonte la pile à chaque appel
+        record = self.logger.makeRecord(
+            self.logger.name, level, "", 0, message, (), exc_info,
+            extra={"category": self.category, "fields": {key: _truncate(value) for key, value in fields.items()}}
+        )
+        self.logger.handle(record)
+
+    def is_enabled(self, level: int) -> bool:
+        """To skip building costly fields when the level is off."""
+        return self.logger.isEnabledFor(level)
+
+    def debug(self, message: str, /, **fields):
+        self._log(logging.DEBUG, message, fields)
+
+    def info(self, message: str, /, **fields):
+        self._log(logging.INFO, message, fields)
+
+    def warning(self, message: str, /, **fields):
+        self._log(logging.WARNING, message, fields)
+
+    def error(self, message: str, /, exc_info=None, **fields):
+        self._log(logging.ERROR, message, fields, exc_info)
+
+    def exception(self, message: str, /, **fields):
+        self._log(logging.ERROR, message, fields, exc_info=True)
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": round(record.created, 3),
+            "level": record.levelname.lower(),
+            "category": getattr(record, "category", record.name),
+            "message": record.getMessage(),
+            **getattr(record, "fields", {}),
+        }
+        if record.exc_info:
+            payload["exception"] = self.formatException(record.exc_info)
+        return json.dumps(payload, default=str, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    """`time level [category] message key=value ...`, for local development."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        fields = getattr(record, "fields", {})
+        text = f"{self.formatTime(record, '%H:%M:%S')} {record.levelname:<7} [{getattr(record, 'category', record.name)}] {record.getMessage()}"
+        if fields:
+            text += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        if record.exc_info:
+            text += "\n" + self.formatException(record.exc_info)
+        return text
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Never blocks the event loop: when the queue is full, the record is dropped and counted."""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Formatage dans le thread du listener, pas sur la boucle
+        return record
+
+
+class _QueueListener(logging.handlers.QueueListener):
+    def enqueue_sentinel(self):
+        # put_nowait échoue si la file est pleine : on attend que le thread la vide
+        self.queue.put(self._sentinel)
+
+
+_loggers: Dict[str, StructuredLogger] = {}
+_sampling: Dict[str, float] = {}
+_queue_handler: Optional[_DroppingQueueHandler] = None
+_listener: Optional[_QueueListener] = None
+
+
+def setup_logging(level: Optional[str] = None, fmt: Optional[str] = None, stream=None):
+    """Route every log record through a bounded queue to a writer thread.
+
+    LOG_LEVEL sets the default level, LOG_LEVELS per-category levels
+    ("session=WARNING,flux=DEBUG"), LOG_SAMPLING per-category sampling
+    rates for records below WARNING ("session=0.01"), LOG_FORMAT "text" or
+    "json". Safe to call more than once.
+    """
+    global _queue_handler, _listener
+    shutdown_logging()
+
+    # Champs jamais utilisés par nos formats : autant de travail en moins par LogRecord
+    logging.logProcesses = logging.logMultiprocessing = False
+
+    root = logging.getLogger()
+    root.setLevel((level or os.getenv("LOG_LEVEL", "INFO")).upper())
+    for category, category_level in _parse_mapping(os.getenv("LOG_LEVELS", "")).items():
+        logging.getLogger(f"comic.{category}").setLevel(category_level.upper())
+
+    _sampling.clear()
+    _sampling.update({category: float(rate) for category, rate in _parse_mapping(os.getenv("LOG_SAMPLING", "")).items()})
+    for logger in _loggers.values():
+        logger.sample_rate = _sampling.get(logger.category, 1.0)
+
+    output = logging.StreamHandler(stream)
+    output.setFormatter(JsonFormatter() if (fmt or os.getenv("LOG_FORMAT", "text")) == "json" else TextFormatter())
+
+    _queue_handler = _DroppingQueueHandler(queue.Queue(maxsize=int(os.getenv("LOG_QUEUE_SIZE", "10000"))))
+    # Remplace les handlers installés par basicConfig (appels synchrones sur stderr)
+    root.handlers = [_queue_handler]
+    _listener = _QueueListener(_queue_handler.queue, output, respect_handler_level=True)
+    _listener.start()
+
+
+def shutdown_logging():
+    """Flush the queue and stop the writer thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(shutdown_logging)
+
+
+def get_logger(category: str) -> StructuredLogger:
+    logger = _loggers.get(category)
+    if logger is None:
+        logger = _loggers[category] = StructuredLogger(category, _sampling.get(category, 1.0))
+    return logger
+
+
+def get_logging_stats() -> dict:
+    return {
+        "level": logging.getLevelName(logging.getLogger().level),
+        "queued": _queue_handler.queue.qsize() if _queue_handler else None,
+        "dropped": _queue_handler.dropped if _queue_handler else 0,
+        "sampling": dict(_sampling),
+    }
@@ -0,0 +1,195 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter, deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+from services.log import get_logger
+from services.metrics import registry
+
+log = get_logger("loop")
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Frames gardées par échantillon de pile (les plus profondes)
+STACK_DEPTH = 25
+
+LOOP_LAG = registry.histogram(
+    "comic_event_loop_lag_seconds",
+    "Delay before the event loop runs a callback scheduled from the monitor thread.",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+)
+LOOP_STALLS = registry.counter(
+    "comic_event_loop_stalls_total",
+    "Times the event loop was blocked longer than LOOP_BLOCK_THRESHOLD."
+)
+LOOP_STALLED_SECONDS = registry.counter(
+    "comic_event_loop_stalled_seconds_total",
+    "Event loop lag accumulated during stalls."
+)
+
+
+def short_path(filename: str) -> str:
+    if filename.startswith(SERVER_DIR + os.sep):
+        return os.path.relpath(filename, SERVER_DIR)
+    _, marker, rest = filename.rpartition("site-packages" + os.sep)
+    return rest if marker else os.path.basename(filename)
+
+
+def _is_own_code(filename: str) -> bool:
+    return filename.startswith(SERVER_DIR + os.sep) and "site-packages" not in filename and filename != __file__
+
+
+def _sample_stack(frame) -> Tuple[Tuple[str, ...], str]:
+    """Formatted stack of `frame`, and its blocking site: the innermost frame in our own code."""
+    entries = traceback.extract_stack(frame)[-STACK_DEPTH:]
+    stack = tuple(f"{short_path(entry.filename)}:{entry.lineno} in {entry.name}" for entry in entries)
+    own = [line for line, entry in zip(stack, entries) if _is_own_code(entry.filename)]
+    return stack, own[-1] if own else stack[-1]
+
+
+class _Ping:
+    __slots__ = ("sent", "lag", "done")
+
+    def __init__(self):
+        self.sent = time.perf_counter()
+        self.lag: Optional[float] = None
+        self.done = threading.Event()
+
+
+class LoopMonitor:
+    """Measures event loop lag and catches what blocks it.
+
+    A watchdog thread schedules a callback on the loop every
+    LOOP_MONITOR_INTERVAL seconds; the delay before it runs is the loop lag.
+    When it hasn't run after LOOP_BLOCK_THRESHOLD seconds, the thread samples
+    the loop thread's stack until it does, so a stall comes with the code
+    that caused it (base64 encoding, regex cleaning, validation...). C code
+    holding the GIL delays the samples until it returns.
+    """
+
+    MAX_SAMPLES_PER_STALL = 20
+    HISTORY = 50
+
+    def __init__(self):
+        self.enabled = os.getenv("LOOP_MONITOR_ENABLED", "true").lower() == "true"
+        self.interval = float(os.getenv("LOOP_MONITOR_INTERVAL", "0.1"))
+        self.threshold = float(os.getenv("LOOP_BLOCK_THRESHOLD", "0.1"))
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+        # Une minute de mesures à l'intervalle par défaut
+        self._lags: Deque[float] = deque(maxlen=600)
+        self.max_lag = 0.0
+        self.stalls: Deque[dict] = deque(maxlen=self.HISTORY)
+        self.stall_count = 0
+        self.stalled_seconds = 0.0
+        # Site bloquant -> [occurrences, durée totale, durée max]
+        self.sites: Dict[str, List[float]] = {}
+
+    def start(self):
+        """Start watching the running loop. Call from a coroutine (startup event)."""
+        if not self.enabled or self._thread is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._watch, name="loop-monitor", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def _pong(self, ping: _Ping):
+        # Sur la boucle : le délai depuis l'envoi est le lag
+        ping.lag = time.perf_counter() - ping.sent
+        ping.done.set()
+        self._lags.append(ping.lag)
+        self.max_lag = max(self.max_lag, ping.lag)
+        LOOP_LAG.observe(ping.lag)
+        if ping.lag >= self.threshold:
+            LOOP_STALLS.inc()
+            LOOP_STALLED_SECONDS.inc(ping.lag)
+
+    def _watch(self):
+        while not self._stop.wait(self.interval):
+            ping = _Ping()
+            try:
+                self._loop.call_soon_threadsafe(self._pong, ping)
+            except RuntimeError:
+                # Boucle fermée
+                return
+            if ping.done.wait(self.threshold):
+                continue
+
+            samples: List[Tuple[Tuple[str, ...], str]] = []
+            while not ping.done.is_set() and not self._stop.is_set():
+                if len(samples) < self.MAX_SAMPLES_PER_STALL:
+                    frame = sys._current_frames().get(self._loop_thread_id)
+                    if frame is not None:
+                        samples.append(_sample_stack(frame))
+                    del frame
+                ping.done.wait(self.threshold)
+            if ping.lag is not None:
+                self._record_stall(ping, samples)
+
+    def _record_stall(self, ping: _Ping, samples: List[Tuple[Tuple[str, ...], str]]):
+        stacks = Counter(samples).most_common(3)
+        site = stacks[0][0][1] if stacks else "unknown"
+        stall = {
+            "at": round(time.time() - ping.lag, 3),
+            "duration_ms": round(ping.lag * 1000, 1),
+            "site": site,
+            "samples": len(samples),
+            "stacks": [{"count": count, "stack": list(stack)} for (stack, _), count in stacks],
+        }
+        with self._lock:
+            self.stalls.append(stall)
+            self.stall_count += 1
+            self.stalled_seconds += ping.lag
+            entry = self.sites.setdefault(site, [0, 0.0, 0.0])
+            entry[0] += 1
+            entry[1] += ping.lag
+            entry[2] = max(entry[2], ping.lag)
+        log.warning("Event loop blocked", duration_ms=stall["duration_ms"], site=site)
+
+    def get_stats(self, stacks: bool = True) -> dict:
+        lags = sorted(self._lags)
+        with self._lock:
+            recent = list(self.stalls)[::-1]
+            sites = sorted(self.sites.items(), key=lambda item: item[1][1], reverse=True)[:10]
+            stall_count, stalled_seconds = self.stall_count, self.stalled_seconds
+
+        def percentile(fraction: float) -> Optional[float]:
+            return round(lags[min(len(lags) - 1, int(len(lags) * fraction))] * 1000, 2) if lags else None
+
+        return {
+            "enabled": self.enabled,
+            "running": self._thread is not None,
+            "interval_ms": self.interval * 1000,
+            "threshold_ms": self.threshold * 1000,
+            "lag_ms": {
+                "last": round(self._lags[-1] * 1000, 2) if self._lags else None,
+                "p50": percentile(0.5),
+                "p99": percentile(0.99),
+                "max": round(self.max_lag * 1000, 2),
+            },
+            "stalls": stall_count,
+            "stalled_ms": round(stalled_seconds * 1000, 1),
+            "sites": [
+                {"site": site, "count": count, "total_ms": round(total * 1000, 1), "max_ms": round(longest * 1000, 1)}
+                for site, (count, total, longest) in sites
+            ],
+            "recent": recent if stacks else [{key: value for key, value in stall.items() if key != "stacks"} for stall in recent],
+        }
@@ -0,0 +1,313 @@
+import bisect
+import time
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from services.tracing import span
+
+# Buckets en secondes : du parsing (ms) jusqu'aux rendus Flux sous charge (minutes)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+# Générateur en cours, pour attribuer les retries et erreurs de parsing de MistralClient
+_current_generator: ContextVar[str] = ContextVar("current_generator", default="none")
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+
+    def _init_default(self):
+        # Sans labels : exporté à 0 dès le premier scrape
+        if not self.labelnames:
+            self.labels()
+
+    def labels(self, *values: str):
+        """Child for one label set, created on first use."""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            child = self._children[values] = self._new_child()
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"] + self._samples()
+
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+    def _samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}"
+            for values, child in list(self._children.items())
+        ]
+
+
+class _GaugeChild:
+    __slots__ = ("value", "function")
+
+    def __init__(self):
+        self.value = 0.0
+        self.function: Optional[Callable[[], float]] = None
+
+    def set(self, value: float):
+        self.value = value
+
+    def set_function(self, function: Callable[[], float]):
+        """Read the value from `function` at scrape time (queue lengths, live sessions)."""
+        self.function = function
+
+    def get(self) -> float:
+        if self.function is not None:
+            try:
+                return self.function()
+            except Exception:
+                return float("nan")
+        return self.value
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set_function(self, function: Callable[[], float]):
+        self.labels().set_function(function)
+
+    def _samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.get())}"
+            for values, child in list(self._children.items())
+        ]
+
+
+class _HistogramChild:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        # Une case par borne, plus +Inf ; cumulées seulement à l'export
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def _samples(self) -> List[str]:
+        lines = []
+        for values, child in list(self._children.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), child.counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, values, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, values)
+            lines.append(f"{self.name}_sum{labels} {_format_value(child.sum)}")
+            lines.append(f"{self.name}_count{labels} {child.count}")
+        return lines
+
+
+class MetricsRegistry:
+    """In-process metrics, rendered in the Prometheus text format.
+
+    Recording is a dict lookup and a few integer increments, without locks:
+    everything runs on the event loop thread.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def _register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric already registered: {metric.name}")
+        self._metrics[metric.name] = metric
+        metric._init_default()
+        return metric
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help, labelnames))
+
+    def gauge(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+STAGE_DURATION = registry.histogram(
+    "comic_stage_duration_seconds",
+    "Duration of each pipeline stage, queueing included.",
+    ("stage", "outcome")
+)
+GENERATOR_RETRIES = registry.counter(
+    "comic_generator_retries_total",
+    "LLM calls retried, by generator and reason.",
+    ("generator", "reason")
+)
+PARSE_FAILURES = registry.counter(
+    "comic_parse_failures_total",
+    "LLM responses that could not be parsed or validated, by generator.",
+    ("generator",)
+)
+SESSIONS_CREATED = registry.counter(
+    "comic_sessions_created_total",
+    "Game sessions created."
+)
+LIVE_SESSIONS = registry.gauge(
+    "comic_live_sessions",
+    "Game sessions currently held in memory."
+)
+QUALITY_DEGRADATION_LEVEL = registry.gauge(
+    "comic_quality_degradation_level",
+    "Active quality degradation level (0 is full quality), as last evaluated."
+)
+QUEUE_DEPTH = registry.gauge(
+    "comic_queue_depth",
+    "Requests waiting for an upstream slot, by queue.",
+    ("queue",)
+)
+QUEUE_ACTIVE = registry.gauge(
+    "comic_queue_active",
+    "Requests holding an upstream slot, by queue.",
+    ("queue",)
+)
+
+
+class _StageTimer:
+    """Times a stage into STAGE_DURATION, and as a span of the current request's trace.
+
+    Set `outcome` for failures that don't raise.
+    """
+    __slots__ = ("stage", "outcome", "started", "span")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+        self.outcome = "ok"
+        self.span = span(stage)
+
+    def __enter__(self) -> "_StageTimer":
+        self.span.__enter__()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            # CancelledError : le client est parti, ce n'est pas une erreur du stage
+            self.outcome = "cancelled" if exc_type.__name__ == "CancelledError" else "error"
+        STAGE_DURATION.labels(self.stage, self.outcome).observe(time.perf_counter() - self.started)
+        if self.span.span is not None:
+            self.span.span.attributes["outcome"] = self.outcome
+        self.span.__exit__(exc_type, exc, tb)
+        return False
+
+
+def time_stage(stage: str) -> _StageTimer:
+    return _StageTimer(stage)
+
+
+class _GeneratorScope:
+    __slots__ = ("name", "token")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.token = _current_generator.set(self.name)
+
+    def __exit__(self, exc_type, exc, tb):
+        _current_generator.reset(self.token)
+        return False
+
+
+def generator_scope(name: str) -> _GeneratorScope:
+    """Attribute the LLM retries and parse failures inside the block to `name`."""
+    return _GeneratorScope(name)
+
+
+def current_generator() -> str:
+    return _current_generator.get()
+
+
+def record_retry(reason: str, generator: Optional[str] = None):
+    GENERATOR_RETRIES.labels(generator or _current_generator.get(), reason).inc()
+
+
+def record_parse_failure(generator: Optional[str] = None):
+    PARSE_FAILURES.labels(generator or _current_generator.get()).inc()
+
+
+def render_metrics() -> str:
+    return registry.render()
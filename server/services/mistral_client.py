@@ -1,12 +1,19 @@
 import asyncio
 import json
 import logging
-from typing import TypeVar, Type, Optional, Callable
+from typing import TypeVar, Type, Optional, Callable, AsyncIterator
 from pydantic import BaseModel
-from langchain_mistralai.chat_models import ChatMistralAI
 from langchain.schema import SystemMessage, HumanMessage
 from langchain.schema.messages import BaseMessage
 
+from services.singleflight import SingleFlight
+from services.mistral_transport import create_mistral_transport
+from services.metrics import record_parse_failure, record_retry
+from services.tracing import span
+from services.token_usage import estimate_prompt_tokens, estimate_tokens, get_token_usage
+from services.inflight import get_inflight
+from services.cassette import CassetteMissError
+
 T = TypeVar('T', bound=BaseModel)
 
 # Configure logging
@@ -47,18 +54,12 @@ class MistralValidationError(MistralAPIError):
     pass
 
 class MistralClient:
-    def __init__(self, api_key: str, model_name: str = "mistral-small-latest", max_tokens: int = 1000):
+    def __init__(self, api_key: str, model_name: str = "mistral-small-latest", max_tokens: int = 1000, transport: Optional[str] = None):
         logger.info(f"Initializing MistralClient with model: {model_name}, max_tokens: {max_tokens}")
-        self.model = ChatMistralAI(
-            mistral_api_key=api_key,
-            model=model_name,
-            max_tokens=max_tokens
-        )
-        self.fixing_model = ChatMistralAI(
-            mistral_api_key=api_key,
-            model=model_name,
-            max_tokens=max_tokens
-        )
+        self.model_name = model_name
+        self.max_tokens = max_tokens
+        # langchain (par défaut) ou appels HTTP directs, selon MISTRAL_TRANSPORT
+        self.transport = create_mistral_transport(api_key, model_name, max_tokens, transport)
         
         # Pour gérer le rate limit
         self.last_call_time = 0
@@ -66,6 +67,14 @@ class MistralClient:
         self.max_retries = 5
         self.backoff_factor = 2  # For exponential backoff
         self.max_backoff = 30  # Maximum backoff time in seconds
+
+        # Coalescing des appels identiques concurrents (appels "cacheables" uniquement)
+        self._singleflight = SingleFlight("mistral")
+
+    def _request_key(self, kind: str, messages: list[BaseMessage], *extra) -> str:
+        """Hash every parameter that influences the completion."""
+        serialized = [(getattr(m, "type", None), getattr(m, "content", m)) for m in messages]
+        return SingleFlight.make_key(kind, self.model_name, self.max_tokens, serialized, *extra)
     
     async def _wait_for_rate_limit(self):
         """Attend le temps nécessaire pour respecter le rate limit."""
@@ -75,14 +84,29 @@ class MistralClient:
         if time_since_last_call < self.min_delay:
             delay = self.min_delay - time_since_last_call
             logger.debug(f"Rate limit: waiting for {delay:.2f} seconds")
-            await asyncio.sleep(delay)
+            with span("mistral.rate_limit_wait"):
+                await asyncio.sleep(delay)
         
         self.last_call_time = asyncio.get_event_loop().time()
 
+    def _record_usage(self, messages: list[BaseMessage], usage: dict, completion: str):
+        """Account the tokens reported by the API, estimated locally when it doesn't say."""
+        prompt_tokens = usage.get("prompt_tokens")
+        completion_tokens = usage.get("completion_tokens")
+        get_token_usage().record(
+            self.model_name,
+            prompt_tokens if prompt_tokens is not None else estimate_prompt_tokens(messages),
+            completion_tokens if completion_tokens is not None else estimate_tokens(completion),
+            estimated=prompt_tokens is None or completion_tokens is None
+        )
+
     async def _handle_api_error(self, error: Exception, retry_count: int) -> float:
         """Handle API errors and return wait time for retry"""
         wait_time = min(self.backoff_factor ** retry_count, self.max_backoff)
         
+        if isinstance(error, CassetteMissError):
+            # Rejouer la même requête ne trouvera pas davantage d'enregistrement
+            raise error
         if "rate limit" in str(error).lower():
             logger.warning(f"Rate limit hit, waiting {wait_time}s before retry")
             raise MistralRateLimitError(str(error))
@@ -102,69 +126,102 @@ class MistralClient:
         retry_count = 0
         last_error = None
         
-        while retry_count < self.max_retries:
-            try:
-                logger.info(f"Attempt {retry_count + 1}/{self.max_retries}")
+        with get_inflight().track("llm", model=self.model_name) as op:
+            while retry_count < self.max_retries:
+                try:
+                    logger.debug(f"Attempt {retry_count + 1}/{self.max_retries}")
                 
-                current_messages = messages.copy()
-                if error_feedback and retry_count > 0:
-                    if isinstance(last_error, MistralParsingError):
-                        # For parsing errors, add structured format reminder
-                        current_messages.append(HumanMessage(content="Please ensure your response is in valid JSON format."))
-                    elif isinstance(last_error, MistralValidationError):
-                        # For validation errors, add the specific feedback
-                        current_messages.append(HumanMessage(content=f"Previous error: {error_feedback}. Please try again."))
+                    current_messages = messages.copy()
+                    if error_feedback and retry_count > 0:
+                        if isinstance(last_error, MistralParsingError):
+                            # For parsing errors, add structured format reminder
+                            current_messages.append(HumanMessage(content="Please ensure your response is in valid JSON format."))
+                        elif isinstance(last_error, MistralValidationError):
+                            # For validation errors, add the specific feedback
+                            current_messages.append(HumanMessage(content=f"Previous error: {error_feedback}. Please try again."))
                 
-                await self._wait_for_rate_limit()
-                try:
-                    response = await self.model.ainvoke(current_messages)
-                    content = response.content
-                    logger.debug(f"Raw response: {content[:100]}...")
-                except Exception as api_error:
-                    wait_time = await self._handle_api_error(api_error, retry_count)
-                    retry_count += 1
-                    if retry_count < self.max_retries:
-                        await asyncio.sleep(wait_time)
-                        continue
-                    raise
+                    op.attempt = retry_count + 1
+                    op.set_state("rate_limit_wait")
+                    await self._wait_for_rate_limit()
+                    try:
+                        usage = {}
+                        op.set_state("calling")
+                        with span("mistral.attempt", attempt=retry_count + 1, model=self.model_name):
+                            content = await self.transport.complete(current_messages, usage)
+                        # Facturé même si la réponse ne se parse pas
+                        self._record_usage(current_messages, usage, content)
+                        logger.debug(f"Raw response: {content[:100]}...")
+                    except Exception as api_error:
+                        wait_time = await self._handle_api_error(api_error, retry_count)
+                        retry_count += 1
+                        if retry_count < self.max_retries:
+                            record_retry("api_error")
+                            op.set_state("backoff", wait=wait_time, last_error=str(api_error)[:200])
+                            with span("mistral.backoff"):
+                                await asyncio.sleep(wait_time)
+                            continue
+                        raise
 
-                # Si pas de parsing requis, retourner le contenu brut
-                if not response_model and not custom_parser:
-                    return content
+                    # Si pas de parsing requis, retourner le contenu brut
+                    if not response_model and not custom_parser:
+                        return content
 
-                # Parser la réponse
-                try:
-                    if custom_parser:
-                        return custom_parser(content)
+                    # Parser la réponse
+                    op.set_state("parsing")
+                    try:
+                        if custom_parser:
+                            return custom_parser(content)
                     
-                    # Essayer de parser avec le modèle Pydantic
-                    data = json.loads(content)
-                    return response_model(**data)
-                except json.JSONDecodeError as e:
-                    last_error = MistralParsingError(f"Invalid JSON format: {str(e)}")
-                    logger.error(f"JSON parsing error: {str(e)}")
-                    raise last_error
-                except Exception as e:
-                    last_error = MistralValidationError(str(e))
-                    logger.error(f"Validation error: {str(e)}")
-                    raise last_error
-
-            except (MistralParsingError, MistralValidationError) as e:
-                logger.error(f"Error on attempt {retry_count + 1}/{self.max_retries}: {str(e)}")
-                last_error = e
-                retry_count += 1
-                if retry_count < self.max_retries:
-                    wait_time = min(self.backoff_factor ** retry_count, self.max_backoff)
-                    logger.info(f"Waiting {wait_time} seconds before retry...")
-                    await asyncio.sleep(wait_time)
-                    continue
+                        # Essayer de parser avec le modèle Pydantic
+                        data = json.loads(content)
+                        return response_model(**data)
+                    except json.JSONDecodeError as e:
+                        last_error = MistralParsingError(f"Invalid JSON format: {str(e)}")
+                        logger.error(f"JSON parsing error: {str(e)}")
+                        raise last_error
+                    except Exception as e:
+                        last_error = MistralValidationError(str(e))
+                        logger.error(f"Validation error: {str(e)}")
+                        raise last_error
+
+                except (MistralParsingError, MistralValidationError) as e:
+                    logger.error(f"Error on attempt {retry_count + 1}/{self.max_retries}: {str(e)}")
+                    record_parse_failure()
+                    last_error = e
+                    retry_count += 1
+                    if retry_count < self.max_retries:
+                        record_retry("parse")
+                        wait_time = min(self.backoff_factor ** retry_count, self.max_backoff)
+                        logger.info(f"Waiting {wait_time} seconds before retry...")
+                        op.set_state("backoff", wait=wait_time, last_error=str(e)[:200])
+                        with span("mistral.backoff"):
+                            await asyncio.sleep(wait_time)
+                        continue
                 
-                logger.error(f"Failed after {self.max_retries} attempts. Last error: {str(last_error)}")
-                raise Exception(f"Failed after {self.max_retries} attempts. Last error: {str(last_error)}")
+                    logger.error(f"Failed after {self.max_retries} attempts. Last error: {str(last_error)}")
+                    raise Exception(f"Failed after {self.max_retries} attempts. Last error: {str(last_error)}")
     
-    async def generate(self, messages: list[BaseMessage], response_model: Optional[Type[T]] = None, custom_parser: Optional[Callable[[str], T]] = None) -> T | str:
-        """Génère une réponse à partir d'une liste de messages avec parsing optionnel."""
-        return await self._generate_with_retry(messages, response_model, custom_parser)
+    async def generate(self, messages: list[BaseMessage], response_model: Optional[Type[T]] = None, custom_parser: Optional[Callable[[str], T]] = None, coalesce: bool = False) -> T | str:
+        """Génère une réponse à partir d'une liste de messages avec parsing optionnel.
+
+        With `coalesce=True`, concurrent calls with identical messages and parser
+        share a single upstream request. Only use it for cacheable calls whose
+        result does not depend on the caller.
+        """
+        if not coalesce:
+            return await self._generate_with_retry(messages, response_model, custom_parser)
+
+        key = self._request_key(
+            "generate",
+            messages,
+            getattr(response_model, "__qualname__", None),
+            getattr(custom_parser, "__qualname__", None),
+            id(getattr(custom_parser, "__self__", None))
+        )
+        return await self._singleflight.do(
+            key,
+            lambda: self._generate_with_retry(messages, response_model, custom_parser)
+        )
 
     async def transform_prompt(self, story_text: str, art_prompt: str) -> str:
         """Transforme un texte d'histoire en prompt artistique."""
@@ -181,39 +238,95 @@ class MistralClient:
             print(f"Error transforming prompt: {str(e)}")
             return story_text 
 
-    async def generate_text(self, messages: list[BaseMessage]) -> str:
+    async def generate_text(self, messages: list[BaseMessage], coalesce: bool = False) -> str:
         """
         Génère une réponse textuelle simple sans structure JSON.
         Utile pour la génération de texte narratif ou descriptif.
         
         Args:
             messages: Liste des messages pour le modèle
+            coalesce: Partager un seul appel entre requêtes identiques concurrentes
             
         Returns:
             str: Le texte généré
         """
+        if coalesce:
+            key = self._request_key("generate_text", messages)
+            return await self._singleflight.do(key, lambda: self._generate_text(messages))
+        return await self._generate_text(messages)
+
+    async def _generate_text(self, messages: list[BaseMessage]) -> str:
         retry_count = 0
         last_error = None
         
-        while retry_count < self.max_retries:
-            try:
-                logger.info(f"Attempt {retry_count + 1}/{self.max_retries}")
+        with get_inflight().track("llm", model=self.model_name) as op:
+            while retry_count < self.max_retries:
+                try:
+                    logger.debug(f"Attempt {retry_count + 1}/{self.max_retries}")
                 
-                await self._wait_for_rate_limit()
-                response = await self.model.ainvoke(messages)
-                return response.content.strip()
+                    op.attempt = retry_count + 1
+                    op.set_state("rate_limit_wait")
+                    await self._wait_for_rate_limit()
+                    usage = {}
+                    op.set_state("calling")
+                    with span("mistral.attempt", attempt=retry_count + 1, model=self.model_name):
+                        content = await self.transport.complete(messages, usage)
+                    self._record_usage(messages, usage, content)
+                    return content.strip()
                 
-            except Exception as e:
-                logger.error(f"Error on attempt {retry_count + 1}/{self.max_retries}: {str(e)}")
-                retry_count += 1
-                if retry_count < self.max_retries:
-                    wait_time = 2 * retry_count
-                    logger.info(f"Waiting {wait_time} seconds before retry...")
-                    await asyncio.sleep(wait_time)
-                    continue
+                except Exception as e:
+                    logger.error(f"Error on attempt {retry_count + 1}/{self.max_retries}: {str(e)}")
+                    retry_count += 1
+                    if isinstance(e, CassetteMissError):
+                        raise
+                    if retry_count < self.max_retries:
+                        record_retry("api_error")
+                        wait_time = 2 * retry_count
+                        logger.info(f"Waiting {wait_time} seconds before retry...")
+                        op.set_state("backoff", wait=wait_time, last_error=str(e)[:200])
+                        with span("mistral.backoff"):
+                            await asyncio.sleep(wait_time)
+                        continue
                 
-                logger.error(f"Failed after {self.max_retries} attempts. Last error: {last_error or str(e)}")
-                raise Exception(f"Failed after {self.max_retries} attempts. Last error: {last_error or str(e)}") 
+                    logger.error(f"Failed after {self.max_retries} attempts. Last error: {last_error or str(e)}")
+                    raise Exception(f"Failed after {self.max_retries} attempts. Last error: {last_error or str(e)}") 
+
+    async def stream_text(self, messages: list[BaseMessage]) -> AsyncIterator[str]:
+        """
+        Génère une réponse en streaming, token par token.
+
+        Connection errors are retried like generate_text, but only until the
+        first token has been yielded: a stream that fails midway raises.
+        """
+        retry_count = 0
+        with get_inflight().track("llm", model=self.model_name, streaming=True) as op:
+            while True:
+                tokens = []
+                usage = {}
+                try:
+                    logger.debug(f"Streaming attempt {retry_count + 1}/{self.max_retries}")
+                    op.attempt = retry_count + 1
+                    op.set_state("rate_limit_wait")
+                    await self._wait_for_rate_limit()
+                    op.set_state("streaming")
+                    with span("mistral.stream", attempt=retry_count + 1, model=self.model_name):
+                        async for token in self.transport.stream(messages, usage):
+                            tokens.append(token)
+                            yield token
+                    return
+                except Exception as e:
+                    logger.error(f"Error on streaming attempt {retry_count + 1}/{self.max_retries}: {str(e)}")
+                    retry_count += 1
+                    if tokens or retry_count >= self.max_retries or isinstance(e, CassetteMissError):
+                        raise
+                    record_retry("stream_error")
+                    op.set_state("backoff", wait=2 * retry_count, last_error=str(e)[:200])
+                    with span("mistral.backoff"):
+                        await asyncio.sleep(2 * retry_count)
+                finally:
+                    # Aussi quand l'appelant ferme le flux avant la fin (pas d'usage renvoyé : estimation)
+                    if tokens:
+                        self._record_usage(messages, usage, "".join(tokens))
 
     async def check_health(self) -> bool:
         """
@@ -223,8 +336,17 @@ class MistralClient:
             bool: True si le service est disponible, False sinon
         """
         try:
-            response = await self.model.ainvoke([SystemMessage(content="Hi")])
+            # Les health checks concurrents partagent le même appel
+            messages = [SystemMessage(content="Hi")]
+            await self._singleflight.do(
+                self._request_key("health", messages),
+                lambda: self.transport.complete(messages)
+            )
             return True
         except Exception as e:
             logger.error(f"Health check failed: {str(e)}")
-            raise 
\ No newline at end of file
+            raise
+
+    def get_stats(self) -> dict:
+        """Return request coalescing counters."""
+        return {"transport": self.transport.name, "singleflight": self._singleflight.get_stats()}
@@ -0,0 +1,239 @@
+import json
+import os
+import time
+from typing import AsyncIterator, List, Optional
+
+import aiohttp
+from langchain_core.callbacks import BaseCallbackHandler
+
+from services.http_transport import HttpTransport, get_http_transport
+from services.cassette import Cassette, ReplayedError, get_cassette
+from services.singleflight import SingleFlight
+
+DEFAULT_MISTRAL_API_URL = "https://api.mistral.ai/v1"
+
+# Rôles langchain -> rôles de l'API Mistral
+_ROLES = {"system": "system", "human": "user", "ai": "assistant"}
+
+
+class MistralHTTPError(Exception):
+    """Non-200 answer from the chat completions endpoint."""
+
+    def __init__(self, status: int, body: str):
+        # "rate limit" et le code HTTP dans le message : MistralClient les détecte comme pour langchain
+        reason = "rate limit exceeded" if status == 429 else "error"
+        super().__init__(f"Mistral API {reason} ({status}): {body}")
+        self.status = status
+
+
+def to_api_messages(messages: list) -> List[dict]:
+    """Accept langchain messages or role/content dicts."""
+    api_messages = []
+    for message in messages:
+        if isinstance(message, dict):
+            api_messages.append({"role": message["role"], "content": message["content"]})
+        else:
+            api_messages.append({"role": _ROLES.get(message.type, "user"), "content": message.content})
+    return api_messages
+
+
+class _UsageCallback(BaseCallbackHandler):
+    """Copies the token usage that langchain only hands to callbacks."""
+
+    def __init__(self, usage: dict):
+        self.usage = usage
+
+    def on_llm_end(self, response, **kwargs):
+        self.usage.update((response.llm_output or {}).get("token_usage") or {})
+
+
+class LangchainMistralTransport:
+    """Completions through langchain's ChatMistralAI.
+
+    Token usage is only reported for non-streamed completions.
+    """
+
+    name = "langchain"
+
+    def __init__(self, api_key: str, model_name: str, max_tokens: int, api_url: Optional[str] = None):
+        # Import local : le transport natif n'a pas à payer l'import de langchain_mistralai
+        from langchain_mistralai.chat_models import ChatMistralAI
+        options = {}
+        if api_url:
+            # Le client mistralai ajoute lui-même /v1
+            options["endpoint"] = api_url.rstrip("/").removesuffix("/v1")
+        self.model = ChatMistralAI(
+            mistral_api_key=api_key,
+            model=model_name,
+            max_tokens=max_tokens,
+            **options
+        )
+
+    async def complete(self, messages: list, usage: Optional[dict] = None) -> str:
+        config = {"callbacks": [_UsageCallback(usage)]} if usage is not None else None
+        response = await self.model.ainvoke(messages, config=config)
+        return response.content
+
+    async def stream(self, messages: list, usage: Optional[dict] = None) -> AsyncIterator[str]:
+        async for chunk in self.model.astream(messages):
+            if chunk.content:
+                yield chunk.content
+
+
+class NativeMistralTransport:
+    """Completions sent straight to /chat/completions over the shared HTTP pool.
+
+    Connections are kept alive between calls, and streamed completions are
+    read as server-sent events, one `data:` line per token delta.
+    """
+
+    name = "native"
+
+    def __init__(self, api_key: str, model_name: str, max_tokens: int, api_url: Optional[str] = None, transport: Optional[HttpTransport] = None):
+        self.api_key = api_key
+        self.model_name = model_name
+        self.max_tokens = max_tokens
+        self.url = f"{(api_url or DEFAULT_MISTRAL_API_URL).rstrip('/')}/chat/completions"
+        self.transport = transport or get_http_transport()
+        self.timeout = aiohttp.ClientTimeout(
+            total=float(os.getenv("MISTRAL_TIMEOUT", "120")),
+            connect=self.transport.timeout.connect
+        )
+
+    def _request(self, messages: list, stream: bool):
+        return self.transport.post(
+            self.url,
+            timeout=self.timeout,
+            headers={
+                "Authorization": f"Bearer {self.api_key}",
+                "Accept": "text/event-stream" if stream else "application/json"
+            },
+            json={
+                "model": self.model_name,
+                "messages": to_api_messages(messages),
+                "max_tokens": self.max_tokens,
+                "stream": stream
+            }
+        )
+
+    async def complete(self, messages: list, usage: Optional[dict] = None) -> str:
+        async with self._request(messages, stream=False) as response:
+            if response.status != 200:
+                raise MistralHTTPError(response.status, await response.text())
+            data = await response.json()
+        if usage is not None:
+            usage.update(data.get("usage") or {})
+        return data["choices"][0]["message"]["content"]
+
+    async def stream(self, messages: list, usage: Optional[dict] = None) -> AsyncIterator[str]:
+        """Yield token deltas. `usage` is filled from the final chunk, if the stream gets there."""
+        async with self._request(messages, stream=True) as response:
+            if response.status != 200:
+                raise MistralHTTPError(response.status, await response.text())
+            # Lecture ligne à ligne : un événement SSE par ligne "data:"
+            async for line in response.content:
+                line = line.strip()
+                if not line.startswith(b"data:"):
+                    continue
+                payload = line[5:].strip()
+                if payload == b"[DONE]":
+                    return
+                chunk = json.loads(payload)
+                if usage is not None and chunk.get("usage"):
+                    usage.update(chunk["usage"])
+                delta = chunk["choices"][0].get("delta", {}) if chunk.get("choices") else {}
+                if delta.get("content"):
+                    yield delta["content"]
+
+
+class CassetteMistralTransport:
+    """Records the wrapped transport's completions to a cassette, or replays them without it.
+
+    Requests are keyed by model, max_tokens and messages; a completion
+    recorded streamed can be replayed whole and the other way round.
+    """
+
+    def __init__(self, cassette: Cassette, model_name: str, max_tokens: int, inner=None):
+        self.cassette = cassette
+        self.model_name = model_name
+        self.max_tokens = max_tokens
+        self.inner = inner
+        self.name = "replay" if inner is None else f"{inner.name}+record"
+
+    def _key(self, messages: list) -> str:
+        return SingleFlight.make_key("mistral", self.model_name, self.max_tokens, to_api_messages(messages))
+
+    async def complete(self, messages: list, usage: Optional[dict] = None) -> str:
+        key = self._key(messages)
+        if self.inner is None:
+            entry = self.cassette.lookup("mistral", key)
+            await self.cassette.delay(entry["latency"])
+            if "error" in entry:
+                raise ReplayedError(entry["error"])
+            if usage is not None:
+                usage.update(entry.get("usage") or {})
+            return "".join(text for _, text in entry["chunks"])
+
+        started = time.perf_counter()
+        call_usage = {}
+        try:
+            content = await self.inner.complete(messages, call_usage)
+        except Exception as e:
+            self.cassette.record("mistral", key, started, chunks=[], error=str(e))
+            raise
+        self.cassette.record("mistral", key, started, chunks=[[round(time.perf_counter() - started, 4), content]], usage=call_usage)
+        if usage is not None:
+            usage.update(call_usage)
+        return content
+
+    async def stream(self, messages: list, usage: Optional[dict] = None) -> AsyncIterator[str]:
+        key = self._key(messages)
+        if self.inner is None:
+            entry = self.cassette.lookup("mistral", key)
+            previous = 0.0
+            for offset, text in entry["chunks"]:
+                await self.cassette.delay(offset - previous)
+                previous = offset
+                yield text
+            if "error" in entry:
+                await self.cassette.delay(entry["latency"] - previous)
+                raise ReplayedError(entry["error"])
+            if usage is not None:
+                usage.update(entry.get("usage") or {})
+            return
+
+        started = time.perf_counter()
+        chunks, call_usage, error, done = [], {}, None, False
+        try:
+            async for text in self.inner.stream(messages, call_usage):
+                chunks.append([round(time.perf_counter() - started, 4), text])
+                yield text
+            done = True
+        except Exception as e:
+            error = str(e)
+            raise
+        finally:
+            # Flux fermé par l'appelant (budget de mots atteint) : la suite n'a jamais été lue
+            outcome = {"error": error} if error is not None else ({} if done else {"truncated": True})
+            self.cassette.record("mistral", key, started, chunks=chunks, usage=call_usage, **outcome)
+            if usage is not None:
+                usage.update(call_usage)
+
+
+def create_mistral_transport(api_key: str, model_name: str, max_tokens: int, kind: Optional[str] = None):
+    """Transport chosen by MISTRAL_TRANSPORT ("langchain" or "native"), behind CASSETTE_MODE."""
+    cassette = get_cassette()
+    if cassette is not None and cassette.replaying:
+        return CassetteMistralTransport(cassette, model_name, max_tokens)
+
+    kind = kind or os.getenv("MISTRAL_TRANSPORT", "langchain")
+    api_url = os.getenv("MISTRAL_API_URL")
+    if kind == "native":
+        transport = NativeMistralTransport(api_key, model_name, max_tokens, api_url)
+    elif kind == "langchain":
+        transport = LangchainMistralTransport(api_key, model_name, max_tokens, api_url)
+    else:
+        raise ValueError(f"Unknown MISTRAL_TRANSPORT: {kind}")
+    if cassette is not None:
+        return CassetteMistralTransport(cassette, model_name, max_tokens, transport)
+    return transport
@@ -0,0 +1,164 @@
+import asyncio
+import heapq
+import itertools
+import time
+from contextlib import asynccontextmanager
+from enum import IntEnum
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from services.metrics import QUEUE_ACTIVE, QUEUE_DEPTH
+from services.tracing import span
+
+
+class Priority(IntEnum):
+    """Dispatch order for upstream work. Lower values go first."""
+    FIRST_PANEL = 0  # Premier panneau du tour en cours
+    PANEL = 1  # Panneaux suivants du tour en cours
+    PREFETCH = 2  # Rendus anticipés
+    WARMUP = 3  # Health checks, préchauffage
+
+
+class Ticket:
+    """A caller's place in the queue."""
+    __slots__ = ("priority", "seq", "future", "enqueued_at")
+
+    def __init__(self, priority: Priority, seq: int, future: asyncio.Future):
+        self.priority = priority
+        self.seq = seq
+        self.future = future
+        self.enqueued_at = time.monotonic()
+
+    def sort_key(self):
+        return (self.priority, self.seq)
+
+
+class PriorityLimiter:
+    """Bounded-concurrency dispatcher serving waiters by priority, then FIFO.
+
+    Cancelling a waiting caller removes it from the queue, so requests whose
+    client has gone away never reach the upstream service.
+    """
+
+    def __init__(self, name: str, max_concurrency: int, ewma_alpha: float = 0.2):
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1")
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.active = 0
+        self._heap: List[tuple] = []
+        self._waiting: Dict[int, Ticket] = {}
+        self._seq = itertools.count()
+        self._ewma_alpha = ewma_alpha
+        self.avg_service_time: Optional[float] = None
+        self.last_completed_at: Optional[float] = None
+        self.completed = 0
+        self.cancelled = 0
+        # Lus au moment du scrape de /api/metrics
+        QUEUE_DEPTH.labels(name).set_function(lambda: self.queued)
+        QUEUE_ACTIVE.labels(name).set_function(lambda: self.active)
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiting)
+
+    def _push(self, ticket: Ticket):
+        heapq.heappush(self._heap, (ticket.priority, ticket.seq, ticket))
+
+    async def acquire(self, priority: Priority = Priority.PANEL, ticket_holder: Optional[list] = None):
+        """Wait for a slot. The ticket is appended to `ticket_holder` so it can be promoted."""
+        if self.active < self.max_concurrency and not self._waiting:
+            self.active += 1
+            return
+
+        ticket = Ticket(priority, next(self._seq), asyncio.get_running_loop().create_future())
+        self._waiting[ticket.seq] = ticket
+        self._push(ticket)
+        if ticket_holder is not None:
+            ticket_holder.append(ticket)
+        try:
+            await ticket.future
+        except asyncio.CancelledError:
+            if ticket.future.done() and not ticket.future.cancelled():
+                # Le slot venait d'être attribué : le rendre
+                self.release(record=False)
+            else:
+                self._waiting.pop(ticket.seq, None)
+                self.cancelled += 1
+            raise
+
+    def release(self, service_time: Optional[float] = None, record: bool = True):
+        """Free a slot and hand it to the best waiter."""
+        self.active -= 1
+        if record and service_time is not None:
+            self.completed += 1
+            self.last_completed_at = time.monotonic()
+            if self.avg_service_time is None:
+                self.avg_service_time = service_time
+            else:
+                self.avg_service_time += self._ewma_alpha * (service_time - self.avg_service_time)
+        self._dispatch()
+
+    def _dispatch(self):
+        while self.active < self.max_concurrency and self._heap:
+            priority, seq, ticket = heapq.heappop(self._heap)
+            # Entrées obsolètes (annulées ou promues)
+            if self._waiting.get(seq) is not ticket or priority != ticket.priority:
+                continue
+            del self._waiting[seq]
+            if ticket.future.done():
+                continue
+            self.active += 1
+            ticket.future.set_result(None)
+
+    def promote(self, ticket: Ticket, priority: Priority):
+        """Move a waiting ticket up if a more urgent caller now depends on it."""
+        if priority >= ticket.priority or self._waiting.get(ticket.seq) is not ticket:
+            return
+        ticket.priority = priority
+        self._push(ticket)
+
+    @asynccontextmanager
+    async def slot(self, priority: Priority = Priority.PANEL, ticket_holder: Optional[list] = None) -> AsyncIterator[None]:
+        with span("queue", queue=self.name, priority=Priority(priority).name.lower()):
+            await self.acquire(priority, ticket_holder)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - started)
+
+    def position(self, ticket: Ticket) -> Optional[int]:
+        """0-based position of a waiting ticket, or None once dispatched."""
+        if self._waiting.get(ticket.seq) is not ticket:
+            return None
+        return sum(1 for other in self._waiting.values() if other.sort_key() < ticket.sort_key())
+
+    def expected_wait(self, ahead: int) -> float:
+        """Rough wait estimate for a caller with `ahead` waiters in front of it."""
+        if self.active < self.max_concurrency and ahead == 0:
+            return 0.0
+        avg = self.avg_service_time or 0.0
+        return (ahead // self.max_concurrency + 1) * avg
+
+    def estimate(self, priority: Priority) -> Dict[str, Any]:
+        """Queue position and expected wait for a new request at `priority`."""
+        ahead = sum(1 for ticket in self._waiting.values() if ticket.priority <= priority)
+        return {
+            "position": ahead,
+            "expected_wait": round(self.expected_wait(ahead), 3),
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        by_priority = {p.name.lower(): 0 for p in Priority}
+        for ticket in self._waiting.values():
+            by_priority[Priority(ticket.priority).name.lower()] += 1
+        return {
+            "name": self.name,
+            "max_concurrency": self.max_concurrency,
+            "active": self.active,
+            "queued": self.queued,
+            "queued_by_priority": by_priority,
+            "avg_service_time": self.avg_service_time,
+            "completed": self.completed,
+            "cancelled": self.cancelled,
+        }
@@ -0,0 +1,43 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+# Pool partagé pour le travail CPU sur les images (encodage, composition de pages)
+_process_pool: Optional[ProcessPoolExecutor] = None
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "2"))
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    """Return the shared process pool, creating it on first use.
+
+    Workers come from a forkserver where available: forked straight from the
+    server, they would inherit its open client sockets and keep connections
+    uvicorn has closed alive, leaving keep-alive clients waiting forever.
+    """
+    global _process_pool
+    if _process_pool is None:
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context("forkserver" if "forkserver" in methods else None)
+        _process_pool = ProcessPoolExecutor(max_workers=IMAGE_WORKERS, mp_context=context)
+    return _process_pool
+
+
+def _start_workers():
+    pool = get_process_pool()
+    # Une tâche par worker : le pool les lance tous
+    for future in [pool.submit(int) for _ in range(IMAGE_WORKERS)]:
+        future.result()
+
+
+async def start_process_pool():
+    """Start the workers off the event loop, before the first image needs them."""
+    await asyncio.to_thread(_start_workers)
+
+
+def shutdown_process_pool():
+    global _process_pool
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=False, cancel_futures=True)
+        _process_pool = None
@@ -0,0 +1,344 @@
+import asyncio
+import os
+import secrets
+import sys
+import threading
+import time
+import weakref
+from collections import Counter, OrderedDict
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from services.loop_monitor import short_path
+
+# Profil de la requête en cours (profilage par requête, en-tête X-Profile)
+_current_profile: ContextVar[Optional["RequestProfile"]] = ContextVar("current_profile", default=None)
+
+MODES = ("wall", "cpu")
+MAX_DEPTH = 128
+
+# (fonction, fichier, ligne)
+FrameKey = Tuple[str, str, int]
+
+
+@lru_cache(maxsize=4096)
+def _path(filename: str) -> str:
+    return short_path(filename)
+
+
+def _frame_key(frame) -> FrameKey:
+    code = frame.f_code
+    return (code.co_name, _path(code.co_filename), frame.f_lineno)
+
+
+def _walk(frame, stop=None) -> List[FrameKey]:
+    """Frames from `frame` up to the thread's entry point (or `stop`), outermost first."""
+    frames = []
+    while frame is not None and len(frames) < MAX_DEPTH:
+        frames.append(_frame_key(frame))
+        if frame is stop:
+            break
+        frame = frame.f_back
+    frames.reverse()
+    return frames
+
+
+def _await_chain(coro) -> List[FrameKey]:
+    """Where a suspended coroutine is waiting: its chain of awaits, outermost first."""
+    frames = []
+    while coro is not None and len(frames) < MAX_DEPTH:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None) or getattr(coro, "ag_frame", None)
+        if frame is None:
+            break
+        frames.append(_frame_key(frame))
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None) or getattr(coro, "ag_await", None)
+    return frames
+
+
+def _cpu_clock(thread_id: int) -> Optional[int]:
+    try:
+        return time.pthread_getcpuclockid(thread_id)
+    except (AttributeError, OSError):
+        return None
+
+
+class Profile:
+    """Stacks sampled by the profiler, weighted in microseconds of wall or CPU time."""
+
+    def __init__(self, name: str, mode: str, interval: float):
+        self.name = name
+        self.mode = mode
+        self.interval = interval
+        self.started = time.time()
+        self.duration = 0.0
+        self.samples = 0
+        self.stacks: Counter = Counter()
+
+    def add(self, stack: Tuple[FrameKey, ...], weight_us: int):
+        if weight_us > 0:
+            self.stacks[stack] += weight_us
+            self.samples += 1
+
+    def collapsed(self) -> str:
+        """Folded stacks (`a;b;c weight`), for flamegraph.pl, inferno or speedscope."""
+        return "".join(
+            ";".join(f"{name} ({path}:{line})" if path else name for name, path, line in stack) + f" {weight}\n"
+            for stack, weight in self.stacks.most_common()
+        )
+
+    def speedscope(self) -> dict:
+        """https://www.speedscope.app/file-format-schema.json, one sampled profile."""
+        index: Dict[FrameKey, int] = {}
+        frames, samples, weights = [], [], []
+        for stack, weight in self.stacks.most_common():
+            sample = []
+            for key in stack:
+                if key not in index:
+                    index[key] = len(frames)
+                    frames.append({"name": key[0], "file": key[1], "line": key[2]} if key[1] else {"name": key[0]})
+                sample.append(index[key])
+            samples.append(sample)
+            weights.append(weight)
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": self.name,
+            "activeProfileIndex": 0,
+            "exporter": "comic-book-generator",
+            "shared": {"frames": frames},
+            "profiles": [{
+                "type": "sampled",
+                "name": f"{self.name} ({self.mode})",
+                "unit": "microseconds",
+                "startValue": 0,
+                "endValue": sum(weights),
+                "samples": samples,
+                "weights": weights,
+            }],
+        }
+
+    def summary(self) -> dict:
+        return {
+            "name": self.name,
+            "mode": self.mode,
+            "started": round(self.started, 3),
+            "duration_ms": round(self.duration * 1000, 1),
+            "samples": self.samples,
+            "stacks": len(self.stacks),
+        }
+
+
+class RequestProfile(Profile):
+    """Profile of one request: the tasks it started, sampled on the loop thread.
+
+    In wall mode, suspended tasks are sampled too, at the await they are
+    blocked on, so time spent waiting for Mistral or Flux shows up. Work
+    handed to threads or processes isn't sampled.
+    """
+
+    def __init__(self, name: str, mode: str, interval: float, loop: asyncio.AbstractEventLoop):
+        super().__init__(name, mode, interval)
+        self.profile_id = secrets.token_hex(8)
+        self.loop = loop
+        self.loop_thread_id = threading.get_ident()
+        self.tasks: "weakref.WeakSet[asyncio.Task]" = weakref.WeakSet()
+        # La boucle ajoute des tâches pendant que le thread d'échantillonnage les parcourt
+        self._tasks_lock = threading.Lock()
+        self.context_token = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def add_task(self, task: asyncio.Task):
+        with self._tasks_lock:
+            self.tasks.add(task)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._sample, name="request-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Tell the sampler to stop; `join` waits for its last sample (blocking)."""
+        self._stop.set()
+
+    def join(self):
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _sample(self):
+        clock = _cpu_clock(self.loop_thread_id) if self.mode == "cpu" else None
+        last_cpu = time.clock_gettime_ns(clock) if clock is not None else 0
+        last = started = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            now = time.perf_counter()
+            elapsed_us = int((now - last) * 1e6)
+            last = now
+            if clock is not None:
+                cpu = time.clock_gettime_ns(clock)
+                weight_us, last_cpu = (cpu - last_cpu) // 1000, cpu
+            else:
+                weight_us = elapsed_us
+
+            current = asyncio.current_task(self.loop)
+            if current is not None and current in self.tasks:
+                frame = sys._current_frames().get(self.loop_thread_id)
+                coro = current.get_coro()
+                top = getattr(coro, "cr_frame", None)
+                if frame is not None:
+                    self.add((("running", "", 0),) + tuple(_walk(frame, stop=top)), weight_us)
+                del frame
+            if self.mode == "wall":
+                with self._tasks_lock:
+                    tasks = list(self.tasks)
+                for task in tasks:
+                    if task is not current and not task.done():
+                        chain = _await_chain(task.get_coro())
+                        if chain:
+                            self.add((("awaiting", "", 0),) + tuple(chain), elapsed_us)
+        self.duration = time.perf_counter() - started
+
+
+class Profiler:
+    """Statistical profiler for the live process, behind DEBUG_TOKEN.
+
+    `profile_process` samples every thread for a few seconds; requests sent
+    with `X-Profile: wall|cpu` are profiled on their own and kept for
+    download. Nothing runs, and no hook is installed, outside a profile.
+    """
+
+    MAX_PROFILES = 20
+
+    def __init__(self):
+        self.token = os.getenv("DEBUG_TOKEN") or None
+        self.default_interval = float(os.getenv("PROFILER_INTERVAL", "0.005"))
+        self.max_seconds = float(os.getenv("PROFILER_MAX_SECONDS", "60"))
+        self._busy = False
+        self._active_requests = 0
+        self._previous_factory = None
+        self.profiles: "OrderedDict[str, Profile]" = OrderedDict()
+        self.process_profiles = 0
+        self.request_profiles = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.token is not None
+
+    def is_authorized(self, token: Optional[str]) -> bool:
+        return self.enabled and token is not None and secrets.compare_digest(token, self.token)
+
+    @property
+    def busy(self) -> bool:
+        return self._busy
+
+    async def profile_process(self, seconds: float, mode: str = "wall", interval: Optional[float] = None) -> Profile:
+        """Sample the stacks of every thread for `seconds`.
+
+        In cpu mode each sample weighs the CPU time its thread used since the
+        previous one, so idle threads and a loop waiting on I/O disappear.
+        """
+        seconds = min(seconds, self.max_seconds)
+        profile = Profile("process", mode, interval or self.default_interval)
+        self._busy = True
+        try:
+            await asyncio.to_thread(self._sample_process, profile, seconds)
+        finally:
+            self._busy = False
+        self.process_profiles += 1
+        return profile
+
+    def _sample_process(self, profile: Profile, seconds: float):
+        own_id = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        clocks: Dict[int, Optional[int]] = {}
+        last_cpu: Dict[int, int] = {}
+        started = last = time.perf_counter()
+        deadline = started + seconds
+        while True:
+            time.sleep(profile.interval)
+            now = time.perf_counter()
+            elapsed_us = int((now - last) * 1e6)
+            last = now
+            frames = sys._current_frames()
+            for thread_id, frame in frames.items():
+                if thread_id == own_id:
+                    continue
+                if thread_id not in names:
+                    names = {thread.ident: thread.name for thread in threading.enumerate()}
+                if profile.mode == "cpu":
+                    if thread_id not in clocks:
+                        clocks[thread_id] = _cpu_clock(thread_id)
+                    clock = clocks[thread_id]
+                    if clock is None:
+                        continue
+                    try:
+                        cpu = time.clock_gettime_ns(clock)
+                    except OSError:
+                        continue
+                    # Premier échantillon d'un thread : référence seulement
+                    weight_us = (cpu - last_cpu[thread_id]) // 1000 if thread_id in last_cpu else 0
+                    last_cpu[thread_id] = cpu
+                else:
+                    weight_us = elapsed_us
+                root = (f"thread {names.get(thread_id, thread_id)}", "", 0)
+                profile.add((root,) + tuple(_walk(frame)), weight_us)
+            del frames, frame
+            if now >= deadline:
+                break
+        profile.duration = time.perf_counter() - started
+
+    def start_request(self, name: str, mode: str) -> RequestProfile:
+        """Profile the current task and the tasks it creates, until `finish_request`.
+
+        Call `detach_request` in the same task once it stops creating work
+        for this request.
+        """
+        loop = asyncio.get_running_loop()
+        profile = RequestProfile(name, mode, self.default_interval, loop)
+        profile.add_task(asyncio.current_task())
+        if self._active_requests == 0:
+            # Fabrique de tâches installée seulement le temps du profil
+            self._previous_factory = loop.get_task_factory()
+            loop.set_task_factory(self._task_factory)
+        self._active_requests += 1
+        profile.context_token = _current_profile.set(profile)
+        profile.start()
+        return profile
+
+    def detach_request(self, profile: RequestProfile):
+        _current_profile.reset(profile.context_token)
+
+    async def finish_request(self, profile: RequestProfile):
+        profile.stop()
+        self._active_requests -= 1
+        if self._active_requests == 0:
+            profile.loop.set_task_factory(self._previous_factory)
+            self._previous_factory = None
+        # Le dernier échantillon peut parcourir beaucoup de tâches : on l'attend hors de la boucle
+        await asyncio.to_thread(profile.join)
+        self.request_profiles += 1
+        self.profiles[profile.profile_id] = profile
+        while len(self.profiles) > self.MAX_PROFILES:
+            self.profiles.popitem(last=False)
+
+    def _task_factory(self, loop, coro, **kwargs):
+        if self._previous_factory is not None:
+            task = self._previous_factory(loop, coro, **kwargs)
+        else:
+            task = asyncio.Task(coro, loop=loop, **kwargs)
+        profile = _current_profile.get()
+        if profile is not None:
+            profile.add_task(task)
+        return task
+
+    def get_profile(self, profile_id: str) -> Optional[Profile]:
+        return self.profiles.get(profile_id)
+
+    def get_stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "busy": self._busy,
+            "active_requests": self._active_requests,
+            "process_profiles": self.process_profiles,
+            "request_profiles": self.request_profiles,
+            "profiles": {profile_id: profile.summary() for profile_id, profile in reversed(self.profiles.items())},
+        }
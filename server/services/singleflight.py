@@ -0,0 +1,92 @@
+import asyncio
+import hashlib
+import json
+import weakref
+from typing import Any, Awaitable, Callable, Dict, List, TypeVar
+
+T = TypeVar('T')
+
+# Toutes les instances vivantes, pour exporter les compteurs
+_registry: "weakref.WeakSet[SingleFlight]" = weakref.WeakSet()
+
+
+class _Call:
+    """An upstream call shared by every caller asking for the same key."""
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Coalesce concurrent identical calls into a single upstream call.
+
+    While a call for a given key is in flight, any other caller asking for the
+    same key awaits that call's result instead of issuing its own request.
+    The upstream call is only cancelled once every caller waiting on it is gone.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[str, _Call] = {}
+        self.upstream_calls = 0  # Appels réellement envoyés
+        self.coalesced = 0  # Appels servis par un appel déjà en cours
+        _registry.add(self)
+
+    @staticmethod
+    def make_key(*parts: Any) -> str:
+        """Build a stable hash from the full set of request parameters."""
+        payload = json.dumps(parts, sort_keys=True, default=str, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        """Run `fn` unless an identical call is already in flight, and return its result."""
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(asyncio.ensure_future(fn()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _task, key=key, call=call: self._forget(key, call))
+            self.upstream_calls += 1
+        else:
+            self.coalesced += 1
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        except asyncio.CancelledError:
+            # Le dernier appelant est parti : inutile de continuer l'appel upstream
+            if call.waiters == 1 and not call.task.done():
+                call.task.cancel()
+            raise
+        finally:
+            call.waiters -= 1
+
+    def _forget(self, key: str, call: _Call):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "in_flight": self.in_flight,
+            "upstream_calls": self.upstream_calls,
+            "coalesced": self.coalesced,
+        }
+
+
+def get_singleflight_stats() -> List[Dict[str, Any]]:
+    """Return the counters of every live SingleFlight, summed by name."""
+    stats: Dict[str, Dict[str, Any]] = {}
+    for flight in list(_registry):
+        current = flight.get_stats()
+        if flight.name not in stats:
+            stats[flight.name] = current
+        else:
+            for field in ("in_flight", "upstream_calls", "coalesced"):
+                stats[flight.name][field] += current[field]
+    return sorted(stats.values(), key=lambda s: s["name"])
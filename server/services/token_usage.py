@@ -0,0 +1,225 @@
+import os
+from collections import OrderedDict
+from contextvars import ContextVar
+from typing import Dict, Optional, Tuple
+
+from services.metrics import current_generator, registry
+from services.tracing import get_current_trace
+
+# Session en cours, pour attribuer la consommation de tokens
+_current_session: ContextVar[Optional[str]] = ContextVar("current_session", default=None)
+
+# Prix publics en USD par million de tokens (entrée, sortie) ; MISTRAL_PRICE_INPUT / MISTRAL_PRICE_OUTPUT les remplacent
+MODEL_PRICES: Dict[str, Tuple[float, float]] = {
+    "mistral-small": (0.2, 0.6),
+    "mistral-small-latest": (0.2, 0.6),
+    "mistral-medium": (2.7, 8.1),
+    "mistral-large-latest": (2.0, 6.0),
+    "open-mistral-nemo": (0.15, 0.15),
+    "ministral-8b-latest": (0.1, 0.1),
+    "ministral-3b-latest": (0.04, 0.04),
+}
+
+LLM_TOKENS = registry.counter(
+    "comic_llm_tokens_total",
+    "LLM tokens consumed, by generator and kind (prompt or completion).",
+    ("generator", "kind")
+)
+LLM_COST = registry.counter(
+    "comic_llm_cost_usd_total",
+    "Estimated LLM cost in USD, by generator.",
+    ("generator",)
+)
+LLM_ESTIMATED_CALLS = registry.counter(
+    "comic_llm_estimated_usage_total",
+    "LLM calls whose token counts were estimated locally (no usage in the response).",
+    ("generator",)
+)
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count when the API doesn't report usage (~4 characters per token)."""
+    return max(1, (len(text) + 3) // 4) if text else 0
+
+
+def estimate_prompt_tokens(messages: list) -> int:
+    # Quelques tokens de structure par message (rôle, délimiteurs)
+    return sum(estimate_tokens(m["content"] if isinstance(m, dict) else m.content) + 4 for m in messages)
+
+
+class _SessionScope:
+    __slots__ = ("session_id", "token")
+
+    def __init__(self, session_id: Optional[str]):
+        self.session_id = session_id
+
+    def __enter__(self):
+        self.token = _current_session.set(self.session_id)
+
+    def __exit__(self, exc_type, exc, tb):
+        _current_session.reset(self.token)
+        return False
+
+
+def session_scope(session_id: Optional[str]) -> _SessionScope:
+    """Attribute the LLM calls made inside the block to `session_id`."""
+    return _SessionScope(session_id)
+
+
+def current_session() -> Optional[str]:
+    return _current_session.get()
+
+
+class _Usage:
+    __slots__ = ("calls", "prompt_tokens", "completion_tokens", "cost")
+
+    def __init__(self):
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cost = 0.0
+
+    def add(self, prompt_tokens: int, completion_tokens: int, cost: float):
+        self.calls += 1
+        self.prompt_tokens += prompt_tokens
+        self.completion_tokens += completion_tokens
+        self.cost += cost
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    def to_dict(self) -> dict:
+        return {
+            "calls": self.calls,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "total_tokens": self.total_tokens,
+            "cost_usd": round(self.cost, 6),
+        }
+
+
+class TokenUsageTracker:
+    """Prompt and completion tokens of every Mistral call, with their estimated cost.
+
+    Each call is attributed to the generator and session in scope and to the
+    API endpoint being served. With SESSION_TOKEN_QUOTA set, a session past
+    its quota is rejected (429) or degraded to shorter prompts and a single
+    panel, per SESSION_QUOTA_MODE.
+    """
+
+    MAX_SESSIONS = 10000
+
+    def __init__(self):
+        self.session_quota = int(os.getenv("SESSION_TOKEN_QUOTA", "0"))
+        self.quota_mode = os.getenv("SESSION_QUOTA_MODE", "degrade").lower()
+        if self.quota_mode not in ("degrade", "reject"):
+            raise ValueError(f"Unknown SESSION_QUOTA_MODE: {self.quota_mode}")
+        price_input = os.getenv("MISTRAL_PRICE_INPUT")
+        price_output = os.getenv("MISTRAL_PRICE_OUTPUT")
+        self._price_override = (float(price_input or 0), float(price_output or 0)) if price_input or price_output else None
+
+        self.total = _Usage()
+        self.by_generator: Dict[str, _Usage] = {}
+        self.by_endpoint: Dict[str, _Usage] = {}
+        self.by_model: Dict[str, _Usage] = {}
+        self._sessions: "OrderedDict[str, _Usage]" = OrderedDict()
+        self.estimated_calls = 0
+        self.rejected = 0
+        self.degraded = 0
+
+    def price(self, model: str) -> Tuple[float, float]:
+        if self._price_override:
+            return self._price_override
+        return MODEL_PRICES.get(model, (0.0, 0.0))
+
+    def record(self, model: str, prompt_tokens: int, completion_tokens: int, estimated: bool = False):
+        generator = current_generator()
+        session_id = _current_session.get()
+        trace = get_current_trace()
+        endpoint = trace.root.attributes.get("http.path", "none") if trace else "none"
+
+        price_input, price_output = self.price(model)
+        cost = (prompt_tokens * price_input + completion_tokens * price_output) / 1_000_000
+
+        self.total.add(prompt_tokens, completion_tokens, cost)
+        for table, key in ((self.by_generator, generator), (self.by_endpoint, endpoint), (self.by_model, model)):
+            usage = table.get(key)
+            if usage is None:
+                usage = table[key] = _Usage()
+            usage.add(prompt_tokens, completion_tokens, cost)
+        if session_id:
+            self._session_usage(session_id).add(prompt_tokens, completion_tokens, cost)
+        if trace is not None:
+            # Total de la requête, visible dans la trace exportée
+            attributes = trace.root.attributes
+            attributes["llm.prompt_tokens"] = attributes.get("llm.prompt_tokens", 0) + prompt_tokens
+            attributes["llm.completion_tokens"] = attributes.get("llm.completion_tokens", 0) + completion_tokens
+
+        LLM_TOKENS.labels(generator, "prompt").inc(prompt_tokens)
+        LLM_TOKENS.labels(generator, "completion").inc(completion_tokens)
+        LLM_COST.labels(generator).inc(cost)
+        if estimated:
+            self.estimated_calls += 1
+            LLM_ESTIMATED_CALLS.labels(generator).inc()
+
+    def _session_usage(self, session_id: str) -> _Usage:
+        usage = self._sessions.pop(session_id, None) or _Usage()
+        self._sessions[session_id] = usage
+        while len(self._sessions) > self.MAX_SESSIONS:
+            self._sessions.popitem(last=False)
+        return usage
+
+    def get_session_usage(self, session_id: str) -> dict:
+        usage = self._sessions.get(session_id) or _Usage()
+        return {
+            **usage.to_dict(),
+            "quota": self.session_quota or None,
+            "over_quota": self.is_over_quota(session_id),
+        }
+
+    def is_over_quota(self, session_id: Optional[str]) -> bool:
+        if not self.session_quota or not session_id:
+            return False
+        usage = self._sessions.get(session_id)
+        return usage is not None and usage.total_tokens >= self.session_quota
+
+    def should_reject(self, session_id: Optional[str]) -> bool:
+        reject = self.quota_mode == "reject" and self.is_over_quota(session_id)
+        if reject:
+            self.rejected += 1
+        return reject
+
+    def should_degrade(self, session_id: Optional[str]) -> bool:
+        degrade = self.quota_mode == "degrade" and self.is_over_quota(session_id)
+        if degrade:
+            self.degraded += 1
+        return degrade
+
+    def get_stats(self) -> dict:
+        top_sessions = sorted(self._sessions.items(), key=lambda item: item[1].total_tokens, reverse=True)[:10]
+        return {
+            "total": self.total.to_dict(),
+            "by_generator": {key: usage.to_dict() for key, usage in self.by_generator.items()},
+            "by_endpoint": {key: usage.to_dict() for key, usage in self.by_endpoint.items()},
+            "by_model": {key: usage.to_dict() for key, usage in self.by_model.items()},
+            "sessions": len(self._sessions),
+            "avg_tokens_per_session": round(self.total.total_tokens / len(self._sessions), 1) if self._sessions else None,
+            "top_sessions": {session_id: usage.to_dict() for session_id, usage in top_sessions},
+            "estimated_calls": self.estimated_calls,
+            "session_quota": self.session_quota or None,
+            "quota_mode": self.quota_mode,
+            "rejected": self.rejected,
+            "degraded": self.degraded,
+        }
+
+
+_tracker: Optional[TokenUsageTracker] = None
+
+
+def get_token_usage() -> TokenUsageTracker:
+    """Tracker shared by the whole process."""
+    global _tracker
+    if _tracker is None:
+        _tracker = TokenUsageTracker()
+    return _tracker
@@ -0,0 +1,251 @@
+import asyncio
+import json
+import os
+import re
+import secrets
+import time
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+from services.http_transport import get_http_transport
+from services.log import get_logger
+
+log = get_logger("tracing")
+
+_current_trace: ContextVar[Optional["Trace"]] = ContextVar("current_trace", default=None)
+_current_span: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+
+# Au-delà, les spans d'une requête ne sont plus enregistrés (boucles de retry, longs streams)
+MAX_SPANS_PER_TRACE = 500
+
+
+class Span:
+    __slots__ = ("name", "span_id", "parent_id", "start", "end", "attributes", "error")
+
+    def __init__(self, name: str, parent_id: Optional[str], attributes: dict):
+        self.name = name
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.start = time.time()
+        self.end: Optional[float] = None
+        self.attributes = attributes
+        self.error: Optional[str] = None
+
+    @property
+    def duration(self) -> float:
+        return (self.end or time.time()) - self.start
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start": self.start,
+            "duration_ms": round(self.duration * 1000, 3),
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+class Trace:
+    """Spans opened while serving one HTTP request.
+
+    Background work started by the request (panel renders, narration)
+    inherits the trace; spans ending after the response are dropped.
+    """
+
+    def __init__(self, name: str):
+        self.trace_id = secrets.token_hex(16)
+        self.root = Span(name, None, {})
+        self.spans: List[Span] = []
+        self.dropped = 0
+        self.finished = False
+
+    def add(self, span: Span):
+        if self.finished:
+            return
+        if len(self.spans) >= MAX_SPANS_PER_TRACE:
+            self.dropped += 1
+            return
+        self.spans.append(span)
+
+    def server_timing(self) -> str:
+        """`Server-Timing` value: total time per span name, with the call count."""
+        totals: Dict[str, List[float]] = {}
+        for span in self.spans:
+            total = totals.setdefault(span.name, [0.0, 0])
+            total[0] += span.duration
+            total[1] += 1
+        entries = [f"total;dur={self.root.duration * 1000:.1f}"]
+        for name, (duration, count) in totals.items():
+            # Les noms de métriques Server-Timing sont des tokens HTTP
+            token = re.sub(r"[^A-Za-z0-9_.-]", "_", name)
+            entries.append(f'{token};dur={duration * 1000:.1f};desc="x{count}"')
+        return ", ".join(entries)
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            **self.root.to_dict(),
+            "dropped_spans": self.dropped,
+            "spans": [span.to_dict() for span in self.spans],
+        }
+
+
+class _SpanScope:
+    __slots__ = ("span", "trace", "token")
+
+    def __init__(self, trace: Trace, name: str, attributes: dict):
+        self.trace = trace
+        parent = _current_span.get()
+        self.span = Span(name, (parent or trace.root).span_id, attributes)
+
+    def __enter__(self) -> Span:
+        self.token = _current_span.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        self.span.end = time.time()
+        if exc_type is not None:
+            self.span.error = exc_type.__name__
+        try:
+            _current_span.reset(self.token)
+        except ValueError:
+            # Fermé depuis un autre contexte (générateur async finalisé ailleurs)
+            pass
+        self.trace.add(self.span)
+        return False
+
+
+class _NoSpan:
+    """Returned outside any request: costs one context variable lookup."""
+    span = None
+
+    def __enter__(self):
+        return None
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+def span(name: str, **attributes):
+    """Record a span in the current request's trace, if any."""
+    trace = _current_trace.get()
+    if trace is None:
+        return _NO_SPAN
+    return _SpanScope(trace, name, attributes)
+
+
+def set_attribute(key: str, value):
+    """Annotate the innermost open span."""
+    current = _current_span.get()
+    if current is not None:
+        current.attributes[key] = value
+
+
+def start_trace(name: str) -> Trace:
+    """Start a trace for the current task and the tasks it spawns."""
+    trace = Trace(name)
+    _current_trace.set(trace)
+    _current_span.set(None)
+    return trace
+
+
+def finish_trace(trace: Trace):
+    trace.root.end = time.time()
+    trace.finished = True
+
+
+def get_current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+class TraceExporter:
+    """Optional trace export, chosen by TRACE_EXPORT.
+
+    - "jsonl": one trace per line appended to TRACE_FILE
+    - "otlp": OTLP/HTTP JSON posted to OTLP_ENDPOINT (a local collector)
+
+    Export runs in the background and never delays the response.
+    """
+
+    def __init__(self, kind: Optional[str] = None):
+        self.kind = (kind or os.getenv("TRACE_EXPORT", "none")).lower()
+        if self.kind not in ("none", "jsonl", "otlp"):
+            raise ValueError(f"Unknown TRACE_EXPORT: {self.kind}")
+        self.path = os.getenv("TRACE_FILE", "traces.jsonl")
+        self.otlp_endpoint = os.getenv("OTLP_ENDPOINT", "http://localhost:4318/v1/traces")
+        self.service_name = os.getenv("OTEL_SERVICE_NAME", "comic-book-generator")
+        self._tasks = set()
+        self.exported = 0
+        self.failed = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.kind != "none"
+
+    def export(self, trace: Trace):
+        if not self.enabled:
+            return
+        task = asyncio.ensure_future(self._export(trace))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _export(self, trace: Trace):
+        try:
+            if self.kind == "jsonl":
+                line = json.dumps(trace.to_dict(), default=str) + "\n"
+                await asyncio.to_thread(self._append, line)
+            else:
+                async with get_http_transport().post(self.otlp_endpoint, json=self._to_otlp(trace)) as response:
+                    if response.status >= 300:
+                        raise RuntimeError(f"collector answered {response.status}")
+            self.exported += 1
+        except Exception as e:
+            self.failed += 1
+            log.warning("Trace export failed", exporter=self.kind, error=str(e))
+
+    def _append(self, line: str):
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(line)
+
+    def _to_otlp(self, trace: Trace) -> dict:
+        def attributes(values: dict) -> list:
+            return [{"key": key, "value": {"stringValue": str(value)}} for key, value in values.items()]
+
+        def otlp_span(span: Span) -> dict:
+            end = span.end or trace.root.end or time.time()
+            result = {
+                "traceId": trace.trace_id,
+                "spanId": span.span_id,
+                "name": span.name,
+                "kind": 2 if span is trace.root else 1,  # SERVER pour la racine, INTERNAL sinon
+                "startTimeUnixNano": str(int(span.start * 1e9)),
+                "endTimeUnixNano": str(int(end * 1e9)),
+                "attributes": attributes(span.attributes),
+                "status": {"code": 2, "message": span.error} if span.error else {},
+            }
+            if span.parent_id:
+                result["parentSpanId"] = span.parent_id
+            return result
+
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": attributes({"service.name": self.service_name})},
+                "scopeSpans": [{
+                    "scope": {"name": "comic-book-generator"},
+                    "spans": [otlp_span(trace.root)] + [otlp_span(span) for span in trace.spans],
+                }],
+            }]
+        }
+
+    def get_stats(self) -> dict:
+        return {
+            "export": self.kind,
+            "exported": self.exported,
+            "failed": self.failed,
+            "pending": len(self._tasks),
+        }